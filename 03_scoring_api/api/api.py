@@ -2,26 +2,48 @@
 # -*- coding: utf-8 -*-
 
 
-import copy
+import cgi
 import datetime
 import hashlib
+import hmac
 import json
 import logging
+import math
+import random
 import re
+import signal
+import threading
+import time
 import uuid
 from abc import ABCMeta, abstractmethod
 from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
 from collections import OrderedDict
 from optparse import OptionParser
+from SocketServer import ThreadingMixIn
+
+try:
+    # pip install ujson
+    import ujson
+except ImportError:
+    ujson = None
 
 import scoring
-from store import RedisConnection, Storage
+from limits import ConcurrencyLimiter, RateLimiter, StorageRateLimiter
+from metrics import MetricsRegistry, RequestTrace, TracedStorage
+from store import (MemoryConnection, PrefetchStorage, RedisConnection, Storage, WriteBehindStorage,
+                   WRITE_BEHIND_QUEUE_SIZE)
 
 
 SALT = "Otus"
 ADMIN_LOGIN = "admin"
 ADMIN_SALT = "42"
 
+MAX_BATCH_SIZE = 1000
+AUTH_CACHE_SIZE = 10000
+MAX_BODY_SIZE = 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 5
+MAX_KEEP_ALIVE_REQUESTS = 100
+
 STORE_CONFIG = {
     'host': 'localhost',
     'port': 6379,
@@ -36,14 +58,20 @@ OK = 200
 BAD_REQUEST = 400
 FORBIDDEN = 403
 NOT_FOUND = 404
+REQUEST_ENTITY_TOO_LARGE = 413
 INVALID_REQUEST = 422
+TOO_MANY_REQUESTS = 429
 INTERNAL_ERROR = 500
+SERVICE_UNAVAILABLE = 503
 ERRORS = {
     BAD_REQUEST: "Bad Request",
     FORBIDDEN: "Forbidden",
     NOT_FOUND: "Not Found",
+    REQUEST_ENTITY_TOO_LARGE: "Request Entity Too Large",
     INVALID_REQUEST: "Invalid Request",
+    TOO_MANY_REQUESTS: "Too Many Requests",
     INTERNAL_ERROR: "Internal Server Error",
+    SERVICE_UNAVAILABLE: "Service Unavailable",
 }
 UNKNOWN = 0
 MALE = 1
@@ -55,6 +83,11 @@ GENDERS = {
 }
 
 
+# precompiled checks of field values (\Z, '$' matches before trailing newline)
+DIGITS_RE = re.compile(r'[0-9]*\Z')
+DATE_RE = re.compile(r'([0-9]{2})\.([0-9]{2})\.([0-9]{4})\Z')
+
+
 class ValidationError(Exception):
     pass
 
@@ -78,6 +111,16 @@ class Field(object):
 
         # does field exist in request?
         self.is_exist = False
+        # current time of request (is set by request)
+        self.now = None
+        # (raw value, parsed value) saved by validation for clean
+        self.parsed = None
+
+    def copy(self):
+        """ Return copy for state of one request (settings are shared) """
+        field = object.__new__(self.__class__)
+        field.__dict__.update(self.__dict__)
+        return field
 
     def is_empty(self, value):
         return value in self.empty_values
@@ -92,11 +135,17 @@ class Field(object):
             raise ValidationError(self.error_messages['nullable'])
 
     def validate(self, value):
+        self.parsed = None
         self.check_required_and_nullable(value)
         if value is not None:
             self.field_validate(value)
         return True
 
+    def get_parsed(self, value):
+        """ Return value parsed by validation or None """
+        if self.parsed is not None and self.parsed[0] is value:
+            return self.parsed[1]
+
     @abstractmethod
     def field_validate(self, value):
         """
@@ -211,19 +260,15 @@ class PhoneField(CharField):
         if self.is_empty(value):
             return
 
-        value_str = unicode(value)
+        value_str = value if isinstance(value, (str, unicode)) else str(value)
         if len(value_str) != self.conditions['length']:
             raise ValidationError(self.error_messages['invalid_length'])
 
-        if not value_str.startswith(unicode(self.conditions['first_char'])):
+        if value_str[0] != str(self.conditions['first_char']):
             raise ValidationError(self.error_messages['invalid_value'])
 
-        if isinstance(value, (str, unicode)):
-            for c in value:
-                try:
-                    int(c)
-                except ValueError as e:
-                    raise ValidationError(self.error_messages['invalid_char'])
+        if value_str is value and not DIGITS_RE.match(value):
+            raise ValidationError(self.error_messages['invalid_char'])
 
 
 class DateField(CharField):
@@ -240,26 +285,35 @@ class DateField(CharField):
         })
 
     def _to_date(self, value):
-        return datetime.datetime.strptime(value, '%d.%m.%Y')
+        """ Parse DD.MM.YYYY, raise ValueError for invalid value """
+        match = DATE_RE.match(value)
+        if match is None:
+            raise ValueError("Value format must be DD.MM.YYYY")
+        day, month, year = match.groups()
+        return datetime.datetime(int(year), int(month), int(day))
 
     def field_validate(self, value):
         super(DateField, self).field_validate(value)
         if self.is_empty(value):
             return
 
-        if not re.match(r'\d{2}\.\d{2}\.\d{4}$', value):
+        match = DATE_RE.match(value)
+        if match is None:
             raise ValidationError(self.error_messages['invalid_format'])
 
+        day, month, year = match.groups()
         try:
-            self._to_date(value)
-        except (TypeError, ValueError):
+            date = datetime.datetime(int(year), int(month), int(day))
+        except ValueError:
             raise ValidationError(self.error_messages['invalid_date'])
+        self.parsed = (value, date)
 
     def clean(self, value):
         """ Convert value to datetime object or None"""
         if self.is_empty(value):
             return
-        return self._to_date(value)
+        date = self.get_parsed(value)
+        return date if date is not None else self._to_date(value)
 
 
 class BirthDayField(DateField):
@@ -284,8 +338,8 @@ class BirthDayField(DateField):
         if self.is_empty(value):
             return
 
-        now = datetime.datetime.now()
-        birth_date = self._to_date(value)
+        now = self.now or datetime.datetime.now()
+        birth_date = self.parsed[1]
         if birth_date > now:
             raise ValidationError(self.error_messages['future_date'])
 
@@ -349,6 +403,37 @@ class ClientIDsField(Field):
         return value
 
 
+class BatchRequestsField(Field):
+    """
+        Batch requests:
+        1. type - list
+        2. length <= MAX_BATCH_SIZE
+        Elements are validated independently by the batch handler.
+    """
+    def __init__(self, *args, **kwarg):
+        super(BatchRequestsField, self).__init__(*args, **kwarg)
+        self.conditions = {
+            'max_length': MAX_BATCH_SIZE,
+        }
+        self.error_messages.update({
+            'invalid_type': "Value type must be an array.",
+            'invalid_length': "Batch must contain at most {} requests.".format(
+                self.conditions['max_length']),
+        })
+
+    def field_validate(self, value):
+        if not isinstance(value, list):
+            raise ValidationError(self.error_messages['invalid_type'])
+
+        if len(value) > self.conditions['max_length']:
+            raise ValidationError(self.error_messages['invalid_length'])
+
+    def clean(self, value):
+        if self.is_empty(value):
+            return []
+        return value
+
+
 ##### Requests #####
 
 class DeclarativeFieldsMetaclass(type):
@@ -391,13 +476,15 @@ class BaseRequest(object):
     """
     __metaclass__ = DeclarativeFieldsMetaclass
 
-    def __init__(self, data=None):
+    def __init__(self, data=None, now=None):
         """
             Request init.
             Copies declarative classes to self.fields_classes
             and deletes them from attributes
 
             :param data: dict
+            :param now: current time (datetime) for validation,
+                        by default it's taken once on validation
         """
         if not hasattr(self, 'error_messages'):
             self.error_messages = {}
@@ -405,8 +492,10 @@ class BaseRequest(object):
             'unexpected': "Field is unexpected",
         })
 
-        self.fields = copy.deepcopy(self.base_fields)
+        # fields keep state of one request, their settings are shared
+        self.fields = OrderedDict((name, field.copy()) for name, field in self.base_fields.iteritems())
 
+        self.now = now
         self.data = {} if data is None else data
         self.cleaned_data = {}
 
@@ -434,6 +523,8 @@ class BaseRequest(object):
         """
         # Init error dict
         self._errors = {}
+        if self.now is None:
+            self.now = datetime.datetime.now()
 
         # Check to unexpected fields
         for field_name in self.data.keys():
@@ -459,6 +550,7 @@ class BaseRequest(object):
         for field_name, field_cls in self.fields.items():
             # Check that field is exist in request.
             field_cls.is_exist = field_name in self.data
+            field_cls.now = self.now
 
             # Validate field value
             field_value = self.data.get(field_name)
@@ -503,6 +595,12 @@ class ClientsInterestsRequest(BaseRequest):
     client_ids = ClientIDsField(required=True)
     date = DateField(required=False, nullable=True)
 
+    def get_store_keys(self, is_admin):
+        """
+            Return (storage keys, cache keys) which will be read by get_answer
+        """
+        return [scoring.get_interests_key(cid) for cid in self.client_ids], []
+
     def get_answer(self, store, context, is_admin):
         """
             Return user's interests for list of ids
@@ -571,6 +669,17 @@ class OnlineScoreRequest(BaseRequest):
         if not_valid:
             self._errors["invalid_pairs"] = self.error_messages["invalid_pairs"]
 
+    def get_store_keys(self, is_admin):
+        """
+            Return (storage keys, cache keys) which will be read by get_answer
+        """
+        if is_admin:
+            return [], []
+        return [], [scoring.get_score_key(phone=self.phone,
+                                          birthday=self.birthday,
+                                          first_name=self.first_name,
+                                          last_name=self.last_name)]
+
     def get_answer(self, store, context, is_admin):
         """
             Return user's score, calculated by given fields
@@ -606,17 +715,216 @@ class MethodRequest(BaseRequest):
         return self.login == ADMIN_LOGIN
 
 
-def check_auth(request):
+class BatchItemRequest(BaseRequest):
+    """
+        Handler for validation args of one request in batch
+    """
+    method = CharField(required=True, nullable=False)
+    arguments = ArgumentsField(required=True, nullable=True)
+
+
+class BatchRequest(BaseRequest):
     """
-        Check user authorization
+        Handler for method batch
     """
+    requests = BatchRequestsField(required=True, nullable=False)
+
+    def __init__(self, *args, **kwargs):
+        if not hasattr(self, 'error_messages'):
+            self.error_messages = {}
+        self.error_messages.update({
+            "invalid_item": "Request in batch must be JSON object.",
+        })
+
+        super(BatchRequest, self).__init__(*args, **kwargs)
+
+    def get_item_handler(self, item):
+        """
+            Validate one request of batch
+            :return: (handler, None) or (None, (errors, code))
+        """
+        if not isinstance(item, dict):
+            return None, (self.error_messages["invalid_item"], INVALID_REQUEST)
+
+        item_request = BatchItemRequest(item, now=self.now)
+        if item_request.errors:
+            return None, (item_request.errors, INVALID_REQUEST)
+
+        if item_request.method not in BATCH_METHOD_HANDLERS:
+            msg = "Method {} isn't specified".format(item_request.method)
+            return None, (msg, NOT_FOUND)
+
+        handler = BATCH_METHOD_HANDLERS[item_request.method](item_request.arguments, now=self.now)
+        if handler.errors:
+            return None, (handler.errors, INVALID_REQUEST)
+        return handler, None
+
+    def get_answer(self, store, context, is_admin):
+        """
+            Return list of answers for every request in batch.
+            Storage reads of all valid requests are coalesced
+            in one round trip.
+        """
+        context["nrequests"] = len(self.requests)
+        context["batch"] = []
+
+        items = []
+        keys, cache_keys = [], []
+        for item in self.requests:
+            item_context = {}
+            context["batch"].append(item_context)
+            handler, error = self.get_item_handler(item)
+            if handler is not None:
+                handler_keys, handler_cache_keys = handler.get_store_keys(is_admin)
+                keys.extend(handler_keys)
+                cache_keys.extend(handler_cache_keys)
+            items.append((handler, error, item_context))
+
+        batch_store = PrefetchStorage(store)
+        batch_store.prefetch(keys, cache_keys)
+
+        result = []
+        for handler, error, item_context in items:
+            if error is not None:
+                response, code = error
+            else:
+                try:
+                    response, code = handler.get_answer(batch_store, item_context, is_admin), OK
+                except Exception as e:
+                    logging.exception("Unexpected error: %s" % e)
+                    response, code = None, INTERNAL_ERROR
+            item_context["code"] = code
+            result.append(build_answer(response, code))
+        return result
+
+
+BATCH_METHOD_HANDLERS = {
+    "online_score": OnlineScoreRequest,
+    "clients_interests": ClientsInterestsRequest,
+}
+
+METHOD_HANDLERS = dict(BATCH_METHOD_HANDLERS, batch=BatchRequest)
+
+
+def build_answer(response, code):
+    """
+        Build answer body for response and code
+    """
+    if code not in ERRORS:
+        return {"response": response, "code": code}
+    return {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
+
+
+class AuthCache(object):
+    """
+        Bounded LRU cache of verified (account, login, token) tuples.
+        Entry may have expiration time (admin tokens are valid
+        only till the end of current hour).
+    """
+    def __init__(self, max_size=AUTH_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, now):
+        """
+            Return True if key was verified and its entry isn't expired
+        """
+        with self.lock:
+            expires = self.entries.pop(key, False)
+            if expires is False:
+                return False
+            if expires is not None and expires <= now:
+                return False
+            # move entry to the end (most recently used)
+            self.entries[key] = expires
+            return True
+
+    def add(self, key, expires=None):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = expires
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+auth_cache = AuthCache()
+
+
+def get_next_hour_timestamp(now):
+    hour = datetime.datetime.fromtimestamp(now).replace(minute=0, second=0, microsecond=0)
+    return time.mktime((hour + datetime.timedelta(hours=1)).timetuple())
+
+
+def check_auth(request, cache=auth_cache):
+    """
+        Check user authorization.
+        Verified tokens are saved in cache (if it's given),
+        so digest is calculated only on cache miss.
+    """
+    key = (request.account, request.login, request.token)
+    now = time.time()
+    if cache is not None and cache.get(key, now):
+        return True
+
     if request.is_admin:
-        digest = hashlib.sha512(datetime.datetime.now().strftime("%Y%m%d%H") + ADMIN_SALT).hexdigest()
+        hour = datetime.datetime.fromtimestamp(now).strftime("%Y%m%d%H")
+        digest = hashlib.sha512(hour + ADMIN_SALT).hexdigest()
+        expires = get_next_hour_timestamp(now)
     else:
         digest = hashlib.sha512(request.account + request.login + SALT).hexdigest()
-    if digest == request.token:
-        return True
-    return False
+        expires = None
+
+    token = request.token
+    if isinstance(token, unicode):
+        token = token.encode('utf8')
+    if not hmac.compare_digest(digest, token):
+        return False
+
+    if cache is not None:
+        cache.add(key, expires)
+    return True
+
+
+# limiter of requests per client (limits.RateLimiter or limits.StorageRateLimiter)
+rate_limiter = None
+
+
+def create_rate_limiter(store, rate, burst=None, shared=False):
+    """
+        Shared limiter counts requests in storage. Counters are incremented
+        by storage itself (WriteBehindStorage queues cache writes only).
+    """
+    if not shared:
+        return RateLimiter(rate, burst)
+    if isinstance(store, WriteBehindStorage):
+        store = store.storage
+    return StorageRateLimiter(store, rate, burst)
+
+
+def handle_sigterm(signum, frame):
+    """ Stop server by SIGTERM as by Ctrl+C, so queued cache writes are sent """
+    raise KeyboardInterrupt
+
+
+def get_client_key(request):
+    return u"%s:%s" % (request.account or u"", request.login or u"")
+
+
+def get_request_cost(request):
+    """ Tokens of rate limit: every request of batch is charged """
+    if request.method == "batch" and isinstance(request.arguments, dict):
+        requests = request.arguments.get("requests")
+        if isinstance(requests, list):
+            return max(len(requests), 1)
+    return 1
 
 
 def method_handler(request, context, store):
@@ -628,33 +936,119 @@ def method_handler(request, context, store):
         :param context: dict
         :param store: object
         :return: Answer (errors_dict if error), Code
-    """
 
-    handlers = {
-        "online_score": OnlineScoreRequest,
-        "clients_interests": ClientsInterestsRequest,
-    }
+        Timings of phases are saved in context["timings"].
+    """
+    trace = RequestTrace(context.setdefault("timings", {}))
 
     # 1. Validate MethodRequest args
-    method_request = MethodRequest(request["body"])
-    if method_request.errors:
-        return method_request.errors, INVALID_REQUEST
+    with trace.phase("validation"):
+        method_request = MethodRequest(request["body"])
+        errors = method_request.errors
+    if errors:
+        return errors, INVALID_REQUEST
 
     # 2. Check user authorization
-    if not check_auth(method_request):
+    with trace.phase("auth"):
+        is_authorized = check_auth(method_request)
+    if not is_authorized:
         return ERRORS[FORBIDDEN], FORBIDDEN
 
-    # 3. Check if method exists
-    if method_request.method not in handlers:
-        msg = "Method {} isn't specified".format(methodrequest.method)
+    # 3. Check rate limit of client (seconds to retry are saved in context)
+    if rate_limiter is not None:
+        with trace.phase("rate_limit"):
+            retry_after = rate_limiter.acquire(get_client_key(method_request),
+                                               count=get_request_cost(method_request))
+        if retry_after:
+            context["retry_after"] = retry_after
+            return ERRORS[TOO_MANY_REQUESTS], TOO_MANY_REQUESTS
+
+    # 4. Check if method exists
+    if method_request.method not in METHOD_HANDLERS:
+        msg = "Method {} isn't specified".format(method_request.method)
         return msg, NOT_FOUND
 
-    # 4. Validate handler args
-    handler = handlers[method_request.method](method_request.arguments)
-    if handler.errors:
-        return handler.errors, INVALID_REQUEST
+    # 5. Validate handler args
+    with trace.phase("validation"):
+        handler = METHOD_HANDLERS[method_request.method](method_request.arguments)
+        errors = handler.errors
+    if errors:
+        return errors, INVALID_REQUEST
+
+    # 6. Get answer (time of storage calls is saved separately)
+    traced_store = TracedStorage(store, trace)
+    store_time = trace.timings.get("store", 0.0)
+    start = time.time()
+    try:
+        return handler.get_answer(traced_store, context, method_request.is_admin), OK
+    finally:
+        trace.add("scoring", time.time() - start - (trace.timings.get("store", 0.0) - store_time))
+
+
+##### Metrics #####
+
+class APIMetrics(object):
+    """
+        Metrics of requests to scoring API by method and response code
+    """
+    def __init__(self, registry=None):
+        self.registry = MetricsRegistry() if registry is None else registry
+        self.requests = self.registry.counter(
+            "scoring_api_requests_total", "Count of requests.", labels=("method", "code"))
+        self.duration = self.registry.histogram(
+            "scoring_api_request_duration_seconds", "Time of handling requests.", labels=("method",))
+        self.phases = self.registry.histogram(
+            "scoring_api_phase_duration_seconds", "Time of request handling phases.",
+            labels=("method", "phase"))
+
+    def observe(self, method, code, duration, timings):
+        self.requests.inc((method, str(code)))
+        self.duration.observe(duration, (method,))
+        for phase, seconds in timings.items():
+            self.phases.observe(seconds, (method, phase))
 
-    return handler.get_answer(store, context, method_request.is_admin), OK
+    def render(self):
+        return self.registry.render()
+
+
+##### Serialization #####
+
+class JSONSerializer(object):
+    """
+        Serializer of request and response bodies.
+        Uses ujson if it's installed and allowed, otherwise standard json.
+        Keys of response are sorted only if sort_keys is set.
+    """
+    def __init__(self, use_ujson=True, sort_keys=False):
+        self.use_ujson = use_ujson and ujson is not None
+        self.sort_keys = sort_keys
+
+    @property
+    def name(self):
+        return "ujson" if self.use_ujson else "json"
+
+    def loads(self, data):
+        """ Decode JSON (strings are in Unicode) """
+        if self.use_ujson:
+            return ujson.loads(data)
+        return json.loads(data)
+
+    def dumps(self, obj):
+        """ Encode obj to JSON in utf8 (correct unicode is saved in response) """
+        if self.use_ujson:
+            return ujson.dumps(obj, ensure_ascii=False, sort_keys=self.sort_keys)
+        data = json.dumps(obj, ensure_ascii=False, sort_keys=self.sort_keys)
+        if isinstance(data, unicode):
+            return data.encode('utf8')
+        return data
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+        Serves every connection in separate thread,
+        so idle persistent connections don't block other clients
+    """
+    daemon_threads = True
 
 
 class MainHTTPHandler(BaseHTTPRequestHandler):
@@ -662,46 +1056,143 @@ class MainHTTPHandler(BaseHTTPRequestHandler):
         "method": method_handler
     }
     store = Storage(RedisConnection, STORE_CONFIG)
+    metrics = APIMetrics()
+    serializer = JSONSerializer()
+    max_body_size = MAX_BODY_SIZE
+    # limit of concurrently handled requests (limits.ConcurrencyLimiter)
+    concurrency_limiter = None
+    # share of requests which bodies are logged (all of them with DEBUG level)
+    log_body_rate = 0.0
+
+    # persistent connections (pipelined requests are read one by one from buffered rfile)
+    protocol_version = "HTTP/1.1"
+    # idle timeout of connection in seconds
+    timeout = KEEP_ALIVE_TIMEOUT
+    max_keep_alive_requests = MAX_KEEP_ALIVE_REQUESTS
+    requests_count = 0
+    # response is buffered and sent with one flush after request
+    wbufsize = -1
+    disable_nagle_algorithm = True
 
     def get_request_id(self, headers):
         return headers.get('HTTP_X_REQUEST_ID', uuid.uuid4().hex)
 
-    def do_POST(self):
-        response, code = {}, OK
-        context = {"request_id": self.get_request_id(self.headers)}
-        request = None
+    def get_content_length(self):
+        """ Return length of request body or None if header is invalid """
         try:
-            data_string = self.rfile.read(int(self.headers['Content-Length']))
-            print data_string
-            request = json.loads(data_string)  # in Unicode
-        except:
-            code = BAD_REQUEST
+            length = int(self.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            return
+        return length if length >= 0 else None
 
-        if request:
-            path = self.path.strip("/")
-            logging.info("%s: %s %s" % (self.path, data_string, context["request_id"]))
-            if path in self.router:
-                try:
-                    response, code = self.router[path]({"body": request, "headers": self.headers}, context, self.store)
-                except Exception, e:
-                    logging.exception("Unexpected error: %s" % e)
-                    code = INTERNAL_ERROR
-            else:
-                code = NOT_FOUND
+    def is_body_logged(self):
+        return (logging.getLogger().isEnabledFor(logging.DEBUG) or
+                (self.log_body_rate and random.random() < self.log_body_rate))
 
+    def get_method_label(self, request):
+        """ Name of method for metrics (unknown methods aren't distinguished) """
+        method = request.get("method") if isinstance(request, dict) else None
+        if isinstance(method, basestring) and method in METHOD_HANDLERS:
+            return method
+        return "unknown"
+
+    def send_answer(self, code, data, content_type, close=False, headers=None):
+        """
+            Send response with Content-Length. Connection is closed if it's asked
+            (e.g. body of request isn't read), client doesn't keep it alive
+            or limit of requests per connection is reached.
+        """
+        self.requests_count += 1
         self.send_response(code)
-        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if close or self.close_connection or self.requests_count >= self.max_keep_alive_requests:
+            self.send_header("Connection", "close")
+        elif self.request_version == "HTTP/1.0":
+            self.send_header("Connection", "keep-alive")
         self.end_headers()
-        if code not in ERRORS:
-            r = {"response": response, "code": code}
+        self.wfile.write(data)
+
+    def send_error(self, code, message=None):
+        """ Error page of BaseHTTPRequestHandler with Content-Length, connection is closed """
+        short, explain = self.responses.get(code, ("???", "???"))
+        message = message or short
+        self.log_error("code %d, message %s", code, message)
+        content = self.error_message_format % {"code": code, "message": cgi.escape(message), "explain": explain}
+        self.send_response(code, message)
+        self.send_header("Content-Type", self.error_content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path.strip("/") != "metrics":
+            self.send_answer(NOT_FOUND, self.serializer.dumps(build_answer({}, NOT_FOUND)), "application/json")
+            return
+        self.send_answer(OK, self.metrics.render(), self.metrics.registry.content_type)
+
+    def do_POST(self):
+        start = time.time()
+        response, code = {}, OK
+        context = {"request_id": self.get_request_id(self.headers)}
+        trace = RequestTrace(context.setdefault("timings", {}))
+        request = None
+        # overloaded server rejects requests without reading them
+        limiter = self.concurrency_limiter
+        retry_after = limiter.acquire() if limiter is not None else 0
+        length = self.get_content_length()
+        request_unread = bool(retry_after) or length is None or length > self.max_body_size
+        if retry_after:
+            code = SERVICE_UNAVAILABLE
+        elif length is None:
+            code = BAD_REQUEST
+        elif length > self.max_body_size:
+            # don't read body
+            code = REQUEST_ENTITY_TOO_LARGE
         else:
-            r = {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
+            try:
+                with trace.phase("read"):
+                    data_string = self.rfile.read(length)
+                with trace.phase("decode"):
+                    request = self.serializer.loads(data_string)  # in Unicode
+            except Exception:
+                code = BAD_REQUEST
+
+        try:
+            if request:
+                path = self.path.strip("/")
+                if self.is_body_logged():
+                    logging.info("%s: %s %s" % (self.path, data_string, context["request_id"]))
+                if path in self.router:
+                    try:
+                        response, code = self.router[path]({"body": request, "headers": self.headers},
+                                                           context, self.store)
+                    except Exception, e:
+                        logging.exception("Unexpected error: %s" % e)
+                        code = INTERNAL_ERROR
+                else:
+                    code = NOT_FOUND
+        finally:
+            if limiter is not None and not retry_after:
+                limiter.release()
+
+        retry_after = retry_after or context.get("retry_after")
+        headers = {"Retry-After": str(int(math.ceil(retry_after)))} if retry_after else None
+        r = build_answer(response, code)
         context.update(r)
-        logging.info(context)
+        with trace.phase("encode"):
+            response_data = self.serializer.dumps(r)
+
+        with trace.phase("write"):
+            # body of request isn't read, so connection can't be reused
+            self.send_answer(code, response_data, "application/json", close=request_unread, headers=headers)
 
-        # save correct unicode in response
-        response_data = json.dumps(r, sort_keys=True, ensure_ascii=False).encode('utf8')
-        self.wfile.write(response_data)
+        self.metrics.observe(self.get_method_label(request), code, time.time() - start, trace.timings)
+        logging.info(context)
         return
 
 
@@ -709,13 +1200,52 @@ if __name__ == "__main__":
     op = OptionParser()
     op.add_option("-p", "--port", action="store", type=int, default=8080)
     op.add_option("-l", "--log", action="store", default=None)
+    op.add_option("--store-host", action="store", default=STORE_CONFIG['host'])
+    op.add_option("--store-port", action="store", type=int, default=STORE_CONFIG['port'])
+    op.add_option("--memory-store", action="store_true", default=False)
+    op.add_option("--store-latency", action="store", type=float, default=0)
+    op.add_option("--store-failure-rate", action="store", type=float, default=0.0)
+    op.add_option("--debug", action="store_true", default=False)
+    op.add_option("--log-body-rate", action="store", type=float, default=MainHTTPHandler.log_body_rate)
+    op.add_option("--max-body-size", action="store", type=int, default=MAX_BODY_SIZE)
+    op.add_option("--sort-keys", action="store_true", default=False)
+    op.add_option("--std-json", action="store_true", default=False)
+    op.add_option("--keep-alive-timeout", action="store", type=float, default=KEEP_ALIVE_TIMEOUT)
+    op.add_option("--max-keep-alive-requests", action="store", type=int, default=MAX_KEEP_ALIVE_REQUESTS)
+    op.add_option("--write-behind-size", action="store", type=int, default=WRITE_BEHIND_QUEUE_SIZE)
+    op.add_option("--rate-limit", action="store", type=float, default=0)
+    op.add_option("--rate-burst", action="store", type=int, default=None)
+    op.add_option("--shared-rate-limit", action="store_true", default=False)
+    op.add_option("--max-concurrency", action="store", type=int, default=0)
     (opts, args) = op.parse_args()
-    logging.basicConfig(filename=opts.log, level=logging.INFO,
+    logging.basicConfig(filename=opts.log, level=logging.DEBUG if opts.debug else logging.INFO,
                         format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
-    server = HTTPServer(("localhost", opts.port), MainHTTPHandler)
+    if opts.memory_store:
+        MainHTTPHandler.store = Storage(MemoryConnection, dict(STORE_CONFIG,
+                                                               latency=opts.store_latency,
+                                                               failure_rate=opts.store_failure_rate))
+    else:
+        MainHTTPHandler.store = Storage(RedisConnection, dict(STORE_CONFIG, host=opts.store_host, port=opts.store_port))
+    if opts.write_behind_size > 0:
+        MainHTTPHandler.store = WriteBehindStorage(MainHTTPHandler.store, max_size=opts.write_behind_size)
+    MainHTTPHandler.serializer = JSONSerializer(use_ujson=not opts.std_json, sort_keys=opts.sort_keys)
+    MainHTTPHandler.max_body_size = opts.max_body_size
+    MainHTTPHandler.log_body_rate = opts.log_body_rate
+    MainHTTPHandler.timeout = opts.keep_alive_timeout
+    MainHTTPHandler.max_keep_alive_requests = opts.max_keep_alive_requests
+    if opts.max_concurrency > 0:
+        MainHTTPHandler.concurrency_limiter = ConcurrencyLimiter(opts.max_concurrency)
+    if opts.rate_limit > 0:
+        rate_limiter = create_rate_limiter(MainHTTPHandler.store, opts.rate_limit, opts.rate_burst,
+                                           shared=opts.shared_rate_limit)
+    server = ThreadingHTTPServer(("localhost", opts.port), MainHTTPHandler)
     logging.info("Starting server at %s" % opts.port)
+    signal.signal(signal.SIGTERM, handle_sigterm)
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         pass
     server.server_close()
+    if isinstance(MainHTTPHandler.store, WriteBehindStorage):
+        # send queued cache writes
+        MainHTTPHandler.store.close()
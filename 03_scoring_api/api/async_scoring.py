@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Coroutine versions of scoring functions for async_store.AsyncStorage.
+    Requires Python 3.6+.
+"""
+
+import asyncio
+import time
+
+from interests import DICTIONARY_KEY, decode_interests
+from scoring import (calculate_score, decode_cached_score, encode_cached_score, get_interests_key,
+                     get_score_cache_time, get_score_key, interests_dictionary, should_refresh)
+
+
+class AsyncSingleFlight(object):
+    """
+        Coalesces concurrent calls with the same key:
+        only the first caller runs coroutine, others await its result.
+    """
+    def __init__(self):
+        self.futures = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        future = self.futures.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func(*args, **kwargs))
+            self.futures[key] = future
+            future.add_done_callback(lambda f: self.futures.pop(key, None))
+        return await asyncio.shield(future)
+
+
+score_flight = AsyncSingleFlight()
+
+
+async def calculate_and_cache_score(store, key, start, **kwargs):
+    score = calculate_score(**kwargs)
+    now = time.time()
+    cache_time = get_score_cache_time(score)
+    await store.cache_set(key, encode_cached_score(score, now - start, now + cache_time), cache_time)
+    return score
+
+
+async def get_score(store, phone=None, email=None, birthday=None, gender=None, first_name=None, last_name=None):
+    key = get_score_key(phone=phone, birthday=birthday,
+                        first_name=first_name, last_name=last_name)
+    # try get from cache,
+    # fallback to heavy calculation in case of cache miss
+    # or early refresh of cached score
+    start = time.time()
+    cached = await store.cache_get(key)
+    if cached is not None:
+        try:
+            score, delta, expires = decode_cached_score(cached)
+        except ValueError:
+            pass
+        else:
+            if not should_refresh(delta, expires):
+                return score
+
+    # concurrent calculations of the same score are coalesced
+    return await score_flight.do(key, calculate_and_cache_score, store, key, start,
+                                 phone=phone, email=email, birthday=birthday, gender=gender,
+                                 first_name=first_name, last_name=last_name)
+
+
+async def get_interests(store, cid, dictionary=interests_dictionary):
+    r = await store.get(get_interests_key(cid))
+    interests = decode_interests(r, dictionary)
+    if interests is None:
+        dictionary.update(await store.get(DICTIONARY_KEY))
+        interests = decode_interests(r, dictionary)
+        if interests is None:
+            raise ValueError("Unknown id of interest in value of client {}".format(cid))
+    return interests
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Non-blocking storage for running scoring handlers in asyncio service.
+    Requires Python 3.6+.
+
+    AsyncStorage has the same surface as store.Storage, but all methods
+    are coroutines. AsyncRedisConnection talks to Redis with RESP protocol
+    over asyncio streams and keeps a pool of connections.
+"""
+
+import asyncio
+import logging
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnectionError(RedisError):
+    pass
+
+
+class RedisTimeoutError(RedisError):
+    pass
+
+
+class RedisResponseError(RedisError):
+    pass
+
+
+##### RESP #####
+
+def encode_command(*args) -> bytes:
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            value = arg
+        elif isinstance(arg, str):
+            value = arg.encode('utf8')
+        else:
+            value = str(arg).encode('utf8')
+        parts.append(b'$%d\r\n%s\r\n' % (len(value), value))
+    return b''.join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise RedisConnectionError("Connection closed by server.")
+
+    prefix, payload = line[:1], line[1:-2]
+    if prefix == b'+':
+        return payload.decode('utf8')
+    if prefix == b'-':
+        raise RedisResponseError(payload.decode('utf8'))
+    if prefix == b':':
+        return int(payload)
+    if prefix == b'$':
+        length = int(payload)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if prefix == b'*':
+        length = int(payload)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RedisResponseError("Protocol error: unknown reply type {!r}".format(prefix))
+
+
+##### Connection pool #####
+
+class Connection(object):
+    """
+        One connection to Redis server
+    """
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def execute(self, *args):
+        self.writer.write(encode_command(*args))
+        await self.writer.drain()
+        return await read_reply(self.reader)
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (AttributeError, OSError):
+            # wait_closed is available since Python 3.7
+            pass
+
+
+class ConnectionPool(object):
+    """
+        Pool of connections with limited size.
+        Connection is taken for one command, so commands
+        of concurrent tasks don't interleave in one stream.
+    """
+    def __init__(self, host='localhost', port=6379, db=0, password=None,
+                 timeout=3, max_connections=10):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.max_connections = max_connections
+
+        self._idle = []
+        self._opened = 0
+        self._semaphore = asyncio.Semaphore(max_connections)
+
+    async def _connect(self) -> Connection:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+        except asyncio.TimeoutError:
+            raise RedisTimeoutError("Timeout connecting to {}:{}.".format(self.host, self.port))
+        except OSError as e:
+            raise RedisConnectionError("Error connecting to {}:{}. {}".format(self.host, self.port, e))
+
+        conn = Connection(reader, writer)
+        try:
+            if self.password is not None:
+                await asyncio.wait_for(conn.execute('AUTH', self.password), self.timeout)
+            if self.db:
+                await asyncio.wait_for(conn.execute('SELECT', self.db), self.timeout)
+        except asyncio.TimeoutError:
+            conn.writer.close()
+            raise RedisTimeoutError("Timeout of handshake with {}:{}.".format(self.host, self.port))
+        except (OSError, asyncio.IncompleteReadError) as e:
+            conn.writer.close()
+            raise RedisConnectionError("Error of handshake with {}:{}. {}".format(self.host, self.port, e))
+        except BaseException:
+            conn.writer.close()
+            raise
+        self._opened += 1
+        return conn
+
+    async def acquire(self) -> Connection:
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise RedisTimeoutError("Timeout waiting for free connection in pool.")
+        try:
+            if self._idle:
+                return self._idle.pop()
+            return await self._connect()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    def release(self, conn: Connection, discard=False):
+        if discard:
+            conn.writer.close()
+            self._opened -= 1
+        else:
+            self._idle.append(conn)
+        self._semaphore.release()
+
+    async def execute(self, *args):
+        conn = await self.acquire()
+        discard = True
+        try:
+            result = await asyncio.wait_for(conn.execute(*args), self.timeout)
+            discard = False
+            return result
+        except RedisResponseError:
+            # connection is still usable after error reply
+            discard = False
+            raise
+        except asyncio.TimeoutError:
+            raise RedisTimeoutError("Timeout reading from {}:{}.".format(self.host, self.port))
+        except (OSError, asyncio.IncompleteReadError) as e:
+            raise RedisConnectionError("Error while reading from {}:{}. {}".format(self.host, self.port, e))
+        finally:
+            self.release(conn, discard=discard)
+
+    @property
+    def size(self):
+        """ Count of opened connections """
+        return self._opened
+
+    async def close(self):
+        while self._idle:
+            await self._idle.pop().close()
+            self._opened -= 1
+
+
+##### Storage #####
+
+class AsyncRedisConnection(object):
+    def __init__(self, host='localhost', port=6379, db=0, password=None,
+                 timeout=3, retry=3, backoff_factor=0.3, max_connections=10):
+        self.retry = retry
+        self.backoff_factor = backoff_factor
+        self.pool = ConnectionPool(host=host,
+                                   port=port,
+                                   db=db,
+                                   password=password,
+                                   timeout=timeout,
+                                   max_connections=max_connections)
+
+    async def _retry(self, *args):
+        attempt = 1
+        while True:
+            try:
+                return await self.pool.execute(*args)
+            except (RedisConnectionError, RedisTimeoutError):
+                if attempt > self.retry:
+                    logging.error("Redis storage isn't available!")
+                    raise
+                logging.info("Connection problem to Redis storage. "
+                             "Reconnect attempt {} of {}".format(attempt, self.retry))
+                attempt += 1
+
+                # Use Delay
+                delay = self.backoff_factor * (2**attempt)
+                await asyncio.sleep(delay)
+
+    async def get(self, key):
+        return await self._retry('GET', key)
+
+    async def set(self, key, value, expires=None):
+        if expires is None:
+            return await self._retry('SET', key, value) == 'OK'
+        return await self._retry('SET', key, value, 'EX', expires) == 'OK'
+
+    async def mget(self, keys):
+        return await self._retry('MGET', *keys)
+
+    async def close(self):
+        await self.pool.close()
+
+
+class AsyncStorage(object):
+    def __init__(self, store, config):
+        self.db = store(**config)
+
+    async def get(self, key):
+        return await self.db.get(key)
+
+    async def set(self, key, value):
+        return await self.db.set(key, value)
+
+    async def get_many(self, keys):
+        """ Return values of keys in one round trip (None for missing keys) """
+        if not keys:
+            return []
+        return await self.db.mget(keys)
+
+    async def cache_get(self, key):
+        try:
+            return await self.db.get(key)
+        except (RedisConnectionError, RedisTimeoutError):
+            logging.error("Cache storage isn't available!")
+            return
+
+    async def cache_get_many(self, keys):
+        try:
+            return await self.get_many(keys)
+        except (RedisConnectionError, RedisTimeoutError):
+            logging.error("Cache storage isn't available!")
+            return [None] * len(keys)
+
+    async def cache_set(self, key, value, expires=None):
+        try:
+            return await self.db.set(key, value, expires)
+        except (RedisConnectionError, RedisTimeoutError):
+            logging.error("Cache storage isn't available!")
+            logging.info("Cannot save to cache database.")
+
+    async def close(self):
+        await self.db.close()
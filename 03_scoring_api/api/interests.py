@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    Compact encoding of clients' interests (values of 'i:<cid>' keys).
+
+    Interest names are mapped to small integer ids by a dictionary
+    which is kept in storage (JSON list of names, id is index in list).
+    Value of client is a marker byte followed by ids packed as unsigned
+    16-bit little-endian integers, e.g. 7 bytes instead of 30 for three
+    interests. Values in JSON are still read, so keys can be migrated
+    while service is running.
+
+    Dictionary is append-only and has to be written by one process
+    at a time (e.g. by migration tool), readers reload it when they
+    meet unknown id.
+
+    Migration of existing keys:
+        python interests.py --host localhost --port 6379 [--batch-size 1000] [--dry-run]
+
+    Works with Python 2.7 and Python 3.
+"""
+
+import array
+import json
+import logging
+import sys
+import threading
+from optparse import OptionParser
+
+
+DICTIONARY_KEY = "interests:dictionary"
+INTERESTS_KEY_PATTERN = "i:*"
+# attempts of migration of key changed by clients
+MIGRATE_RETRIES = 5
+COMPACT_MARKER = b"\x01"
+# unsigned short: up to 65536 different interests
+ID_TYPECODE = "H"
+MAX_ID = 2 ** 16 - 1
+SWAP_BYTES = sys.byteorder != "little"
+
+
+def is_compact(value):
+    return value[:1] == COMPACT_MARKER
+
+
+# array methods were renamed in Python 3
+array_tobytes = getattr(array.array, "tobytes", None) or array.array.tostring
+array_frombytes = getattr(array.array, "frombytes", None) or array.array.fromstring
+
+
+def pack_ids(ids):
+    packed = array.array(ID_TYPECODE, ids)
+    if SWAP_BYTES:
+        packed.byteswap()
+    return COMPACT_MARKER + array_tobytes(packed)
+
+
+def unpack_ids(value):
+    ids = array.array(ID_TYPECODE)
+    array_frombytes(ids, value[1:])
+    if SWAP_BYTES:
+        ids.byteswap()
+    return ids
+
+
+class InterestsDictionary(object):
+    """
+        Two-way mapping of interest names and ids
+    """
+    def __init__(self, names=()):
+        self.lock = threading.Lock()
+        self.names = []
+        self.ids = {}
+        self.add(names)
+
+    def add(self, names):
+        """
+            Add unknown names to dictionary.
+            :return: True if dictionary is changed
+        """
+        changed = False
+        with self.lock:
+            for name in names:
+                if name not in self.ids:
+                    if len(self.names) > MAX_ID:
+                        raise ValueError("Dictionary of interests is full")
+                    self.ids[name] = len(self.names)
+                    self.names.append(name)
+                    changed = True
+        return changed
+
+    def update(self, value):
+        """ Add names from stored value of dictionary """
+        if value:
+            if isinstance(value, bytes):
+                value = value.decode("utf8")
+            self.add(json.loads(value))
+
+    def load(self, store):
+        self.update(store.get(DICTIONARY_KEY))
+
+    def save(self, store):
+        with self.lock:
+            value = json.dumps(self.names)
+        return store.set(DICTIONARY_KEY, value)
+
+    def encode(self, interests):
+        """ Encode list of names (they have to be in dictionary) """
+        ids = self.ids
+        return pack_ids([ids[name] for name in interests])
+
+    def decode(self, value):
+        """
+            Decode compact value to list of names.
+            :return: None if value has id which isn't in dictionary
+        """
+        names = self.names
+        try:
+            return [names[i] for i in unpack_ids(value)]
+        except IndexError:
+            return
+
+
+def decode_interests(value, dictionary):
+    """
+        Decode stored value of client (compact or JSON) to list of names.
+        :return: None if dictionary has to be reloaded
+    """
+    if not value:
+        return []
+    if is_compact(value):
+        return dictionary.decode(value)
+    return json.loads(value)
+
+
+##### Migration #####
+
+def migrate(client, dictionary, batch_size=1000, dry_run=False):
+    """
+        Rewrite JSON values of interests to compact encoding.
+        :param client: redis.Redis client
+        :return: [count of keys, count of migrated keys, bytes before, bytes after]
+    """
+    dictionary.load(client)
+    totals = [0, 0, 0, 0]
+    keys = []
+    for key in client.scan_iter(match=INTERESTS_KEY_PATTERN, count=batch_size):
+        keys.append(key)
+        if len(keys) >= batch_size:
+            totals = [a + b for a, b in zip(totals, migrate_batch(client, dictionary, keys, dry_run))]
+            keys = []
+    if keys:
+        totals = [a + b for a, b in zip(totals, migrate_batch(client, dictionary, keys, dry_run))]
+    return totals
+
+
+def migrate_batch(client, dictionary, keys, dry_run=False, retries=MIGRATE_RETRIES):
+    """
+        Keys of batch which are changed by clients during migration
+        are migrated one by one (with retries), so updates aren't lost.
+    """
+    result = migrate_keys(client, dictionary, keys, dry_run)
+    if result is not None:
+        return result
+    result = [len(keys), 0, 0, 0]
+    for key in keys:
+        for _ in range(retries):
+            key_result = migrate_keys(client, dictionary, [key], dry_run)
+            if key_result is not None:
+                result = [a + b for a, b in zip(result, [0] + list(key_result[1:]))]
+                break
+        else:
+            logging.warning("Key %s isn't migrated, it's changed too often" % key)
+    return result
+
+
+def migrate_keys(client, dictionary, keys, dry_run=False):
+    """
+        Values are read and written in transaction with WATCH of keys.
+        Dictionary is saved before values, so readers always know ids.
+        :return: None if key is changed after reading
+    """
+    from redis.exceptions import WatchError
+
+    values = {}
+    size_before = size_after = 0
+    with client.pipeline() as pipe:
+        pipe.watch(*keys)
+        for key, value in zip(keys, pipe.mget(keys)):
+            if value is None or is_compact(value):
+                continue
+            interests = json.loads(value)
+            dictionary.add(interests)
+            values[key] = dictionary.encode(interests)
+            size_before += len(value)
+            size_after += len(values[key])
+
+        if values and not dry_run:
+            dictionary.save(client)
+            pipe.multi()
+            for key, value in values.items():
+                pipe.set(key, value)
+            try:
+                pipe.execute()
+            except WatchError:
+                return
+    return len(keys), len(values), size_before, size_after
+
+
+if __name__ == "__main__":
+    import redis
+
+    op = OptionParser()
+    op.add_option("--host", action="store", default="localhost")
+    op.add_option("-p", "--port", action="store", type=int, default=6379)
+    op.add_option("--db", action="store", type=int, default=0)
+    op.add_option("--password", action="store", default=None)
+    op.add_option("--batch-size", action="store", type=int, default=1000)
+    op.add_option("--dry-run", action="store_true", default=False)
+    (opts, args) = op.parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
+    client = redis.Redis(host=opts.host, port=opts.port, db=opts.db, password=opts.password)
+    dictionary = InterestsDictionary()
+    total, migrated, before, after = migrate(client, dictionary, opts.batch_size, opts.dry_run)
+    logging.info("Keys: %s, migrated: %s, size of migrated values: %s -> %s bytes, "
+                 "interests in dictionary: %s%s" % (total, migrated, before, after,
+                                                    len(dictionary.names), " (dry run)" if opts.dry_run else ""))
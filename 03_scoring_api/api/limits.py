@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Admission control of scoring API:
+    rate limits per client (token bucket in process memory
+    or fixed window counters in storage, shared by processes)
+    and limit of concurrently handled requests.
+
+    Limiters return 0 if request is admitted, otherwise
+    seconds after which client can retry.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+MAX_KEYS = 100000
+STORAGE_KEY_PREFIX = "rl:"
+
+
+class TokenBucket(object):
+    """
+        Bucket with up to 'burst' tokens refilled with 'rate' tokens per second
+    """
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter(object):
+    """
+        Token buckets per key kept in process memory.
+        The least recently used buckets are dropped when
+        count of keys exceeds max_keys (they are full anyway
+        if key is idle for burst / rate seconds).
+    """
+    def __init__(self, rate, burst=None, max_keys=MAX_KEYS):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def acquire(self, key, now=None, count=1):
+        """
+            Take count tokens of key (all or nothing).
+            Count more than burst is never available.
+            :return: 0 or seconds until tokens are available
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            bucket = self.buckets.pop(key, None)
+            if bucket is None:
+                bucket = TokenBucket(self.burst, now)
+                if len(self.buckets) >= self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                elapsed = max(now - bucket.updated, 0)
+                bucket.tokens = min(self.burst, bucket.tokens + elapsed * self.rate)
+                bucket.updated = now
+            self.buckets[key] = bucket
+
+            if bucket.tokens >= count:
+                bucket.tokens -= count
+                return 0
+            return (count - bucket.tokens) / self.rate
+
+    def __len__(self):
+        return len(self.buckets)
+
+
+class StorageRateLimiter(object):
+    """
+        Rate limiter over storage (Redis), so limits hold for all
+        processes of service. Counts requests of key in fixed windows
+        of burst / rate seconds with atomic increment, up to 'burst'
+        requests per window. If storage isn't available requests are admitted.
+    """
+    def __init__(self, storage, rate, burst=None, prefix=STORAGE_KEY_PREFIX):
+        self.storage = storage
+        self.rate = float(rate)
+        self.burst = int(burst if burst is not None else max(rate, 1))
+        self.window = self.burst / self.rate
+        self.prefix = prefix
+
+    def acquire(self, key, now=None, count=1):
+        """ Count requests (count of them at once), see RateLimiter.acquire """
+        now = time.time() if now is None else now
+        window = int(now // self.window)
+        storage_key = "%s%s:%s" % (self.prefix, key, window)
+        try:
+            # request isn't delayed by reconnects, it is admitted if storage fails
+            total = self.storage.incr(storage_key, expires=int(math.ceil(self.window)) + 1, retry=False,
+                                      amount=count)
+        except Exception as e:
+            logging.error("Rate limiter storage isn't available: %s" % e)
+            return 0
+        if total <= self.burst:
+            return 0
+        return (window + 1) * self.window - now
+
+
+class ConcurrencyLimiter(object):
+    """
+        Limit of requests handled at the same time.
+        Extra requests are rejected instead of being queued.
+    """
+    def __init__(self, max_concurrency, retry_after=1):
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+
+    def acquire(self):
+        """ :return: 0 or seconds to retry (request has to call release if 0) """
+        if not self.semaphore.acquire(False):
+            with self.lock:
+                self.rejected += 1
+            return self.retry_after
+        with self.lock:
+            self.active += 1
+        return 0
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+        self.semaphore.release()
@@ -0,0 +1,523 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    In-memory stand-in of Redis server for tests and benchmarks.
+    Speaks RESP protocol, so real clients can be used with it.
+    Supported commands: PING, ECHO, AUTH, SELECT, QUIT, GET, SET, MGET,
+    MSET, INCR, INCRBY, DEL, EXISTS, EXPIRE, TTL, SCAN, DBSIZE, FLUSHDB, FLUSHALL,
+    WATCH, UNWATCH, MULTI, EXEC, DISCARD.
+
+    Latency and failures of server can be injected: every command
+    is delayed by 'latency' seconds and with probability 'failure_rate'
+    connection is dropped without reply.
+
+    Works with Python 2.7 and Python 3.
+"""
+
+import fnmatch
+import logging
+import random
+import socket
+import threading
+import time
+from optparse import OptionParser
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+
+DATABASES = 16
+
+
+class CommandError(Exception):
+    pass
+
+
+class Keyspace(object):
+    """
+        Thread-safe key-value storage with TTL expiry.
+        Expired keys are removed lazily on access.
+        Keyspace has version which is increased by every change,
+        so watched keys can be checked (see is_changed).
+    """
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        # version of the last change of key
+        self.modified = {}
+        self.version = 0
+        self.cleared = 0
+        # transaction takes lock for all its commands
+        self.lock = threading.RLock()
+
+    def _touch(self, key):
+        self.version += 1
+        self.modified[key] = self.version
+
+    def _is_expired(self, key, now):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= now:
+            del self.data[key]
+            del self.expires[key]
+            self._touch(key)
+            return True
+        return False
+
+    def is_changed(self, key, version):
+        """ Key is changed (or expired) after given version of keyspace """
+        with self.lock:
+            self._is_expired(key, time.time())
+            return self.cleared > version or self.modified.get(key, 0) > version
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.data or self._is_expired(key, time.time()):
+                return None
+            return self.data[key]
+
+    def set(self, key, value, expires=None, nx=False, xx=False):
+        """
+            Set value of key.
+            :param expires: TTL in seconds (float) or None
+            :return: True if value was set
+        """
+        with self.lock:
+            now = time.time()
+            exists = key in self.data and not self._is_expired(key, now)
+            if (nx and exists) or (xx and not exists):
+                return False
+            self.data[key] = value
+            if expires is not None:
+                self.expires[key] = now + expires
+            else:
+                self.expires.pop(key, None)
+            self._touch(key)
+            return True
+
+    def incr(self, key, amount=1):
+        """ Increment integer value of key by amount keeping its TTL """
+        with self.lock:
+            value = 0
+            if key in self.data and not self._is_expired(key, time.time()):
+                try:
+                    value = int(self.data[key])
+                except ValueError:
+                    raise CommandError("value is not an integer or out of range")
+            value += amount
+            self.data[key] = str(value).encode('ascii')
+            self._touch(key)
+            return value
+
+    def delete(self, *keys):
+        with self.lock:
+            now = time.time()
+            deleted = 0
+            for key in keys:
+                if key in self.data and not self._is_expired(key, now):
+                    del self.data[key]
+                    self.expires.pop(key, None)
+                    self._touch(key)
+                    deleted += 1
+            return deleted
+
+    def exists(self, key):
+        with self.lock:
+            return key in self.data and not self._is_expired(key, time.time())
+
+    def expire(self, key, expires):
+        with self.lock:
+            now = time.time()
+            if key not in self.data or self._is_expired(key, now):
+                return False
+            self.expires[key] = now + expires
+            self._touch(key)
+            return True
+
+    def ttl(self, key):
+        """
+            Return TTL of key in seconds, -1 for persistent key
+            and -2 for missing key (like Redis).
+        """
+        with self.lock:
+            now = time.time()
+            if key not in self.data or self._is_expired(key, now):
+                return -2
+            if key not in self.expires:
+                return -1
+            return int(round(self.expires[key] - now))
+
+    def scan(self, cursor, count, pattern=None):
+        """
+            Iterate keys in sorted order, cursor is position of next key.
+            :return: (next cursor or 0 at the end, list of keys)
+        """
+        with self.lock:
+            now = time.time()
+            keys = sorted(key for key in list(self.data) if not self._is_expired(key, now))
+        batch = keys[cursor:cursor + count]
+        cursor = cursor + count if cursor + count < len(keys) else 0
+        if pattern is not None:
+            batch = [key for key in batch if fnmatch.fnmatchcase(key, pattern)]
+        return cursor, batch
+
+    def __len__(self):
+        with self.lock:
+            now = time.time()
+            for key in list(self.expires):
+                self._is_expired(key, now)
+            return len(self.data)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.expires.clear()
+            self.modified.clear()
+            self.version += 1
+            self.cleared = self.version
+
+
+##### RESP #####
+
+def encode_reply(value):
+    """
+        Encode python value to RESP reply:
+        None - null bulk string, bool/int - integer, bytes - bulk string,
+        list - array, CommandError - error, 'OK'-like str in tuple - simple string.
+    """
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, CommandError):
+        return ('-ERR %s\r\n' % value).encode('utf8')
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return (':%d\r\n' % value).encode('ascii')
+    if isinstance(value, tuple):
+        return ('+%s\r\n' % value[0]).encode('utf8')
+    if isinstance(value, list):
+        return (b'*' + str(len(value)).encode('ascii') + b'\r\n' +
+                b''.join(encode_reply(v) for v in value))
+    return (b'$' + str(len(value)).encode('ascii') + b'\r\n' + value + b'\r\n')
+
+
+OK_REPLY = ('OK',)
+
+
+def read_command(rfile):
+    """
+        Read one command from stream.
+        :return: list of arguments (bytes) or None if connection is closed
+    """
+    line = rfile.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        # inline command
+        return line.split()
+
+    args = []
+    for _ in range(int(line[1:])):
+        header = rfile.readline()
+        if not header.startswith(b'$'):
+            raise CommandError("Protocol error: expected '$'")
+        length = int(header[1:])
+        args.append(rfile.read(length + 2)[:length])
+    return args
+
+
+##### Server #####
+
+class RESPRequestHandler(socketserver.StreamRequestHandler):
+    """
+        Handler of one client connection
+    """
+    def setup(self):
+        socketserver.StreamRequestHandler.setup(self)
+        self.db = 0
+        self.authenticated = self.server.password is None
+        # (keyspace, key, version of keyspace) of WATCH
+        self.watched = []
+        # queued commands of MULTI
+        self.transaction = None
+        with self.server.lock:
+            self.server.connections.add(self.connection)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.connections.discard(self.connection)
+        try:
+            socketserver.StreamRequestHandler.finish(self)
+        except socket.error:
+            pass
+
+    def handle(self):
+        while True:
+            try:
+                args = read_command(self.rfile)
+            except socket.error:
+                return
+            except (CommandError, ValueError) as e:
+                self.wfile.write(encode_reply(CommandError(e)))
+                return
+            if not args:
+                return
+
+            if self.server.inject_failure():
+                return
+
+            name = args[0].upper().decode('ascii', 'replace')
+            if name == 'QUIT':
+                self.wfile.write(encode_reply(OK_REPLY))
+                return
+            self.wfile.write(encode_reply(self.call(name, args[1:])))
+            self.wfile.flush()
+
+    def call(self, name, args):
+        """ Execute command, error is returned as reply """
+        try:
+            return self.execute(name, args)
+        except (IndexError, ValueError):
+            return CommandError("wrong arguments for '%s' command" % name.lower())
+        except CommandError as e:
+            return e
+
+    def execute(self, name, args):
+        if name == 'AUTH':
+            if self.server.password is None:
+                raise CommandError("Client sent AUTH, but no password is set")
+            if args[-1].decode('utf8') != self.server.password:
+                raise CommandError("invalid password")
+            self.authenticated = True
+            return OK_REPLY
+        if not self.authenticated:
+            raise CommandError("NOAUTH Authentication required.")
+
+        method = getattr(self, 'command_' + name.lower(), None)
+        if method is None:
+            raise CommandError("unknown command '%s'" % name.lower())
+        if self.transaction is not None and name not in ('EXEC', 'DISCARD', 'MULTI', 'WATCH'):
+            self.transaction.append((name, args))
+            return ('QUEUED',)
+        return method(*args)
+
+    @property
+    def keyspace(self):
+        return self.server.databases[self.db]
+
+    def command_ping(self, message=None):
+        return ('PONG',) if message is None else message
+
+    def command_echo(self, message):
+        return message
+
+    def command_select(self, db):
+        db = int(db)
+        if not 0 <= db < len(self.server.databases):
+            raise CommandError("DB index is out of range")
+        self.db = db
+        return OK_REPLY
+
+    def command_get(self, key):
+        return self.keyspace.get(key)
+
+    def command_set(self, key, value, *options):
+        expires, nx, xx = None, False, False
+        options = [o.upper() for o in options]
+        while options:
+            option = options.pop(0)
+            if option == b'EX':
+                expires = int(options.pop(0))
+            elif option == b'PX':
+                expires = int(options.pop(0)) / 1000.0
+            elif option == b'NX':
+                nx = True
+            elif option == b'XX':
+                xx = True
+            else:
+                raise CommandError("syntax error")
+        if expires is not None and expires <= 0:
+            raise CommandError("invalid expire time in set")
+        if self.keyspace.set(key, value, expires, nx=nx, xx=xx):
+            return OK_REPLY
+
+    def command_mget(self, *keys):
+        if not keys:
+            raise ValueError
+        return [self.keyspace.get(key) for key in keys]
+
+    def command_mset(self, *args):
+        if not args or len(args) % 2:
+            raise ValueError
+        for key, value in zip(args[::2], args[1::2]):
+            self.keyspace.set(key, value)
+        return OK_REPLY
+
+    def command_incr(self, key):
+        return self.keyspace.incr(key)
+
+    def command_incrby(self, key, amount):
+        return self.keyspace.incr(key, int(amount))
+
+    def command_del(self, *keys):
+        if not keys:
+            raise ValueError
+        return self.keyspace.delete(*keys)
+
+    def command_exists(self, *keys):
+        if not keys:
+            raise ValueError
+        return sum(self.keyspace.exists(key) for key in keys)
+
+    def command_expire(self, key, seconds):
+        return self.keyspace.expire(key, int(seconds))
+
+    def command_ttl(self, key):
+        return self.keyspace.ttl(key)
+
+    def command_scan(self, cursor, *options):
+        pattern, count = None, 10
+        options = list(options)
+        while options:
+            option = options.pop(0).upper()
+            if option == b'MATCH':
+                pattern = options.pop(0)
+            elif option == b'COUNT':
+                count = int(options.pop(0))
+            else:
+                raise CommandError("syntax error")
+        cursor, keys = self.keyspace.scan(int(cursor), count, pattern)
+        return [str(cursor).encode('ascii'), keys]
+
+    def command_dbsize(self):
+        return len(self.keyspace)
+
+    def command_flushdb(self):
+        self.keyspace.clear()
+        return OK_REPLY
+
+    def command_flushall(self):
+        for keyspace in self.server.databases:
+            keyspace.clear()
+        return OK_REPLY
+
+    def command_watch(self, *keys):
+        if not keys:
+            raise ValueError
+        if self.transaction is not None:
+            raise CommandError("WATCH inside MULTI is not allowed")
+        with self.keyspace.lock:
+            version = self.keyspace.version
+        self.watched.extend((self.keyspace, key, version) for key in keys)
+        return OK_REPLY
+
+    def command_unwatch(self):
+        self.watched = []
+        return OK_REPLY
+
+    def command_multi(self):
+        if self.transaction is not None:
+            raise CommandError("MULTI calls can not be nested")
+        self.transaction = []
+        return OK_REPLY
+
+    def command_discard(self):
+        if self.transaction is None:
+            raise CommandError("DISCARD without MULTI")
+        self.transaction = None
+        self.watched = []
+        return OK_REPLY
+
+    def command_exec(self):
+        """
+            Run queued commands atomically (in keyspace of EXEC).
+            :return: None if watched key is changed
+        """
+        if self.transaction is None:
+            raise CommandError("EXEC without MULTI")
+        commands, self.transaction = self.transaction, None
+        watched, self.watched = self.watched, []
+        with self.keyspace.lock:
+            if any(keyspace.is_changed(key, version) for keyspace, key, version in watched):
+                return None
+            return [self.call(name, args) for name, args in commands]
+
+
+class MemoryRedisServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+        Threaded RESP server over in-memory keyspaces.
+        Use port 0 for binding to any free port (see self.port).
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='localhost', port=0, password=None, databases=DATABASES,
+                 latency=0, failure_rate=0.0):
+        socketserver.TCPServer.__init__(self, (host, port), RESPRequestHandler)
+        self.password = password
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.databases = [Keyspace() for _ in range(databases)]
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def inject_failure(self):
+        """ Delay command and return True if it has to fail """
+        if self.latency:
+            time.sleep(self.latency)
+        return bool(self.failure_rate) and random.random() < self.failure_rate
+
+    def start(self):
+        """ Serve in background daemon thread """
+        self.thread = threading.Thread(target=self.serve_forever,
+                                       kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """ Stop background thread and drop all client connections """
+        self.shutdown()
+        self.server_close()
+        with self.lock:
+            for conn in self.connections:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--host", action="store", default="localhost")
+    op.add_option("-p", "--port", action="store", type=int, default=6379)
+    op.add_option("--password", action="store", default=None)
+    op.add_option("--latency", action="store", type=float, default=0,
+                  help="delay of every command in seconds")
+    op.add_option("--failure-rate", action="store", type=float, default=0.0,
+                  help="probability of dropping connection on command")
+    (opts, args) = op.parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
+    server = MemoryRedisServer(opts.host, opts.port, password=opts.password,
+                               latency=opts.latency, failure_rate=opts.failure_rate)
+    logging.info("Starting in-memory Redis stand-in at %s:%s" % (server.host, server.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
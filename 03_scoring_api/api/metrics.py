@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+    In-process metrics of scoring API:
+    counters and histograms with labels, rendered
+    in Prometheus text exposition format.
+"""
+
+import bisect
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = unicode(value).replace(u"\\", u"\\\\").replace(u"\n", u"\\n").replace(u'"', u'\\"')
+        pairs.append(u'%s="%s"' % (name, value))
+    return u"{%s}" % u",".join(pairs)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter(object):
+    """
+        Monotonic counter with labels
+    """
+    type = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        return self.values.get(labels, 0)
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            yield self.name, format_labels(self.labels, labels), value
+
+
+class Histogram(object):
+    """
+        Histogram with fixed buckets and labels.
+        Observation costs one binary search and a few additions.
+    """
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels: [counts of buckets (the last is +Inf), sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            data = self.values.get(labels)
+            if data is None:
+                data = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            data[0][index] += 1
+            data[1] += value
+
+    def get_count(self, labels=()):
+        data = self.values.get(labels)
+        return sum(data[0]) if data else 0
+
+    def samples(self):
+        with self.lock:
+            values = sorted((labels, (list(data[0]), data[1])) for labels, data in self.values.items())
+        bounds = self.buckets + (float("inf"),)
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield (self.name + "_bucket",
+                       format_labels(self.labels + ("le",), labels + (format_value(bound),)),
+                       cumulative)
+            yield self.name + "_sum", format_labels(self.labels, labels), total
+            yield self.name + "_count", format_labels(self.labels, labels), cumulative
+
+
+class MetricsRegistry(object):
+    """
+        Collection of metrics which is rendered at once
+    """
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        """ Return metrics in Prometheus text format (utf8) """
+        lines = []
+        for metric in self.metrics:
+            lines.append(u"# HELP %s %s" % (metric.name, metric.documentation))
+            lines.append(u"# TYPE %s %s" % (metric.name, metric.type))
+            for name, labels, value in metric.samples():
+                lines.append(u"%s%s %s" % (name, labels, format_value(value)))
+        return (u"\n".join(lines) + u"\n").encode("utf8")
+
+
+##### Tracing #####
+
+class Phase(object):
+    """
+        Context manager which adds time of block to trace
+    """
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.trace.add(self.name, time.time() - self.start)
+
+
+class RequestTrace(object):
+    """
+        Timings (in seconds) of phases of one request.
+        Several traces can share one dict of timings.
+    """
+    def __init__(self, timings=None):
+        self.timings = {} if timings is None else timings
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+
+class TracedStorage(object):
+    """
+        Storage proxy which adds time of storage calls
+        to 'store' phase of trace
+    """
+    def __init__(self, storage, trace):
+        self.storage = storage
+        self.trace = trace
+
+    def get(self, key):
+        with self.trace.phase("store"):
+            return self.storage.get(key)
+
+    def set(self, key, value):
+        with self.trace.phase("store"):
+            return self.storage.set(key, value)
+
+    def get_many(self, keys):
+        with self.trace.phase("store"):
+            return self.storage.get_many(keys)
+
+    def cache_get(self, key):
+        with self.trace.phase("store"):
+            return self.storage.cache_get(key)
+
+    def cache_get_many(self, keys):
+        with self.trace.phase("store"):
+            return self.storage.cache_get_many(keys)
+
+    def cache_set(self, key, value, expires=None):
+        with self.trace.phase("store"):
+            return self.storage.cache_set(key, value, expires)
@@ -1,22 +1,125 @@
 # -*- coding: utf-8 -*-
 
 import hashlib
-import json
+import math
+import numbers
+import random
+import threading
+import time
 
+from interests import DICTIONARY_KEY, InterestsDictionary, decode_interests
 
-def get_score(store, phone=None, email=None, birthday=None, gender=None, first_name=None, last_name=None):
+
+SCORE_CACHE_TIME = 60 * 60
+# zero (and negative) scores are cached for shorter time
+ZERO_SCORE_CACHE_TIME = 10 * 60
+# the more beta the earlier cached score is refreshed.
+# Recalculation of score costs round trip to store (about a millisecond),
+# so it's scaled to refresh of hot keys in the last seconds before expiration
+EARLY_REFRESH_BETA = 1000.0
+
+
+class SingleFlight(object):
+    """
+        Coalesces concurrent calls with the same key:
+        only the first caller runs function, others wait for its result.
+    """
+    class Call(object):
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self.calls[key] = self.Call()
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result
+
+
+score_flight = SingleFlight()
+# ids of interests in compact values, loaded from storage on demand
+interests_dictionary = InterestsDictionary()
+
+
+def get_score_key(phone=None, birthday=None, first_name=None, last_name=None):
     key_parts = [
         first_name or "",
         last_name or "",
         phone or "",
         birthday.strftime("%Y%m%d") if birthday is not None else "",
     ]
-    key = "uid:" + hashlib.md5("".join(key_parts).encode('utf8')).hexdigest()
-    # try get from cache,
-    # fallback to heavy calculation in case of cache miss
-    score = store.cache_get(key) or 0
-    if score:
-        return float(score)
+    return "uid:" + hashlib.md5("".join(key_parts).encode('utf8')).hexdigest()
+
+
+def get_interests_key(cid):
+    return "i:%s" % cid
+
+
+def get_score_cache_time(score):
+    return SCORE_CACHE_TIME if score > 0 else ZERO_SCORE_CACHE_TIME
+
+
+def encode_cached_score(score, delta, expires):
+    """
+        Cached score keeps time of its calculation (delta)
+        and time of expiration for early refresh
+    """
+    return "%r;%r;%r" % (float(score), delta, expires)
+
+
+def decode_cached_score(value):
+    """
+        Return (score, delta, expires) of cached value.
+        Plain numbers (without delta and expires) are supported too.
+        Raise ValueError for invalid value.
+    """
+    if isinstance(value, numbers.Number):
+        return float(value), None, None
+    if not isinstance(value, str):
+        # bytes in Python 3
+        value = value.decode('ascii')
+    parts = value.split(";")
+    if len(parts) == 3:
+        return float(parts[0]), float(parts[1]), float(parts[2])
+    return float(value), None, None
+
+
+def should_refresh(delta, expires, now=None, beta=EARLY_REFRESH_BETA, rnd=random.random):
+    """
+        Probabilistic early expiration (XFetch): the closer expiration time
+        and the longer calculation, the more likely refresh before expiration.
+    """
+    if delta is None or expires is None:
+        return False
+    now = time.time() if now is None else now
+    return now - delta * beta * math.log(1.0 - rnd()) >= expires
+
+
+def calculate_score(phone=None, email=None, birthday=None, gender=None, first_name=None, last_name=None):
+    score = 0
     if phone:
         score += 1.5
     if email:
@@ -25,11 +128,48 @@ def get_score(store, phone=None, email=None, birthday=None, gender=None, first_n
         score += 1.5
     if first_name and last_name:
         score += 0.5
-    # cache for 60 minutes
-    store.cache_set(key, score, 60 * 60)
     return score
 
 
-def get_interests(store, cid):
-    r = store.get("i:%s" % cid)
-    return json.loads(r) if r else []
+def calculate_and_cache_score(store, key, start, **kwargs):
+    """ start is time of reading of cached value, it's a part of recalculation """
+    score = calculate_score(**kwargs)
+    now = time.time()
+    cache_time = get_score_cache_time(score)
+    store.cache_set(key, encode_cached_score(score, now - start, now + cache_time), cache_time)
+    return score
+
+
+def get_score(store, phone=None, email=None, birthday=None, gender=None, first_name=None, last_name=None):
+    key = get_score_key(phone=phone, birthday=birthday,
+                        first_name=first_name, last_name=last_name)
+    # try get from cache,
+    # fallback to heavy calculation in case of cache miss
+    # or early refresh of cached score
+    start = time.time()
+    cached = store.cache_get(key)
+    if cached is not None:
+        try:
+            score, delta, expires = decode_cached_score(cached)
+        except ValueError:
+            pass
+        else:
+            if not should_refresh(delta, expires):
+                return score
+
+    # concurrent calculations of the same score are coalesced
+    return score_flight.do(key, calculate_and_cache_score, store, key, start,
+                           phone=phone, email=email, birthday=birthday, gender=gender,
+                           first_name=first_name, last_name=last_name)
+
+
+def get_interests(store, cid, dictionary=interests_dictionary):
+    r = store.get(get_interests_key(cid))
+    interests = decode_interests(r, dictionary)
+    if interests is None:
+        # value has ids added to dictionary after it was loaded
+        dictionary.update(store.get(DICTIONARY_KEY))
+        interests = decode_interests(r, dictionary)
+        if interests is None:
+            raise ValueError("Unknown id of interest in value of client %s" % cid)
+    return interests
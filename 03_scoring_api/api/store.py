@@ -1,11 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import collections
 import functools
 import json
 import logging
+import random
 import redis
+import threading
 import time
 
+from memory_redis import Keyspace
+
+
+WRITE_BEHIND_QUEUE_SIZE = 10000
+WRITE_BEHIND_BATCH_SIZE = 100
+
 
 class RedisConnection(object):
     def __init__(self, host='localhost', port=6379, db=0, password=None,
@@ -44,6 +53,125 @@ class RedisConnection(object):
     def set(self, key, value, expires=None):
         return self._retry(self.db.set, key, value, ex=expires)
 
+    def mget(self, keys):
+        return self._retry(self.db.mget, keys)
+
+    def _set_many(self, items):
+        pipe = self.db.pipeline(transaction=False)
+        for key, value, expires in items:
+            pipe.set(key, value, ex=expires)
+        return all(pipe.execute())
+
+    def set_many(self, items):
+        """ Set list of (key, value, expires) in one round trip """
+        return self._retry(self._set_many, items)
+
+    def _incr(self, key, expires, amount=1):
+        pipe = self.db.pipeline(transaction=False)
+        pipe.incr(key, amount)
+        if expires is not None:
+            pipe.expire(key, expires)
+        return pipe.execute()[0]
+
+    def incr(self, key, expires=None, retry=True, amount=1):
+        """
+            Increment integer value of key by amount and set its TTL, return new value.
+            Without retry fails at once (callers which don't wait for storage).
+        """
+        if not retry:
+            return self._incr(key, expires, amount)
+        return self._retry(self._incr, key, expires, amount)
+
+
+##### In-memory store #####
+
+def encode_value(value):
+    """ Convert value to bytes as redis client does """
+    if isinstance(value, bytes):
+        return value
+    return (u"%s" % value).encode("utf8")
+
+
+class MemoryClient(object):
+    """
+        In-process replacement of redis.Redis client (get, set, mget, delete,
+        ping, flushdb) over memory_redis.Keyspace with TTL expiry.
+        Latency (seconds) is added to every command and failures are raised
+        as redis ConnectionError with given probability.
+    """
+    def __init__(self, keyspace=None, latency=0, failure_rate=0.0):
+        self.keyspace = Keyspace() if keyspace is None else keyspace
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def _call(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise redis.exceptions.ConnectionError("Injected failure of memory store")
+
+    def get(self, key):
+        self._call()
+        return self.keyspace.get(encode_value(key))
+
+    def set(self, key, value, ex=None):
+        self._call()
+        return self.keyspace.set(encode_value(key), encode_value(value), ex)
+
+    def mget(self, keys):
+        self._call()
+        return [self.keyspace.get(encode_value(key)) for key in keys]
+
+    def delete(self, *keys):
+        self._call()
+        return self.keyspace.delete(*[encode_value(key) for key in keys])
+
+    def ping(self):
+        self._call()
+        return True
+
+    def flushdb(self):
+        self._call()
+        self.keyspace.clear()
+        return True
+
+    def pipeline(self, transaction=True):
+        return MemoryPipeline(self)
+
+
+class MemoryPipeline(object):
+    """ Buffers commands of MemoryClient and runs them as one call """
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        self.commands.append((self.client.keyspace.set, (encode_value(key), encode_value(value), ex)))
+
+    def incr(self, key, amount=1):
+        self.commands.append((self.client.keyspace.incr, (encode_value(key), amount)))
+
+    def expire(self, key, seconds):
+        self.commands.append((self.client.keyspace.expire, (encode_value(key), seconds)))
+
+    def execute(self):
+        self.client._call()
+        commands, self.commands = self.commands, []
+        return [command(*args) for command, args in commands]
+
+
+class MemoryConnection(RedisConnection):
+    """
+        RedisConnection which keeps data in process memory.
+        Accepts the same config as RedisConnection (connection
+        parameters are ignored), so can replace it in Storage.
+    """
+    def __init__(self, keyspace=None, latency=0, failure_rate=0.0,
+                 retry=3, backoff_factor=0.3, **kwargs):
+        self.retry = retry
+        self.backoff_factor = backoff_factor
+        self.db = MemoryClient(keyspace, latency=latency, failure_rate=failure_rate)
+
 
 class Storage(object):
     def __init__(self, store, config):
@@ -55,6 +183,15 @@ class Storage(object):
     def set(self, key, value):
         return self.db.set(key, value)
 
+    def incr(self, key, expires=None, retry=True, amount=1):
+        return self.db.incr(key, expires, retry, amount)
+
+    def get_many(self, keys):
+        """ Return values of keys in one round trip (None for missing keys) """
+        if not keys:
+            return []
+        return self.db.mget(keys)
+
     def cache_get(self, key):
         try:
             return self.db.get(key)
@@ -63,6 +200,14 @@ class Storage(object):
             logging.error("Cache storage isn't available!")
             return
 
+    def cache_get_many(self, keys):
+        try:
+            return self.get_many(keys)
+        except (redis.exceptions.ConnectionError,
+                redis.exceptions.TimeoutError) as e:
+            logging.error("Cache storage isn't available!")
+            return [None] * len(keys)
+
     def cache_set(self, key, value, expires=None):
         try:
             return self.db.set(key, value, expires)
@@ -70,3 +215,162 @@ class Storage(object):
                 redis.exceptions.TimeoutError) as e:
             logging.error("Cache storage isn't available!")
             logging.info("Cannot save to cache database.")
+
+    def cache_set_many(self, items):
+        """ Save list of (key, value, expires) in one round trip """
+        if not items:
+            return True
+        try:
+            return self.db.set_many(items)
+        except (redis.exceptions.ConnectionError,
+                redis.exceptions.TimeoutError) as e:
+            logging.error("Cache storage isn't available!")
+            logging.info("Cannot save %s values to cache database." % len(items))
+
+
+class PrefetchStorage(object):
+    """
+        Storage proxy which serves reads from values fetched in advance
+        with one round trip to storage (used by batch requests).
+        Keys that weren't prefetched are read from wrapped storage.
+    """
+    def __init__(self, storage):
+        self.storage = storage
+        self.values = {}
+        self.cache_values = {}
+
+    def prefetch(self, keys=(), cache_keys=()):
+        keys = list(set(keys))
+        cache_keys = list(set(cache_keys))
+        if keys:
+            try:
+                self.values.update(zip(keys, self.storage.get_many(keys)))
+            except Exception as e:
+                # every request will read its keys by itself
+                logging.error("Cannot prefetch keys from storage: %s" % e)
+        if cache_keys:
+            self.cache_values.update(
+                zip(cache_keys, self.storage.cache_get_many(cache_keys)))
+
+    def get(self, key):
+        if key in self.values:
+            return self.values[key]
+        return self.storage.get(key)
+
+    def set(self, key, value):
+        self.values.pop(key, None)
+        return self.storage.set(key, value)
+
+    def cache_get(self, key):
+        if key in self.cache_values:
+            return self.cache_values[key]
+        return self.storage.cache_get(key)
+
+    def cache_set(self, key, value, expires=None):
+        self.cache_values[key] = value
+        return self.storage.cache_set(key, value, expires)
+
+
+class WriteBehindStorage(object):
+    """
+        Storage proxy which saves cache values in background thread,
+        so requests don't wait for cache writes. Writes are queued and
+        sent in pipelined batches. When queue is full the oldest write
+        is dropped (cache may lose values). Queue is flushed on close.
+    """
+    def __init__(self, storage, max_size=WRITE_BEHIND_QUEUE_SIZE, batch_size=WRITE_BEHIND_BATCH_SIZE):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.queue = collections.deque(maxlen=max_size)
+        self.condition = threading.Condition()
+        # queued and not written values
+        self.pending = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def get(self, key):
+        return self.storage.get(key)
+
+    def set(self, key, value):
+        return self.storage.set(key, value)
+
+    def incr(self, key, expires=None, retry=True, amount=1):
+        return self.storage.incr(key, expires, retry, amount)
+
+    def get_many(self, keys):
+        return self.storage.get_many(keys)
+
+    def cache_get(self, key):
+        return self.storage.cache_get(key)
+
+    def cache_get_many(self, keys):
+        return self.storage.cache_get_many(keys)
+
+    def cache_set(self, key, value, expires=None):
+        with self.condition:
+            if self.closed:
+                return self.storage.cache_set(key, value, expires)
+            if len(self.queue) == self.queue.maxlen:
+                # the oldest write is pushed out
+                self.dropped += 1
+                self.pending -= 1
+            self.queue.append((key, value, expires))
+            self.pending += 1
+            self.condition.notify_all()
+        return True
+
+    def cache_set_many(self, items):
+        for key, value, expires in items:
+            self.cache_set(key, value, expires)
+        return True
+
+    def next_batch(self):
+        """ Wait for queued writes, empty list means closed storage """
+        with self.condition:
+            while not self.queue and not self.closed:
+                self.condition.wait()
+            return [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if not batch:
+                return
+            try:
+                saved = self.storage.cache_set_many(batch)
+            except Exception as e:
+                logging.exception("Cannot save cache values: %s" % e)
+                saved = False
+            with self.condition:
+                if saved:
+                    self.written += len(batch)
+                else:
+                    self.failed += len(batch)
+                self.pending -= len(batch)
+                self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+            Wait until queued writes are sent.
+            :return: True if queue is empty
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while self.pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return not self.pending
+
+    def close(self, timeout=None):
+        """ Send queued writes and stop background thread """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    Benchmark of authorization cost per request
+    with and without cache of verified tokens.
+
+    Usage:
+        python bench_auth.py [-n NUMBER] [-r REPEAT]
+"""
+
+import timeit
+from optparse import OptionParser
+
+from context import api, gen_valid_token
+
+
+def get_method_request(login, account):
+    token = gen_valid_token(login, account)
+    request = api.MethodRequest({"account": account, "login": login, "token": token,
+                                 "method": "online_score", "arguments": {}})
+    assert request.is_valid() and api.check_auth(request, cache=None)
+    return request
+
+
+def bench(func, number, repeat):
+    """ Return best time of one call in microseconds """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 10**6
+
+
+def main(number, repeat):
+    print "{:<10} {:>14} {:>14} {:>8}".format("login", "no cache, us", "cache, us", "speedup")
+    for login in ("h&f", api.ADMIN_LOGIN):
+        request = get_method_request(login, "horns&hoofs")
+        cache = api.AuthCache()
+        without_cache = bench(lambda: api.check_auth(request, cache=None), number, repeat)
+        with_cache = bench(lambda: api.check_auth(request, cache=cache), number, repeat)
+        print "{:<10} {:>14.2f} {:>14.2f} {:>7.1f}x".format(
+            login, without_cache, with_cache, without_cache / with_cache)
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("-n", "--number", action="store", type=int, default=100000)
+    op.add_option("-r", "--repeat", action="store", type=int, default=3)
+    (opts, args) = op.parse_args()
+    main(opts.number, opts.repeat)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    Microbenchmark of validation and cleaning of request fields:
+    every Field subclass with valid and invalid values and
+    whole requests of methods.
+
+    Usage:
+        python bench_fields.py [-n NUMBER] [-r REPEAT] [-o RESULTS.json] [--compare RESULTS.json]
+"""
+
+import json
+import timeit
+from optparse import OptionParser
+
+from context import api
+
+
+FIELD_CASES = [
+    # name, field, value
+    ("char", api.CharField(), u"Станислав"),
+    ("char/invalid", api.CharField(), 42),
+    ("arguments", api.ArgumentsField(), {"phone": "79175002040"}),
+    ("email", api.EmailField(), "stupnikov@otus.ru"),
+    ("email/invalid", api.EmailField(), "stupnikov.otus.ru"),
+    ("phone/str", api.PhoneField(), "79175002040"),
+    ("phone/int", api.PhoneField(), 79175002040),
+    ("phone/invalid", api.PhoneField(), "7917500204a"),
+    ("date", api.DateField(), "20.07.2017"),
+    ("date/invalid", api.DateField(), "31.02.2017"),
+    ("birthday", api.BirthDayField(), "01.01.1990"),
+    ("birthday/invalid", api.BirthDayField(), "01.01.1890"),
+    ("gender", api.GenderField(), 1),
+    ("gender/invalid", api.GenderField(), 3),
+    ("client_ids", api.ClientIDsField(), range(20)),
+    ("client_ids/invalid", api.ClientIDsField(), range(19) + ["1"]),
+    ("batch", api.BatchRequestsField(), [{}] * 20),
+]
+
+REQUEST_CASES = [
+    ("online_score", api.OnlineScoreRequest,
+     {"phone": "79175002040", "email": "stupnikov@otus.ru", "first_name": u"Станислав",
+      "last_name": u"Ступников", "birthday": "01.01.1990", "gender": 1}),
+    ("clients_interests", api.ClientsInterestsRequest, {"client_ids": range(20), "date": "20.07.2017"}),
+    ("method", api.MethodRequest,
+     {"account": "horns&hoofs", "login": "h&f", "method": "online_score", "token": "token", "arguments": {}}),
+]
+
+
+def validate_and_clean(field, value):
+    field.is_exist = True
+    try:
+        field.validate(value)
+    except api.ValidationError:
+        return
+    field.clean(value)
+
+
+def bench(func, number, repeat):
+    """ Return best time of one call in microseconds """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 10**6
+
+
+def main(number, repeat):
+    results = {}
+    for name, field, value in FIELD_CASES:
+        results["field/" + name] = bench(lambda: validate_and_clean(field, value), number, repeat)
+    for name, request_cls, data in REQUEST_CASES:
+        assert request_cls(data).is_valid()
+        results["request/" + name] = bench(lambda: request_cls(data).is_valid(), number // 10, repeat)
+    return results
+
+
+def print_results(results, previous=None):
+    print "{:<28} {:>10} {:>10}".format("case", "time, us", "change")
+    for name in sorted(results):
+        change = ""
+        if previous and previous.get(name):
+            change = "{:+.1f}%".format((results[name] - previous[name]) / previous[name] * 100)
+        print "{:<28} {:>10.2f} {:>10}".format(name, results[name], change)
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("-n", "--number", action="store", type=int, default=100000)
+    op.add_option("-r", "--repeat", action="store", type=int, default=3)
+    op.add_option("-o", "--output", action="store", default=None, help="Save results in JSON file")
+    op.add_option("--compare", action="store", default=None, help="Compare with results from JSON file")
+    (opts, args) = op.parse_args()
+    results = main(opts.number, opts.repeat)
+    previous = None
+    if opts.compare:
+        with open(opts.compare) as f:
+            previous = json.load(f)
+    print_results(results, previous)
+    if opts.output:
+        with open(opts.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
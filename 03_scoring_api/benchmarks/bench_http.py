@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    Benchmark of requests per second of MainHTTPHandler
+    with different serialization settings:
+        legacy  - standard json, sorted keys, every request body is logged
+        default - ujson (if installed), unsorted keys, bodies aren't logged
+
+    Server is run in background thread with in-memory Redis stand-in.
+
+    Usage:
+        python bench_http.py [-n REQUESTS]
+"""
+
+import httplib
+import json
+import logging
+import os
+import threading
+import time
+from BaseHTTPServer import HTTPServer
+from optparse import OptionParser
+
+from context import api, memory_redis, store
+from context import gen_valid_token
+
+
+MODES = {
+    "legacy": {"use_ujson": False, "sort_keys": True, "log_body_rate": 1.0},
+    "default": {"use_ujson": True, "sort_keys": False, "log_body_rate": 0.0},
+}
+
+
+def get_requests():
+    score = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+             "token": gen_valid_token("h&f", "horns&hoofs"),
+             "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru",
+                           "first_name": u"Станислав", "last_name": u"Ступников",
+                           "birthday": "01.01.1990", "gender": 1}}
+    interests = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests",
+                 "token": gen_valid_token("h&f", "horns&hoofs"),
+                 "arguments": {"client_ids": range(20), "date": "20.07.2017"}}
+    return [json.dumps(score), json.dumps(interests)]
+
+
+def run_server(storage, use_ujson, sort_keys, log_body_rate):
+    class Handler(api.MainHTTPHandler):
+        store = storage
+        serializer = api.JSONSerializer(use_ujson=use_ujson, sort_keys=sort_keys)
+
+        def log_message(self, format, *args):
+            pass
+    Handler.log_body_rate = log_body_rate
+
+    server = HTTPServer(("localhost", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def bench(server, bodies, number):
+    host, port = server.server_address
+    start = time.time()
+    for i in range(number):
+        conn = httplib.HTTPConnection(host, port)
+        conn.request("POST", "/method/", bodies[i % len(bodies)])
+        response = conn.getresponse()
+        response.read()
+        assert response.status == api.OK, response.status
+        conn.close()
+    return number / (time.time() - start)
+
+
+def main(number):
+    # log to /dev/null like to real log file
+    logging.disable(logging.NOTSET)
+    logging.basicConfig(filename=os.devnull, level=logging.INFO)
+
+    redis_server = memory_redis.MemoryRedisServer().start()
+    config = dict(api.STORE_CONFIG, host=redis_server.host, port=redis_server.port)
+    storage = store.Storage(store.RedisConnection, config)
+    for cid in range(20):
+        storage.set("i:%s" % cid, json.dumps(["books", "hi-tech", "travel"]))
+
+    bodies = get_requests()
+    results = {}
+    for mode in ("legacy", "default"):
+        server = run_server(storage, **MODES[mode])
+        bench(server, bodies, number // 10)  # warm up
+        results[mode] = bench(server, bodies, number)
+        server.shutdown()
+        server.server_close()
+    redis_server.stop()
+
+    print "JSON library: %s" % api.JSONSerializer().name
+    for mode in ("legacy", "default"):
+        print "{:<8} {:>10.1f} req/s".format(mode, results[mode])
+    print "speedup  {:>10.2f}x".format(results["default"] / results["legacy"])
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("-n", "--number", action="store", type=int, default=3000)
+    (opts, args) = op.parse_args()
+    main(opts.number)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    Benchmark of decoding and size of clients' interests
+    stored in JSON and in compact encoding (see api/interests.py).
+
+    Usage:
+        python bench_interests.py [-n NUMBER] [-r REPEAT]
+"""
+
+import json
+import random
+import timeit
+from optparse import OptionParser
+
+from context import interests
+
+
+NAMES = ["books", "hi-tech", "pets", "tv", "travel", "music", "cinema", "geek", "sport", "cars",
+         "otus", "pinguins", "sea", "mountains", "ski", "golf", "shopping", "cooking"]
+
+
+def bench(func, number, repeat):
+    """ Return best time of one call in microseconds """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 10**6
+
+
+def main(number, repeat):
+    rnd = random.Random(0)
+    dictionary = interests.InterestsDictionary(NAMES)
+    print "{:<10} {:>12} {:>12} {:>10} {:>12} {:>8}".format(
+        "interests", "json, bytes", "compact, b", "json, us", "compact, us", "speedup")
+    for count in (1, 3, 10):
+        names = rnd.sample(NAMES, count)
+        json_value = json.dumps(names)
+        compact_value = dictionary.encode(names)
+        assert interests.decode_interests(compact_value, dictionary) == names
+        json_time = bench(lambda: interests.decode_interests(json_value, dictionary), number, repeat)
+        compact_time = bench(lambda: interests.decode_interests(compact_value, dictionary), number, repeat)
+        print "{:<10} {:>12} {:>12} {:>10.2f} {:>12.2f} {:>7.1f}x".format(
+            count, len(json_value), len(compact_value), json_time, compact_time, json_time / compact_time)
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("-n", "--number", action="store", type=int, default=100000)
+    op.add_option("-r", "--repeat", action="store", type=int, default=3)
+    (opts, args) = op.parse_args()
+    main(opts.number, opts.repeat)
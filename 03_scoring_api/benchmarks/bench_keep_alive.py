@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    Benchmark of requests per second of one sequential caller
+    of MainHTTPHandler:
+        close      - new connection for every request (HTTP/1.0 behaviour)
+        keep-alive - one persistent connection
+        pipelined  - requests are sent in batches without waiting for responses
+
+    Server is run in background thread with in-memory store.
+
+    Usage:
+        python bench_keep_alive.py [-n REQUESTS] [--pipeline BATCH_SIZE]
+"""
+
+import httplib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from optparse import OptionParser
+
+from context import api, store
+from context import gen_valid_token
+
+
+def get_request():
+    return json.dumps({"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+                       "token": gen_valid_token("h&f", "horns&hoofs"),
+                       "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}})
+
+
+def run_server(number):
+    class Handler(api.MainHTTPHandler):
+        store = store.Storage(store.MemoryConnection, {})
+        max_keep_alive_requests = number + 1
+
+        def log_message(self, format, *args):
+            pass
+
+    server = api.ThreadingHTTPServer(("localhost", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def bench_close(address, body, number):
+    start = time.time()
+    for _ in range(number):
+        conn = httplib.HTTPConnection(*address)
+        conn.request("POST", "/method/", body, {"Connection": "close"})
+        response = conn.getresponse()
+        response.read()
+        assert response.status == api.OK, response.status
+        conn.close()
+    return number / (time.time() - start)
+
+
+def bench_keep_alive(address, body, number):
+    conn = httplib.HTTPConnection(*address)
+    start = time.time()
+    for _ in range(number):
+        conn.request("POST", "/method/", body)
+        response = conn.getresponse()
+        response.read()
+        assert response.status == api.OK, response.status
+    elapsed = time.time() - start
+    conn.close()
+    return number / elapsed
+
+
+def bench_pipelined(address, body, number, batch_size):
+    request = ("POST /method/ HTTP/1.1\r\nHost: %s\r\nContent-Length: %s\r\n\r\n%s" %
+               (address[0], len(body), body))
+    sock = socket.create_connection(address)
+    rfile = sock.makefile("rb")
+    start = time.time()
+    sent = 0
+    while sent < number:
+        batch = min(batch_size, number - sent)
+        sock.sendall(request * batch)
+        for _ in range(batch):
+            status = int(rfile.readline().split()[1])
+            headers = httplib.HTTPMessage(rfile, 0)
+            rfile.read(int(headers["Content-Length"]))
+            assert status == api.OK, status
+        sent += batch
+    elapsed = time.time() - start
+    sock.close()
+    return number / elapsed
+
+
+def main(number, batch_size):
+    # log to /dev/null like to real log file
+    logging.disable(logging.NOTSET)
+    logging.basicConfig(filename=os.devnull, level=logging.INFO)
+
+    server = run_server(number)
+    body = get_request()
+    benches = [
+        ("close", lambda n: bench_close(server.server_address, body, n)),
+        ("keep-alive", lambda n: bench_keep_alive(server.server_address, body, n)),
+        ("pipelined", lambda n: bench_pipelined(server.server_address, body, n, batch_size)),
+    ]
+    results = {}
+    for mode, bench in benches:
+        bench(number // 10)  # warm up
+        results[mode] = bench(number)
+    server.shutdown()
+    server.server_close()
+
+    for mode, _ in benches:
+        print "{:<10} {:>10.1f} req/s {:>8.2f}x".format(mode, results[mode], results[mode] / results["close"])
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("-n", "--number", action="store", type=int, default=3000)
+    op.add_option("--pipeline", action="store", type=int, default=10)
+    (opts, args) = op.parse_args()
+    main(opts.number, opts.pipeline)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import hashlib
+import os
+import sys
+import logging
+
+logging.disable(logging.ERROR)
+
+app_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(app_dir, 'api'))
+
+import api
+import interests
+import memory_redis
+import scoring
+import store
+
+
+def gen_valid_token(login='', account=''):
+    if login == api.ADMIN_LOGIN:
+        return hashlib.sha512(datetime.datetime.now().strftime("%Y%m%d%H") + api.ADMIN_SALT).hexdigest()
+    else:
+        return hashlib.sha512(account + login + api.SALT).hexdigest()
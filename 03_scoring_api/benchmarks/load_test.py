@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    Load test of scoring API.
+
+    Drives '/method/' with a mix of requests:
+        score     - valid online_score request (200)
+        interests - valid clients_interests request (200)
+        admin     - online_score request of admin (200)
+        invalid   - online_score request with invalid arguments (422)
+    with fixed concurrency (closed loop) or with target rate (open loop).
+    Every request uses new connection, with --keep-alive every worker
+    sends requests over persistent connection.
+    Reports throughput and latency percentiles and saves results in JSON.
+
+    By default API server and in-memory Redis stand-in are started
+    in subprocesses, use --url for testing running server.
+
+    Usage:
+        python load_test.py -c 10 -n 5000 --mix score=50,interests=30,admin=10,invalid=10
+        python load_test.py --rate 200 -d 30 -o results.json --label v1.2
+        python load_test.py --compare results.json
+        python load_test.py -c 1 -n 5000 --keep-alive
+"""
+
+import datetime
+import httplib
+import json
+import math
+import os
+import random
+import redis
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urlparse
+from collections import defaultdict
+from optparse import OptionParser
+
+from context import api, app_dir, gen_valid_token
+
+
+DEFAULT_MIX = "score=50,interests=30,admin=10,invalid=10"
+PERCENTILES = (50, 95, 99)
+CLIENTS_COUNT = 1000
+CLIENT_IDS_PER_REQUEST = 5
+
+
+##### Requests #####
+
+def gen_score_request(rnd):
+    return {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+            "arguments": {"phone": "7%010d" % rnd.randint(0, 10**10 - 1),
+                          "email": "user@otus.ru",
+                          "first_name": "Name%s" % rnd.randint(0, 1000),
+                          "last_name": "Surname",
+                          "birthday": "01.01.1990", "gender": rnd.choice([0, 1, 2])}}
+
+
+def gen_interests_request(rnd):
+    return {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests",
+            "arguments": {"client_ids": rnd.sample(range(CLIENTS_COUNT), CLIENT_IDS_PER_REQUEST),
+                          "date": "20.07.2017"}}
+
+
+def gen_admin_request(rnd):
+    request = gen_score_request(rnd)
+    request["login"] = api.ADMIN_LOGIN
+    return request
+
+
+def gen_invalid_request(rnd):
+    request = gen_score_request(rnd)
+    request["arguments"]["phone"] = "8%010d" % rnd.randint(0, 10**10 - 1)
+    request["arguments"]["email"] = "userotus.ru"
+    return request
+
+
+REQUESTS = {
+    # kind: (generator, expected code)
+    "score": (gen_score_request, api.OK),
+    "interests": (gen_interests_request, api.OK),
+    "admin": (gen_admin_request, api.OK),
+    "invalid": (gen_invalid_request, api.INVALID_REQUEST),
+}
+
+
+def parse_mix(mix):
+    """ 'score=50,invalid=10' -> [('score', 50), ('invalid', 10)] """
+    weights = []
+    for part in mix.split(","):
+        kind, weight = part.split("=")
+        kind = kind.strip()
+        if kind not in REQUESTS:
+            raise ValueError("Unknown kind of request '%s'. Available: %s" % (kind, ", ".join(REQUESTS)))
+        weights.append((kind, float(weight)))
+    return weights
+
+
+def choose(rnd, weights):
+    point = rnd.uniform(0, sum(w for _, w in weights))
+    for kind, weight in weights:
+        point -= weight
+        if point <= 0:
+            return kind
+    return weights[-1][0]
+
+
+def prepare_requests(mix, count=1000, seed=0):
+    """
+        Pregenerate request bodies, so generation
+        isn't measured by load test.
+    """
+    rnd = random.Random(seed)
+    weights = parse_mix(mix)
+    tokens = {}
+    bodies = []
+    for _ in range(count):
+        kind = choose(rnd, weights)
+        request = REQUESTS[kind][0](rnd)
+        key = (request["login"], request["account"])
+        if key not in tokens:
+            tokens[key] = gen_valid_token(request["login"], request["account"])
+        request["token"] = tokens[key]
+        bodies.append((kind, json.dumps(request)))
+    return bodies
+
+
+##### Load #####
+
+class LoadTest(object):
+    """
+        Sends requests from worker threads.
+        With rate every request has scheduled time and latency
+        is counted from it (queueing delay of client is included).
+    """
+    def __init__(self, url, bodies, concurrency=10, number=None, duration=None,
+                 rate=None, timeout=10, keep_alive=False):
+        parsed = urlparse.urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = parsed.path or "/"
+        self.bodies = bodies
+        self.concurrency = concurrency
+        self.number = number
+        self.duration = duration
+        self.rate = rate
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.samples = []  # (kind, code, latency)
+        self.start_time = None
+        self.stop_time = None
+
+    def next_ticket(self):
+        """ Return (index, scheduled time) of next request or None """
+        with self.lock:
+            index = self.sent
+            if self.number is not None and index >= self.number:
+                return
+            scheduled = time.time()
+            if self.rate:
+                scheduled = self.start_time + index / float(self.rate)
+            if self.duration is not None and scheduled - self.start_time >= self.duration:
+                return
+            self.sent += 1
+            return index, scheduled
+
+    def send(self, conn, body):
+        headers = {"Content-Type": "application/json"}
+        if not self.keep_alive:
+            headers["Connection"] = "close"
+        try:
+            conn.request("POST", self.path, body, headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (socket.error, httplib.HTTPException):
+            conn.close()
+            raise
+        finally:
+            if not self.keep_alive:
+                conn.close()
+
+    def worker(self):
+        samples = []
+        # closed connection is opened again on next request
+        conn = httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        while True:
+            ticket = self.next_ticket()
+            if ticket is None:
+                break
+            index, scheduled = ticket
+            delay = scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            kind, body = self.bodies[index % len(self.bodies)]
+            start = scheduled if self.rate else time.time()
+            try:
+                code = self.send(conn, body)
+            except (socket.error, httplib.HTTPException):
+                code = None
+            samples.append((kind, code, time.time() - start))
+        conn.close()
+        with self.lock:
+            self.samples.extend(samples)
+
+    def run(self):
+        self.start_time = time.time()
+        threads = [threading.Thread(target=self.worker) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.stop_time = time.time()
+        return self.samples
+
+
+##### Statistics #####
+
+def percentile(sorted_values, p):
+    """ Nearest-rank percentile """
+    if not sorted_values:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency * 1000 for _, _, latency in samples)
+    codes = defaultdict(int)
+    errors = 0
+    for kind, code, _ in samples:
+        codes[str(code)] += 1
+        if code != REQUESTS[kind][1]:
+            errors += 1
+
+    summary = {
+        "requests": len(samples),
+        "errors": errors,
+        "codes": dict(codes),
+        "throughput": len(samples) / elapsed if elapsed else 0,
+        "latency_ms": {
+            "min": latencies[0] if latencies else None,
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "max": latencies[-1] if latencies else None,
+        }
+    }
+    for p in PERCENTILES:
+        summary["latency_ms"]["p%s" % p] = percentile(latencies, p)
+    return summary
+
+
+def build_report(samples, elapsed, config):
+    by_kind = defaultdict(list)
+    for sample in samples:
+        by_kind[sample[0]].append(sample)
+    return {
+        "label": config.get("label"),
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "config": config,
+        "elapsed": elapsed,
+        "total": summarize(samples, elapsed),
+        "kinds": dict((kind, summarize(s, elapsed)) for kind, s in by_kind.items()),
+    }
+
+
+def format_row(name, summary):
+    latency = summary["latency_ms"]
+    return "{:<10} {:>8} {:>7} {:>10.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+        name, summary["requests"], summary["errors"], summary["throughput"],
+        latency["mean"] or 0, latency["p50"] or 0, latency["p95"] or 0, latency["p99"] or 0)
+
+
+def print_report(report):
+    print "{:<10} {:>8} {:>7} {:>10} {:>9} {:>9} {:>9} {:>9}".format(
+        "kind", "requests", "errors", "req/s", "mean, ms", "p50, ms", "p95, ms", "p99, ms")
+    for kind in sorted(report["kinds"]):
+        print format_row(kind, report["kinds"][kind])
+    print format_row("total", report["total"])
+
+
+def print_comparison(report, previous):
+    """ Print change of throughput and latency against previous results """
+    print "\nCompared with '%s' (%s):" % (previous.get("label"), previous.get("timestamp"))
+    old, new = previous["total"], report["total"]
+    rows = [("req/s", old["throughput"], new["throughput"])]
+    for p in PERCENTILES:
+        key = "p%s" % p
+        rows.append((key + ", ms", old["latency_ms"][key], new["latency_ms"][key]))
+    for name, old_value, new_value in rows:
+        if not old_value or new_value is None:
+            continue
+        print "{:<10} {:>10.2f} -> {:>10.2f} ({:+.1f}%)".format(
+            name, old_value, new_value, (new_value - old_value) / old_value * 100)
+
+
+##### Servers #####
+
+def get_free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("localhost", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            return
+        except socket.error:
+            time.sleep(0.05)
+    raise RuntimeError("Server at port %s isn't started." % port)
+
+
+def start_servers(server_args, store_args=()):
+    """
+        Start in-memory Redis stand-in and API server in subprocesses.
+        :return: (url, processes)
+    """
+    api_dir = os.path.join(app_dir, "api")
+    redis_port, api_port = get_free_port(), get_free_port()
+    devnull = open(os.devnull, "w")
+    processes = [subprocess.Popen([sys.executable, "memory_redis.py", "--port", str(redis_port)] + list(store_args),
+                                  cwd=api_dir, stdout=devnull, stderr=devnull)]
+    wait_for_port(redis_port)
+
+    # fill interests of clients
+    db = redis.Redis(port=redis_port)
+    rnd = random.Random(0)
+    interests = ["books", "hi-tech", "pets", "tv", "travel", "music", "cinema", "geek", "sport", "cars"]
+    db.mset(dict(("i:%s" % cid, json.dumps(rnd.sample(interests, 3))) for cid in range(CLIENTS_COUNT)))
+
+    processes.append(subprocess.Popen([sys.executable, "api.py", "-p", str(api_port),
+                                       "--store-port", str(redis_port), "-l", os.devnull] + server_args,
+                                      cwd=api_dir, stdout=devnull, stderr=devnull))
+    wait_for_port(api_port)
+    return "http://localhost:%s/method/" % api_port, processes
+
+
+def main(opts):
+    processes = []
+    url = opts.url
+    try:
+        if url is None:
+            store_args = ["--latency", str(opts.store_latency), "--failure-rate", str(opts.store_failure_rate)]
+            url, processes = start_servers(opts.server_args.split() if opts.server_args else [], store_args)
+
+        bodies = prepare_requests(opts.mix, seed=opts.seed)
+        config = {
+            "label": opts.label,
+            "url": url,
+            "mix": opts.mix,
+            "concurrency": opts.concurrency,
+            "number": opts.number,
+            "duration": opts.duration,
+            "rate": opts.rate,
+            "server_args": opts.server_args,
+            "keep_alive": opts.keep_alive,
+        }
+        if opts.warmup:
+            LoadTest(url, bodies, concurrency=opts.concurrency, number=opts.warmup,
+                     keep_alive=opts.keep_alive).run()
+
+        load = LoadTest(url, bodies, concurrency=opts.concurrency, number=opts.number,
+                        duration=opts.duration, rate=opts.rate, keep_alive=opts.keep_alive)
+        samples = load.run()
+        report = build_report(samples, load.stop_time - load.start_time, config)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    print_report(report)
+    if opts.compare:
+        with open(opts.compare) as f:
+            print_comparison(report, json.load(f))
+    if opts.output:
+        with open(opts.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print "\nResults are saved in %s" % opts.output
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("-u", "--url", action="store", default=None,
+                  help="URL of running server (by default servers are started by test)")
+    op.add_option("-c", "--concurrency", action="store", type=int, default=10)
+    op.add_option("-n", "--number", action="store", type=int, default=None,
+                  help="Total number of requests")
+    op.add_option("-d", "--duration", action="store", type=float, default=None,
+                  help="Duration of test in seconds")
+    op.add_option("-r", "--rate", action="store", type=float, default=None,
+                  help="Target rate of requests per second (open loop)")
+    op.add_option("-m", "--mix", action="store", default=DEFAULT_MIX)
+    op.add_option("-w", "--warmup", action="store", type=int, default=100)
+    op.add_option("-s", "--seed", action="store", type=int, default=0)
+    op.add_option("-o", "--output", action="store", default=None, help="Save results in JSON file")
+    op.add_option("-l", "--label", action="store", default=None, help="Label of results (version)")
+    op.add_option("--compare", action="store", default=None, help="Compare with results from JSON file")
+    op.add_option("--server-args", action="store", default="", help="Extra arguments of api.py")
+    op.add_option("--keep-alive", action="store_true", default=False, help="Use persistent connections")
+    op.add_option("--store-latency", action="store", type=float, default=0,
+                  help="Latency of in-memory Redis stand-in in seconds")
+    op.add_option("--store-failure-rate", action="store", type=float, default=0.0,
+                  help="Probability of failed command of in-memory Redis stand-in")
+    (opts, args) = op.parse_args()
+    if opts.number is None and opts.duration is None:
+        opts.number = 1000
+    main(opts)
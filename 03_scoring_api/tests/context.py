@@ -11,6 +11,10 @@ app_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, os.path.join(app_dir, 'api'))
 
 import api
+import interests
+import limits
+import memory_redis
+import metrics
 import scoring
 import store
 
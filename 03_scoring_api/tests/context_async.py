@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    Context for tests of asyncio storage backend.
+    Doesn't import 'api' module, which works only with Python 2.
+"""
+
+import os
+import sys
+import logging
+
+logging.disable(logging.ERROR)
+
+app_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(app_dir, 'api'))
+
+import memory_redis
+
+if sys.version_info >= (3, 6):
+    import async_scoring
+    import async_store
+else:
+    async_scoring = None
+    async_store = None
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import httplib
+import json
+import socket
+import threading
+import unittest
+
+import context_functional
+from context import api, limits, store
+from utils import cases, gen_valid_token, MockRedisConnection
+
+
+class TestJSONSerializer(unittest.TestCase):
+    @cases([
+        (False, False),
+        (False, True),
+        (True, False),
+        (True, True),
+    ])
+    def test_dumps_and_loads(self, use_ujson, sort_keys):
+        serializer = api.JSONSerializer(use_ujson=use_ujson, sort_keys=sort_keys)
+        data = {"code": 422, "error": {"first_name": u"Значение"}, "list": [1, 2.5, None]}
+        encoded = serializer.dumps(data)
+        self.assertIsInstance(encoded, str)
+        self.assertIn(u"Значение".encode('utf8'), encoded)
+        self.assertEqual(serializer.loads(encoded), data)
+        if sort_keys:
+            self.assertTrue(encoded.index('"code"') < encoded.index('"error"') < encoded.index('"list"'))
+
+    def test_invalid_json(self):
+        for use_ujson in (False, True):
+            serializer = api.JSONSerializer(use_ujson=use_ujson)
+            with self.assertRaises(ValueError):
+                serializer.loads('{"key": ')
+
+
+class TestMainHTTPHandler(unittest.TestCase):
+    """
+        Requests to MainHTTPHandler served in background thread.
+    """
+    @classmethod
+    def setUpClass(cls):
+        class Handler(api.MainHTTPHandler):
+            store = store.Storage(MockRedisConnection, {})
+            metrics = api.APIMetrics()
+            max_body_size = 1024
+            max_keep_alive_requests = 3
+
+            def log_message(self, format, *args):
+                pass
+
+        cls.server = api.ThreadingHTTPServer(("localhost", 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.conn = httplib.HTTPConnection(*self.server.server_address, timeout=5)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def post(self, body, path="/method/", headers=None):
+        self.conn.putrequest("POST", path)
+        for k, v in (headers or {"Content-Length": len(body)}).items():
+            self.conn.putheader(k, v)
+        self.conn.endheaders()
+        self.conn.send(body)
+        response = self.last_response = self.conn.getresponse()
+        data = response.read()
+        self.assertEqual(int(response.getheader("Content-Length")), len(data))
+        return response.status, json.loads(data)
+
+    def test_ok_request(self):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+                   "token": gen_valid_token("h&f", "horns&hoofs"),
+                   "arguments": {"first_name": u"Имя", "last_name": "b"}}
+        code, data = self.post(json.dumps(request))
+        self.assertEqual(code, api.OK)
+        self.assertEqual(data, {"code": api.OK, "response": {"score": 0.5}})
+
+    def test_invalid_json(self):
+        code, data = self.post('{"account": ')
+        self.assertEqual(code, api.BAD_REQUEST)
+        self.assertEqual(data, {"code": api.BAD_REQUEST, "error": api.ERRORS[api.BAD_REQUEST]})
+
+    def test_unknown_path(self):
+        code, data = self.post('{"account": "horns&hoofs"}', path="/unknown/")
+        self.assertEqual(code, api.NOT_FOUND)
+
+    @cases([
+        {},
+        {"Content-Length": "abc"},
+        {"Content-Length": "-1"},
+    ])
+    def test_invalid_content_length(self, headers):
+        code, data = self.post('', headers=headers)
+        self.assertEqual(code, api.BAD_REQUEST)
+
+    def test_metrics(self):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests",
+                   "token": gen_valid_token("h&f", "horns&hoofs"), "arguments": {"client_ids": [1]}}
+        self.post(json.dumps(request))
+        self.post(json.dumps(dict(request, method="unknown")))
+
+        self.conn.request("GET", "/metrics")
+        response = self.conn.getresponse()
+        data = response.read()
+        self.assertEqual(response.status, api.OK)
+        self.assertTrue(response.getheader("Content-Type").startswith("text/plain; version=0.0.4"))
+        lines = data.split("\n")
+        self.assertIn('scoring_api_requests_total{method="clients_interests",code="200"} 1.0', lines)
+        self.assertIn('scoring_api_requests_total{method="unknown",code="404"} 1.0', lines)
+        for phase in ("read", "decode", "validation", "auth", "store", "scoring", "encode", "write"):
+            self.assertIn('scoring_api_phase_duration_seconds_count'
+                          '{method="clients_interests",phase="%s"} 1.0' % phase, lines)
+
+    @cases([{}, [1]])
+    def test_unhashable_method(self, method):
+        # cases share connection, limit of requests per connection isn't reached
+        self.conn.close()
+        request = {"account": "horns&hoofs", "login": "h&f", "method": method,
+                   "token": gen_valid_token("h&f", "horns&hoofs"), "arguments": {}}
+        code, data = self.post(json.dumps(request))
+        self.assertEqual(code, api.INVALID_REQUEST)
+        # handler isn't failed, so connection is kept alive and metrics are recorded
+        sock = self.conn.sock
+        self.assertIsNotNone(sock)
+        self.conn.request("GET", "/metrics")
+        response = self.conn.getresponse()
+        lines = response.read().split("\n")
+        self.assertIs(self.conn.sock, sock)
+        self.assertTrue(any(line.startswith('scoring_api_requests_total{method="unknown",code="%s"}'
+                                            % api.INVALID_REQUEST) for line in lines))
+
+    def test_get_unknown_path(self):
+        self.conn.request("GET", "/method/")
+        response = self.conn.getresponse()
+        response.read()
+        self.assertEqual(response.status, api.NOT_FOUND)
+
+    def test_too_large_body(self):
+        body = json.dumps({"account": "a" * 2048})
+        code, data = self.post(body)
+        self.assertEqual(code, api.REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(data["error"], api.ERRORS[api.REQUEST_ENTITY_TOO_LARGE])
+        # body isn't read, so connection is closed
+        self.assertIsNone(self.conn.sock)
+
+    def test_rate_limit(self):
+        body = self.get_request_body()
+        api.rate_limiter = limits.RateLimiter(rate=0.5, burst=1)
+        try:
+            self.assertEqual(self.post(body)[0], api.OK)
+            code, data = self.post(body)
+        finally:
+            api.rate_limiter = None
+        self.assertEqual(code, api.TOO_MANY_REQUESTS)
+        self.assertEqual(data["error"], api.ERRORS[api.TOO_MANY_REQUESTS])
+        self.assertEqual(self.last_response.getheader("Retry-After"), "2")
+
+    def test_concurrency_limit(self):
+        limiter = limits.ConcurrencyLimiter(1, retry_after=3)
+        self.server.RequestHandlerClass.concurrency_limiter = limiter
+        try:
+            self.assertEqual(self.post(self.get_request_body())[0], api.OK)
+            self.assertEqual(limiter.active, 0)
+            limiter.acquire()
+            code, data = self.post(self.get_request_body())
+        finally:
+            self.server.RequestHandlerClass.concurrency_limiter = None
+        self.assertEqual(code, api.SERVICE_UNAVAILABLE)
+        self.assertEqual(self.last_response.getheader("Retry-After"), "3")
+        self.assertEqual(limiter.rejected, 1)
+        # body isn't read, so connection is closed
+        self.assertIsNone(self.conn.sock)
+
+    def get_request_body(self):
+        return json.dumps({"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+                           "token": gen_valid_token("h&f", "horns&hoofs"),
+                           "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}})
+
+    def test_keep_alive(self):
+        body = self.get_request_body()
+        self.assertEqual(self.post(body)[0], api.OK)
+        sock = self.conn.sock
+        self.assertIsNotNone(sock)
+        self.assertEqual(self.post(body)[0], api.OK)
+        self.assertIs(self.conn.sock, sock)
+        # the last request of connection
+        self.assertEqual(self.post(body)[0], api.OK)
+        self.assertIsNone(self.conn.sock)
+        # httplib reconnects
+        self.assertEqual(self.post(body)[0], api.OK)
+        self.assertIsNotNone(self.conn.sock)
+
+    def test_client_closes_connection(self):
+        body = self.get_request_body()
+        self.post(body, headers={"Content-Length": len(body), "Connection": "close"})
+        self.assertIsNone(self.conn.sock)
+
+    def read_raw_responses(self, requests, count):
+        sock = socket.create_connection(self.server.server_address, timeout=5)
+        try:
+            sock.sendall("".join(requests))
+            responses = []
+            rfile = sock.makefile("rb")
+            for _ in range(count):
+                status = int(rfile.readline().split()[1])
+                headers = httplib.HTTPMessage(rfile, 0)
+                data = rfile.read(int(headers["Content-Length"]))
+                responses.append((status, headers.get("Connection"), data))
+            self.assertEqual(rfile.read(), "")  # connection is closed by server
+            return responses
+        finally:
+            sock.close()
+
+    def test_pipelining(self):
+        body = self.get_request_body()
+        request = ("POST /method/ HTTP/1.1\r\nHost: localhost\r\n"
+                   "Content-Length: %s\r\n\r\n%s" % (len(body), body))
+        responses = self.read_raw_responses([request] * 3, 3)
+        self.assertEqual([r[0] for r in responses], [api.OK] * 3)
+        self.assertEqual([r[1] for r in responses], [None, None, "close"])
+        for response in responses:
+            self.assertEqual(json.loads(response[2])["response"], {"score": 3.0})
+
+    def test_http10_keep_alive(self):
+        body = self.get_request_body()
+        request = ("POST /method/ HTTP/1.0\r\nConnection: keep-alive\r\n"
+                   "Content-Length: %s\r\n\r\n%s" % (len(body), body))
+        close = request.replace("keep-alive", "close")
+        responses = self.read_raw_responses([request, close], 2)
+        self.assertEqual([r[1] for r in responses], ["keep-alive", "close"])
+
+
+if __name__ == "__main__":
+    unittest.main()
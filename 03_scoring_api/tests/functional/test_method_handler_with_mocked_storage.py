@@ -8,7 +8,7 @@ import requests
 import unittest
 
 import context_functional
-from context import api, store
+from context import api, limits, store
 from utils import cases, MockRedisConnection
 
 
@@ -63,6 +63,13 @@ class TestMethodHandler(unittest.TestCase):
         self.assertEqual(api.INVALID_REQUEST, code)
         self.assertTrue(len(response))
 
+    def test_unknown_method(self):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "unknown", "arguments": {}}
+        self.set_valid_auth(request)
+        response, code = self.get_response(request)
+        self.assertEqual(api.NOT_FOUND, code)
+        self.assertTrue(len(response))
+
     @cases([
         {},
         {"phone": "79175002040"},
@@ -104,6 +111,21 @@ class TestMethodHandler(unittest.TestCase):
         self.assertTrue(isinstance(score, (int, float)) and score >= 0, arguments)
         self.assertEqual(sorted(self.context["has"]), sorted(arguments.keys()))
 
+    @cases([
+        ({"phone": "79175002040", "email": "stupnikov@otus.ru"}, "h&f",
+         ["auth", "scoring", "store", "validation"]),
+        ({"phone": "79175002040", "email": "stupnikov@otus.ru"}, api.ADMIN_LOGIN,
+         ["auth", "scoring", "validation"]),
+        ({"phone": "79175002040"}, "h&f", ["auth", "validation"]),
+    ])
+    def test_timings_of_phases_in_context(self, arguments, login, phases):
+        self.context = {}
+        request = {"account": "horns&hoofs", "login": login, "method": "online_score", "arguments": arguments}
+        self.set_valid_auth(request)
+        self.get_response(request)
+        self.assertEqual(sorted(self.context["timings"]), phases)
+        self.assertTrue(all(t >= 0 for t in self.context["timings"].values()))
+
     def test_ok_score_admin_request(self):
         arguments = {"phone": "79175002040", "email": "stupnikov@otus.ru"}
         request = {"account": "horns&hoofs", "login": "admin", "method": "online_score", "arguments": arguments}
@@ -143,6 +165,120 @@ class TestMethodHandler(unittest.TestCase):
                         for v in response.values()))
         self.assertEqual(self.context.get("nclients"), len(arguments["client_ids"]))
 
+    def get_batch_request(self, requests, login="h&f"):
+        request = {"account": "horns&hoofs", "login": login, "method": "batch",
+                   "arguments": {"requests": requests}}
+        self.set_valid_auth(request)
+        return request
+
+    @cases([
+        {},
+        {"requests": []},
+        {"requests": {"method": "online_score"}},
+        {"requests": [{"method": "online_score", "arguments": {}}] * (api.MAX_BATCH_SIZE + 1)},
+    ])
+    def test_invalid_batch_request(self, arguments):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "batch", "arguments": arguments}
+        self.set_valid_auth(request)
+        response, code = self.get_response(request)
+        self.assertEqual(api.INVALID_REQUEST, code)
+        self.assertTrue(len(response))
+
+    def test_ok_batch_request(self):
+        requests = [
+            {"method": "online_score", "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}},
+            {"method": "clients_interests", "arguments": {"client_ids": [1, 2]}},
+            {"method": "online_score", "arguments": {"first_name": "a", "last_name": "b"}},
+        ]
+        response, code = self.get_response(self.get_batch_request(requests))
+        self.assertEqual(api.OK, code)
+        self.assertEqual([r["code"] for r in response], [api.OK] * 3)
+        self.assertEqual(response[0]["response"], {"score": 3.0})
+        self.assertEqual(response[1]["response"], {1: self.clients[1], 2: self.clients[2]})
+        self.assertEqual(response[2]["response"], {"score": 0.5})
+        self.assertEqual(self.context["nrequests"], 3)
+        self.assertEqual(sorted(self.context["batch"][0]["has"]), ["email", "phone"])
+        self.assertEqual(self.context["batch"][1]["nclients"], 2)
+
+    def test_batch_request_items_validated_independently(self):
+        requests = [
+            {"method": "online_score", "arguments": {"phone": "79175002040"}},
+            {"method": "clients_interests", "arguments": {"client_ids": [0]}},
+            {"method": "unknown", "arguments": {}},
+            {"method": "batch", "arguments": {"requests": []}},
+            {"arguments": {}},
+            "online_score",
+        ]
+        response, code = self.get_response(self.get_batch_request(requests))
+        self.assertEqual(api.OK, code)
+        self.assertEqual([r["code"] for r in response],
+                         [api.INVALID_REQUEST, api.OK, api.NOT_FOUND,
+                          api.NOT_FOUND, api.INVALID_REQUEST, api.INVALID_REQUEST])
+        self.assertEqual(response[1]["response"], {0: self.clients[0]})
+        for r in response[:1] + response[2:]:
+            self.assertTrue(len(r["error"]))
+
+    def test_batch_request_coalesces_storage_reads(self):
+        requests = [
+            {"method": "clients_interests", "arguments": {"client_ids": [0, 1, 2]}},
+            {"method": "clients_interests", "arguments": {"client_ids": [3, 4]}},
+            {"method": "online_score", "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}},
+            {"method": "online_score", "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}},
+        ]
+        self.store.db.clean()
+        for cid, interest in self.clients.items():
+            self.store.set("i:%s" % cid, json.dumps(interest))
+
+        response, code = self.get_response(self.get_batch_request(requests))
+        self.assertEqual(api.OK, code)
+        self.assertEqual([r["code"] for r in response], [api.OK] * 4)
+        # one read for interests and one for scores, no reads per key
+        self.assertEqual(self.store.db.mget_counter, 2)
+        self.assertEqual(self.store.db.get_counter, 0)
+        # equal scores are calculated and cached once
+        self.assertEqual(self.store.db.set_counter, len(self.clients) + 1)
+
+    def test_batch_request_admin(self):
+        requests = [{"method": "online_score", "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}}]
+        response, code = self.get_response(self.get_batch_request(requests, login=api.ADMIN_LOGIN))
+        self.assertEqual(api.OK, code)
+        self.assertEqual(response, [{"code": api.OK, "response": {"score": 42}}])
+
+    def test_rate_limit(self):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+                   "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}}
+        self.set_valid_auth(request)
+        api.rate_limiter = limits.RateLimiter(rate=1, burst=2)
+        try:
+            codes = [self.get_response(request)[1] for _ in range(3)]
+            other_client = dict(request, login="other")
+            self.set_valid_auth(other_client)
+            _, other_code = self.get_response(other_client)
+        finally:
+            api.rate_limiter = None
+        self.assertEqual(codes, [api.OK, api.OK, api.TOO_MANY_REQUESTS])
+        self.assertEqual(other_code, api.OK)
+        self.assertGreater(self.context["retry_after"], 0)
+
+    def test_rate_limit_of_batch(self):
+        item = {"method": "online_score", "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}}
+        single = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+                  "arguments": item["arguments"]}
+        self.set_valid_auth(single)
+        api.rate_limiter = limits.RateLimiter(rate=1, burst=3)
+        try:
+            # every request of batch takes token
+            _, batch_code = self.get_response(self.get_batch_request([item] * 3))
+            _, single_code = self.get_response(single)
+            # batch longer than burst isn't admitted
+            api.rate_limiter = limits.RateLimiter(rate=1, burst=3)
+            _, long_batch_code = self.get_response(self.get_batch_request([item] * 4))
+        finally:
+            api.rate_limiter = None
+        self.assertEqual(batch_code, api.OK)
+        self.assertEqual(single_code, api.TOO_MANY_REQUESTS)
+        self.assertEqual(long_batch_code, api.TOO_MANY_REQUESTS)
+
 
 if __name__ == "__main__":
     unittest.main()
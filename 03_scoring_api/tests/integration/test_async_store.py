@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import socket
+import unittest
+
+import context_integration
+from context_async import async_scoring, async_store, memory_redis
+
+"""
+    Tests of asyncio storage backend with in-memory Redis stand-in.
+    Require Python 3.6+:
+
+        cd tests/integration
+        python3 -m unittest -v test_async_store
+"""
+
+
+@unittest.skipIf(async_store is None, "Asyncio storage backend requires Python 3.6+.")
+class TestAsyncStorage(unittest.TestCase):
+    def setUp(self):
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = memory_redis.MemoryRedisServer().start()
+        self.config = {
+            'host': self.server.host,
+            'port': self.server.port,
+            'db': 1,
+            'password': None,
+            'timeout': 1,
+            'retry': 2,
+            'backoff_factor': 0.01,
+            'max_connections': 2,
+        }
+        self.store = self.get_storage(self.config)
+        self.keyspace = self.server.databases[1]
+
+    def tearDown(self):
+        import asyncio
+        self.run_async(self.store.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.server.stop()
+
+    def get_storage(self, config):
+        return async_store.AsyncStorage(async_store.AsyncRedisConnection, config)
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_get_method(self):
+        self.keyspace.set(b'key', b'value')
+        self.assertEqual(self.run_async(self.store.get('key')), b'value')
+        self.assertIsNone(self.run_async(self.store.get('missing')))
+
+    def test_set_method(self):
+        self.assertTrue(self.run_async(self.store.set('key', 880)))
+        self.assertEqual(self.keyspace.get(b'key'), b'880')
+        self.assertEqual(self.keyspace.ttl(b'key'), -1)
+
+    def test_get_many_method(self):
+        self.keyspace.set(b'a', b'1')
+        self.keyspace.set(b'c', u'значение'.encode('utf8'))
+        self.assertEqual(self.run_async(self.store.get_many(['a', 'b', 'c'])),
+                         [b'1', None, u'значение'.encode('utf8')])
+        self.assertEqual(self.run_async(self.store.get_many([])), [])
+
+    def test_cache_methods(self):
+        self.run_async(self.store.cache_set('key', 2.5, 60))
+        self.assertEqual(self.keyspace.ttl(b'key'), 60)
+        self.assertEqual(self.run_async(self.store.cache_get('key')), b'2.5')
+        self.assertEqual(self.run_async(self.store.cache_get_many(['key', 'none'])), [b'2.5', None])
+
+    def test_password(self):
+        self.server.password = 'secret'
+        config = dict(self.config, password='secret')
+        store = self.get_storage(config)
+        self.assertTrue(self.run_async(store.set('key', 'value')))
+        self.run_async(store.close())
+
+        config['password'] = 'wrong'
+        store = self.get_storage(config)
+        with self.assertRaises(async_store.RedisResponseError):
+            self.run_async(store.get('key'))
+        self.run_async(store.close())
+
+    def test_pool_is_bounded_and_reused(self):
+        import asyncio
+        self.keyspace.set(b'key', b'value')
+
+        many_gets = asyncio.gather(*[self.store.get('key') for _ in range(50)])
+        self.assertEqual(self.run_async(many_gets), [b'value'] * 50)
+        self.assertLessEqual(self.store.db.pool.size, self.config['max_connections'])
+        self.assertGreater(self.store.db.pool.size, 0)
+
+    def test_retry_and_fail_when_server_is_down(self):
+        self.server.stop()
+        with self.assertRaises(async_store.RedisConnectionError):
+            self.run_async(self.store.get('key'))
+        with self.assertRaises(async_store.RedisConnectionError):
+            self.run_async(self.store.set('key', 'value'))
+        # cache methods don't raise
+        self.assertIsNone(self.run_async(self.store.cache_get('key')))
+        self.assertEqual(self.run_async(self.store.cache_get_many(['a', 'b'])), [None, None])
+        self.assertIsNone(self.run_async(self.store.cache_set('key', 1, 60)))
+        self.server = memory_redis.MemoryRedisServer().start()
+
+    def test_timeout(self):
+        # server accepts connections but never answers
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('localhost', 0))
+        sock.listen(5)
+        config = dict(self.config, port=sock.getsockname()[1], db=0, timeout=0.1, retry=1)
+        store = self.get_storage(config)
+        try:
+            with self.assertRaises(async_store.RedisTimeoutError):
+                self.run_async(store.get('key'))
+            self.assertIsNone(self.run_async(store.cache_get('key')))
+        finally:
+            self.run_async(store.close())
+            sock.close()
+
+    def test_handshake_timeout(self):
+        # connection is opened at once, AUTH and SELECT are answered too late
+        self.server.password = 'secret'
+        self.server.latency = 0.3
+        config = dict(self.config, password='secret', timeout=0.1, retry=1)
+        store = self.get_storage(config)
+        try:
+            with self.assertRaises(async_store.RedisTimeoutError):
+                self.run_async(store.get('key'))
+            self.assertIsNone(self.run_async(store.cache_get('key')))
+            self.assertEqual(store.db.pool.size, 0)
+        finally:
+            self.run_async(store.close())
+            self.server.latency = 0
+
+
+@unittest.skipIf(async_store is None, "Asyncio storage backend requires Python 3.6+.")
+class TestAsyncScoring(unittest.TestCase):
+    def setUp(self):
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = memory_redis.MemoryRedisServer().start()
+        config = {'host': self.server.host, 'port': self.server.port, 'timeout': 1}
+        self.store = async_store.AsyncStorage(async_store.AsyncRedisConnection, config)
+        self.keyspace = self.server.databases[0]
+
+    def tearDown(self):
+        import asyncio
+        self.run_async(self.store.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.server.stop()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_get_score_is_cached(self):
+        birthday = datetime.datetime(2000, 1, 1)
+        score = self.run_async(async_scoring.get_score(self.store, phone="79175002040",
+                                                       email="stupnikov@otus.ru",
+                                                       birthday=birthday, gender=1))
+        self.assertEqual(score, 4.5)
+        self.assertEqual(len(self.keyspace), 1)
+
+        # score is taken from cache
+        self.keyspace.set(list(self.keyspace.data)[0], b'10')
+        score = self.run_async(async_scoring.get_score(self.store, phone="79175002040",
+                                                       email="stupnikov@otus.ru",
+                                                       birthday=birthday, gender=1))
+        self.assertEqual(score, 10.0)
+
+    def test_get_interests(self):
+        self.keyspace.set(b'i:1', json.dumps(['books', 'hi-tech']).encode('utf8'))
+        self.assertEqual(self.run_async(async_scoring.get_interests(self.store, 1)), ['books', 'hi-tech'])
+        self.assertEqual(self.run_async(async_scoring.get_interests(self.store, 2)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import redis
+import unittest
+
+import context_integration
+from context import interests, memory_redis, scoring, store
+
+"""
+    Migration of interests to compact encoding with in-memory Redis stand-in
+"""
+
+
+class TestMigration(unittest.TestCase):
+    def setUp(self):
+        self.server = memory_redis.MemoryRedisServer().start()
+        self.client = redis.Redis(host=self.server.host, port=self.server.port)
+        self.interests = {}
+        names = ["books", "hi-tech", "pets", "tv", "travel", "music", u"кино"]
+        for cid in range(25):
+            self.interests[cid] = [names[(cid + i) % len(names)] for i in range(cid % 4)]
+            self.client.set("i:%s" % cid, json.dumps(self.interests[cid]))
+        self.client.set("uid:123", "3.0")
+
+    def tearDown(self):
+        self.server.stop()
+
+    def get_storage(self):
+        config = {'host': self.server.host, 'port': self.server.port, 'retry': 0}
+        return store.Storage(store.RedisConnection, config)
+
+    def test_migrate(self):
+        dictionary = interests.InterestsDictionary()
+        total, migrated, before, after = interests.migrate(self.client, dictionary, batch_size=10)
+        self.assertEqual(total, 25)
+        self.assertEqual(migrated, 25)
+        self.assertTrue(after < before)
+        self.assertEqual(self.client.get("uid:123"), b"3.0")
+        for cid in range(25):
+            self.assertTrue(interests.is_compact(self.client.get("i:%s" % cid)))
+
+        # new reader loads saved dictionary
+        storage = self.get_storage()
+        reader = interests.InterestsDictionary()
+        for cid, names in self.interests.items():
+            self.assertEqual(scoring.get_interests(storage, cid, reader), names)
+
+        # the second run doesn't change anything
+        self.assertEqual(interests.migrate(self.client, dictionary, batch_size=10)[:2], [25, 0])
+
+    def test_dry_run(self):
+        dictionary = interests.InterestsDictionary()
+        total, migrated, before, after = interests.migrate(self.client, dictionary, dry_run=True)
+        self.assertEqual((total, migrated), (25, 25))
+        self.assertIsNone(self.client.get(interests.DICTIONARY_KEY))
+        self.assertEqual(json.loads(self.client.get("i:3")), self.interests[3])
+
+    def test_update_during_migration_is_kept(self):
+        client, read_value = self.client, self.interests[3]
+
+        class UpdatingDictionary(interests.InterestsDictionary):
+            """ Client updates value after it's read by migration """
+            updated = False
+
+            def add(self, names):
+                if names == read_value and not self.updated:
+                    client.set("i:3", json.dumps(["updated"]))
+                    self.updated = True
+                return super(UpdatingDictionary, self).add(names)
+
+        dictionary = UpdatingDictionary()
+        total, migrated, before, after = interests.migrate(client, dictionary, batch_size=10)
+        self.assertEqual((total, migrated), (25, 25))
+        self.assertTrue(interests.is_compact(client.get("i:3")))
+        reader = interests.InterestsDictionary()
+        self.assertEqual(scoring.get_interests(self.get_storage(), 3, reader), ["updated"])
+        self.assertEqual(scoring.get_interests(self.get_storage(), 4, reader), self.interests[4])
+
+    def test_key_changed_on_every_attempt_is_skipped(self):
+        client = self.client
+
+        class UpdatingDictionary(interests.InterestsDictionary):
+            def add(self, names):
+                client.set("i:3", json.dumps(["updated"]))
+                return super(UpdatingDictionary, self).add(names)
+
+        total, migrated, before, after = interests.migrate(client, UpdatingDictionary(), batch_size=10)
+        self.assertEqual((total, migrated), (25, 24))
+        self.assertEqual(json.loads(client.get("i:3")), ["updated"])
+        self.assertTrue(interests.is_compact(client.get("i:4")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,31 +9,43 @@ import unittest
 
 
 import context_integration
-from context import store, STORE_CONFIG
+from context import memory_redis, store, STORE_CONFIG
 from utils import cases, connect_failer
 
 """
-    BEFORE RUNNING THIS TEST YOU HAVE TO RUN REDIS SERVER
-
-    Config the following parameters in your Environment Variable
-    for correct connection with Redis server:
+    For running tests with Redis server config the following parameters
+    in your Environment Variable:
 
         REDIS_HOST – Requared
         REDIS_PORT
         REDIS_PASSWORD
+
+    Otherwise in-memory Redis stand-in (api/memory_redis.py) is started.
 """
 
+REDIS_CONFIG = dict(STORE_CONFIG)
+server = None
+
+
+def setUpModule():
+    global server
+    if not STORE_CONFIG:
+        server = memory_redis.MemoryRedisServer().start()
+        REDIS_CONFIG.update(host=server.host, port=server.port, db=0, password=None)
+
+
+def tearDownModule():
+    if server is not None:
+        server.stop()
+
 
-@unittest.skipIf(not STORE_CONFIG,
-                 "Address of Redis server "
-                 "doesn't set in environment variables.")
 class TestStorage(unittest.TestCase):
     def setUp(self):
         config = {
-            'host': STORE_CONFIG['host'],
-            'port': STORE_CONFIG['port'],
-            'db': STORE_CONFIG['db'],
-            'password': STORE_CONFIG['password'],
+            'host': REDIS_CONFIG['host'],
+            'port': REDIS_CONFIG['port'],
+            'db': REDIS_CONFIG['db'],
+            'password': REDIS_CONFIG['password'],
             'timeout': 1,
             'retry': 2,
             'backoff_factor': 0.01,
@@ -93,6 +105,13 @@ class TestStorage(unittest.TestCase):
         self.store.cache_set(self.get_key(key), value)
         self.assertEqual(self.redis.get(self.get_key(key)), str(value))
 
+    def test_cache_set_many_method(self):
+        items = [(self.get_key('many1'), 'value1', None), (self.get_key('many2'), 42, 10)]
+        self.assertTrue(self.store.cache_set_many(items))
+        self.assertEqual(self.redis.get(self.get_key('many1')), 'value1')
+        self.assertEqual(self.redis.get(self.get_key('many2')), '42')
+        self.assertEqual(self.redis.ttl(self.get_key('many2')), 10)
+
     @cases([
         ('test_key', 'test_value', 1),
     ])
@@ -110,9 +129,6 @@ class TestStorage(unittest.TestCase):
         )
 
 
-@unittest.skipIf(not STORE_CONFIG,
-                 "Address of Redis server "
-                 "doesn't set in environment variables.")
 class TestRedisConnectionRetry(unittest.TestCase):
     """
         Test case:
@@ -121,10 +137,10 @@ class TestRedisConnectionRetry(unittest.TestCase):
 
     def setUp(self):
         self.config = config = {
-            'host': STORE_CONFIG['host'],
-            'port': STORE_CONFIG['port'],
-            'db': STORE_CONFIG['db'],
-            'password': STORE_CONFIG['password'],
+            'host': REDIS_CONFIG['host'],
+            'port': REDIS_CONFIG['port'],
+            'db': REDIS_CONFIG['db'],
+            'password': REDIS_CONFIG['password'],
             'timeout': 1,
             'retry': 2,
             'backoff_factor': 0.01,
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import time
+import unittest
+
+import context_unit
+from context import api
+from utils import cases, gen_valid_token
+
+
+class TestAuthCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = api.AuthCache(max_size=3)
+        self.now = time.time()
+
+    def test_get_missing_key(self):
+        self.assertFalse(self.cache.get(('a', 'l', 't'), self.now))
+
+    def test_get_added_key(self):
+        self.cache.add(('a', 'l', 't'))
+        self.assertTrue(self.cache.get(('a', 'l', 't'), self.now))
+
+    def test_expired_key(self):
+        self.cache.add(('a', 'l', 't'), expires=self.now + 10)
+        self.assertTrue(self.cache.get(('a', 'l', 't'), self.now))
+        self.assertFalse(self.cache.get(('a', 'l', 't'), self.now + 10))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_bounded_size_evicts_least_recently_used(self):
+        for i in range(3):
+            self.cache.add(('a', 'l', str(i)))
+        self.assertTrue(self.cache.get(('a', 'l', '0'), self.now))
+        self.cache.add(('a', 'l', '3'))
+        self.assertEqual(len(self.cache), 3)
+        self.assertTrue(self.cache.get(('a', 'l', '0'), self.now))
+        self.assertFalse(self.cache.get(('a', 'l', '1'), self.now))
+
+
+class TestCheckAuth(unittest.TestCase):
+    def setUp(self):
+        self.cache = api.AuthCache()
+
+    def get_method_request(self, login, account, token=None):
+        if token is None:
+            token = gen_valid_token(login, account)
+        request = api.MethodRequest({"account": account, "login": login, "token": token,
+                                     "method": "online_score", "arguments": {}})
+        self.assertTrue(request.is_valid())
+        return request
+
+    @cases([
+        ("h&f", "horns&hoofs"),
+        ("h&f", ""),
+        (api.ADMIN_LOGIN, "horns&hoofs"),
+    ])
+    def test_valid_token_is_cached(self, login, account):
+        cache = api.AuthCache()
+        request = self.get_method_request(login, account)
+        self.assertTrue(api.check_auth(request, cache=cache))
+        self.assertEqual(len(cache), 1)
+        self.assertTrue(api.check_auth(request, cache=cache))
+        self.assertEqual(len(cache), 1)
+
+    @cases([
+        ("h&f", "horns&hoofs", ""),
+        ("h&f", "horns&hoofs", "sdd"),
+        (api.ADMIN_LOGIN, "horns&hoofs", "sdd"),
+        ("h&f", "horns&hoofs", u"токен"),
+    ])
+    def test_invalid_token_isnt_cached(self, login, account, token):
+        request = self.get_method_request(login, account, token)
+        self.assertFalse(api.check_auth(request, cache=self.cache))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_admin_token_expires_at_next_hour(self):
+        request = self.get_method_request(api.ADMIN_LOGIN, "horns&hoofs")
+        self.assertTrue(api.check_auth(request, cache=self.cache))
+        key = (request.account, request.login, request.token)
+        expires = self.cache.entries[key]
+        self.assertEqual(datetime.datetime.fromtimestamp(expires).strftime("%M%S"), "0000")
+        self.assertTrue(0 < expires - time.time() <= 60 * 60)
+
+    def test_check_auth_without_cache(self):
+        request = self.get_method_request("h&f", "horns&hoofs")
+        self.assertTrue(api.check_auth(request, cache=None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -311,6 +311,19 @@ class TestPhoneField(unittest.TestCase):
         with self.assertRaisesRegexp(api.ValidationError, regex_msg):
             field.validate(value)
 
+    @cases([
+        u'7\u0661\u0662\u0663\u0664\u0665\u0666\u0667\u0668\u0669\u0660',  # Arabic-Indic digits
+        u'7123456789\xb2',
+        u'712345678\n0',
+        '7917500204\n',
+        u'7123456789\n',
+    ])
+    def test_validation_non_ascii_digits(self, value):
+        field = self.test_field(required=False, nullable=True)
+        with self.assertRaisesRegexp(api.ValidationError, r"String must contain only characters of numbers\."):
+            field.validate(value)
+
+
 class TestDateField(unittest.TestCase):
     def setUp(self):
         self.test_field = api.DateField
@@ -360,7 +373,9 @@ class TestDateField(unittest.TestCase):
         'aa.bb.cccc',
         u'7.6.2011',
         u'1995-3-4'
-        u'02.O5.2000'
+        u'02.O5.2000',
+        '01.01.2000\n',
+        u'01.01.2000\n',
     ])
     def test_validation_invalid_format(self, value):
         field = self.test_field(required=False, nullable=True)
@@ -397,6 +412,19 @@ class TestDateField(unittest.TestCase):
         field = self.test_field(required=False, nullable=True)
         self.assertIsInstance(field.clean(value), datetime)
 
+    @cases([
+        "10.10.2000",
+        u"29.02.2016",
+    ])
+    def test_clean_uses_validated_value(self, value):
+        field = self.test_field(required=False, nullable=True)
+        field.validate(value)
+        date = field.clean(value)
+        self.assertEqual(date, datetime.strptime(value, '%d.%m.%Y'))
+        self.assertIs(field.clean(value), date)
+        # other value is parsed again
+        self.assertEqual(field.clean("01.01.2001"), datetime(2001, 1, 1))
+
 
 class TestBirthDayField(unittest.TestCase):
     def setUp(self):
@@ -442,6 +470,30 @@ class TestBirthDayField(unittest.TestCase):
         with self.assertRaisesRegexp(api.ValidationError, regex_msg):
             field.validate(value)
 
+    @cases([
+        '01.01.2000\n',
+        u'01.01.1990\n',
+    ])
+    def test_validation_trailing_newline(self, value):
+        field = self.test_field(required=False, nullable=True)
+        with self.assertRaisesRegexp(api.ValidationError, r"Value format must be DD\.MM\.YYYY"):
+            field.validate(value)
+
+    @cases([
+        (datetime(2000, 1, 1), '01.01.1990', None),
+        (datetime(2000, 1, 1), '01.01.2001', r"Date mustn't be in the future\."),
+        (datetime(2000, 1, 1), '01.01.1929', r"Age must be less than 70 years\."),
+        (datetime(1960, 1, 1), '01.01.1929', None),
+    ])
+    def test_validation_with_time_of_request(self, now, value, error):
+        field = self.test_field(required=False, nullable=True)
+        field.now = now
+        if error is None:
+            self.assertTrue(field.validate(value))
+        else:
+            with self.assertRaisesRegexp(api.ValidationError, error):
+                field.validate(value)
+
 
 class TestGenderField(unittest.TestCase):
     def setUp(self):
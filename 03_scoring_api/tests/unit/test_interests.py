@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+
+import context_unit
+from context import interests
+from utils import cases
+
+
+class TestCompactEncoding(unittest.TestCase):
+    @cases([
+        [],
+        [0],
+        [1, 2, 3],
+        [255, 256, 65535],
+    ])
+    def test_pack_and_unpack(self, ids):
+        packed = interests.pack_ids(ids)
+        self.assertTrue(interests.is_compact(packed))
+        self.assertEqual(len(packed), 1 + 2 * len(ids))
+        self.assertEqual(list(interests.unpack_ids(packed)), ids)
+
+    def test_little_endian(self):
+        self.assertEqual(interests.pack_ids([1, 258]), b"\x01\x01\x00\x02\x01")
+
+    @cases([
+        ['books', 'hi-tech', 'pets'],
+        [u'книги', 'tv'],
+        ['cars', 'cars'],
+    ])
+    def test_dictionary_encode_and_decode(self, names):
+        dictionary = interests.InterestsDictionary()
+        self.assertTrue(dictionary.add(names))
+        self.assertFalse(dictionary.add(names))
+        value = dictionary.encode(names)
+        self.assertEqual(dictionary.decode(value), names)
+        self.assertTrue(len(value) < len(json.dumps(names)))
+
+    def test_dictionary_update(self):
+        dictionary = interests.InterestsDictionary(['a'])
+        dictionary.update(json.dumps(['a', 'b', u'в']).encode('utf8'))
+        dictionary.update(None)
+        self.assertEqual(dictionary.names, ['a', 'b', u'в'])
+        self.assertEqual(dictionary.ids, {'a': 0, 'b': 1, u'в': 2})
+
+    def test_decode_unknown_id(self):
+        dictionary = interests.InterestsDictionary(['a'])
+        self.assertIsNone(dictionary.decode(interests.pack_ids([0, 1])))
+
+    @cases([
+        (None, []),
+        ('', []),
+        ('["a", "b"]', ['a', 'b']),
+        (interests.pack_ids([1, 0]), ['b', 'a']),
+        (interests.pack_ids([2]), None),
+    ])
+    def test_decode_interests(self, value, result):
+        dictionary = interests.InterestsDictionary(['a', 'b'])
+        self.assertEqual(interests.decode_interests(value, dictionary), result)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+import context_unit
+from context import api, limits, store
+from utils import cases, MockRedisConnection
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_burst_is_admitted(self):
+        limiter = limits.RateLimiter(rate=2, burst=3)
+        self.assertEqual([limiter.acquire("key", now=100) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(limiter.acquire("key", now=100), 0.5)
+
+    @cases([
+        (0.25, 0.25),
+        (0.5, 0),
+        (10, 0),
+    ])
+    def test_tokens_are_refilled(self, elapsed, retry_after):
+        limiter = limits.RateLimiter(rate=2, burst=1)
+        self.assertEqual(limiter.acquire("key", now=100), 0)
+        self.assertAlmostEqual(limiter.acquire("key", now=100 + elapsed), retry_after)
+
+    def test_count_of_tokens(self):
+        limiter = limits.RateLimiter(rate=2, burst=5)
+        self.assertEqual(limiter.acquire("key", now=100, count=3), 0)
+        # tokens are taken all or nothing
+        self.assertAlmostEqual(limiter.acquire("key", now=100, count=3), 0.5)
+        self.assertEqual(limiter.acquire("key", now=100, count=2), 0)
+        self.assertGreater(limiter.acquire("other", now=100, count=6), 0)
+
+    def test_keys_are_independent(self):
+        limiter = limits.RateLimiter(rate=1, burst=1)
+        self.assertEqual(limiter.acquire("first", now=100), 0)
+        self.assertEqual(limiter.acquire("second", now=100), 0)
+        self.assertGreater(limiter.acquire("first", now=100), 0)
+
+    def test_least_recently_used_keys_are_dropped(self):
+        limiter = limits.RateLimiter(rate=1, burst=1, max_keys=2)
+        for key in ("first", "second", "third"):
+            limiter.acquire(key, now=100)
+        self.assertEqual(len(limiter), 2)
+        self.assertEqual(list(limiter.buckets), ["second", "third"])
+        # dropped key starts with full bucket
+        self.assertEqual(limiter.acquire("first", now=100), 0)
+
+
+class TestStorageRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.storage = store.Storage(store.MemoryConnection, {})
+
+    def test_burst_per_window(self):
+        limiter = limits.StorageRateLimiter(self.storage, rate=2, burst=4)
+        self.assertEqual([limiter.acquire("key", now=100) for _ in range(4)], [0, 0, 0, 0])
+        self.assertAlmostEqual(limiter.acquire("key", now=101), 1)
+        # next window
+        self.assertEqual(limiter.acquire("key", now=102), 0)
+
+    def test_count_of_requests(self):
+        limiter = limits.StorageRateLimiter(self.storage, rate=2, burst=4)
+        self.assertEqual(limiter.acquire("key", now=100, count=3), 0)
+        self.assertAlmostEqual(limiter.acquire("key", now=101, count=2), 1)
+        self.assertGreater(limiter.acquire("other", now=100, count=5), 0)
+
+    def test_limit_is_shared(self):
+        first = limits.StorageRateLimiter(self.storage, rate=1, burst=1)
+        second = limits.StorageRateLimiter(self.storage, rate=1, burst=1)
+        self.assertEqual(first.acquire("key", now=100), 0)
+        self.assertGreater(second.acquire("key", now=100), 0)
+
+    def test_counters_expire(self):
+        storage = store.Storage(MockRedisConnection, {})
+        limiter = limits.StorageRateLimiter(storage, rate=10, burst=5)
+        limiter.acquire("key", now=100)
+        self.assertEqual(storage.db.expires, {"rl:key:200": 2})
+
+    def test_unavailable_storage(self):
+        storage = store.Storage(store.MemoryConnection, {'failure_rate': 1.0, 'retry': 0})
+        limiter = limits.StorageRateLimiter(storage, rate=1, burst=1)
+        self.assertEqual([limiter.acquire("key", now=100) for _ in range(3)], [0, 0, 0])
+
+    def test_unavailable_storage_is_not_retried(self):
+        storage = store.Storage(store.MemoryConnection, {'failure_rate': 1.0, 'retry': 3, 'backoff_factor': 10})
+        limiter = limits.StorageRateLimiter(storage, rate=1, burst=1)
+        start = time.time()
+        self.assertEqual(limiter.acquire("key", now=100), 0)
+        self.assertLess(time.time() - start, 1)
+
+    def test_limiter_of_main_with_write_behind_storage(self):
+        storage = store.WriteBehindStorage(store.Storage(store.MemoryConnection, {}))
+        try:
+            limiter = api.create_rate_limiter(storage, 1, 1, shared=True)
+            self.assertEqual([limiter.acquire("key", now=100) for _ in range(3)], [0, 1, 1])
+        finally:
+            storage.close()
+
+
+class TestConcurrencyLimiter(unittest.TestCase):
+    def test_acquire_and_release(self):
+        limiter = limits.ConcurrencyLimiter(2, retry_after=3)
+        self.assertEqual(limiter.acquire(), 0)
+        self.assertEqual(limiter.acquire(), 0)
+        self.assertEqual(limiter.acquire(), 3)
+        self.assertEqual((limiter.active, limiter.rejected), (2, 1))
+        limiter.release()
+        self.assertEqual(limiter.acquire(), 0)
+        self.assertEqual(limiter.active, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+import context_unit
+from context import metrics, store
+from utils import cases, MockRedisConnection
+
+
+class TestCounter(unittest.TestCase):
+    def test_inc(self):
+        counter = metrics.Counter("requests_total", "Requests.", labels=("method", "code"))
+        counter.inc(("online_score", "200"))
+        counter.inc(("online_score", "200"), amount=2)
+        counter.inc(("clients_interests", "422"))
+        self.assertEqual(counter.get(("online_score", "200")), 3)
+        self.assertEqual(counter.get(("clients_interests", "422")), 1)
+        self.assertEqual(counter.get(("clients_interests", "200")), 0)
+
+
+class TestHistogram(unittest.TestCase):
+    def setUp(self):
+        self.histogram = metrics.Histogram("duration_seconds", "Duration.",
+                                           labels=("method",), buckets=(0.1, 1.0))
+
+    @cases([
+        (0.05, [1, 1, 1]),
+        (0.1, [1, 1, 1]),
+        (0.5, [0, 1, 1]),
+        (2.0, [0, 0, 1]),
+    ])
+    def test_buckets(self, value, cumulative_counts):
+        histogram = metrics.Histogram("duration_seconds", "Duration.", buckets=(0.1, 1.0))
+        histogram.observe(value)
+        samples = list(histogram.samples())
+        self.assertEqual([v for _, _, v in samples[:3]], cumulative_counts)
+        self.assertEqual(samples[3], ("duration_seconds_sum", "", value))
+        self.assertEqual(samples[4], ("duration_seconds_count", "", 1))
+
+    def test_labels(self):
+        self.histogram.observe(0.5, ("online_score",))
+        self.histogram.observe(0.05, ("online_score",))
+        self.histogram.observe(0.05, ("batch",))
+        self.assertEqual(self.histogram.get_count(("online_score",)), 2)
+        self.assertEqual(self.histogram.get_count(("batch",)), 1)
+        self.assertEqual(self.histogram.get_count(("unknown",)), 0)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_render_prometheus_format(self):
+        registry = metrics.MetricsRegistry()
+        counter = registry.counter("requests_total", "Count of requests.", labels=("method", "code"))
+        histogram = registry.histogram("duration_seconds", "Duration.", labels=("method",), buckets=(0.1,))
+        counter.inc(("online_score", "200"))
+        histogram.observe(0.25, ('say "hi"',))
+        self.assertEqual(registry.render().split("\n"), [
+            '# HELP requests_total Count of requests.',
+            '# TYPE requests_total counter',
+            'requests_total{method="online_score",code="200"} 1.0',
+            '# HELP duration_seconds Duration.',
+            '# TYPE duration_seconds histogram',
+            'duration_seconds_bucket{method="say \\"hi\\"",le="0.1"} 0.0',
+            'duration_seconds_bucket{method="say \\"hi\\"",le="+Inf"} 1.0',
+            'duration_seconds_sum{method="say \\"hi\\""} 0.25',
+            'duration_seconds_count{method="say \\"hi\\""} 1.0',
+            '',
+        ])
+
+
+class TestRequestTrace(unittest.TestCase):
+    def test_phases_are_summed(self):
+        timings = {}
+        trace = metrics.RequestTrace(timings)
+        with trace.phase("validation"):
+            time.sleep(0.01)
+        with trace.phase("validation"):
+            pass
+        trace.add("store", 0.5)
+        self.assertEqual(sorted(timings), ["store", "validation"])
+        self.assertTrue(0.01 <= timings["validation"] < 0.5)
+        self.assertEqual(timings["store"], 0.5)
+
+    def test_traced_storage(self):
+        trace = metrics.RequestTrace()
+        storage = metrics.TracedStorage(store.Storage(MockRedisConnection, {}), trace)
+        storage.set("key", "value")
+        storage.cache_set("cache", 1, 60)
+        self.assertEqual(storage.get("key"), "value")
+        self.assertEqual(storage.cache_get("cache"), 1)
+        self.assertEqual(storage.get_many(["key", "none"]), ["value", None])
+        self.assertEqual(storage.cache_get_many(["cache"]), [1])
+        self.assertEqual(list(trace.timings), ["store"])
+
+
+if __name__ == "__main__":
+    unittest.main()
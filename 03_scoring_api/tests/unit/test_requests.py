@@ -77,6 +77,28 @@ class TestBaseRequest(unittest.TestCase):
         with self.assertRaises(AttributeError):
             request.undeclared_field
 
+    def test_fields_state_is_not_shared(self):
+        first = self.request({'field_1': 'a', 'field_2': 'b'})
+        second = self.request({'field_1': 'a'})
+        self.assertTrue(first.is_valid())
+        self.assertFalse(second.is_valid())
+        self.assertTrue(first.fields['field_2'].is_exist)
+        self.assertFalse(second.fields['field_2'].is_exist)
+        self.assertFalse(self.request.base_fields['field_2'].is_exist)
+        self.assertIs(first.fields['field_1'].error_messages, second.fields['field_1'].error_messages)
+
+    def test_time_of_request(self):
+        now = datetime(2000, 1, 1)
+        request = self.request({'field_1': 'a', 'field_2': 'b'}, now=now)
+        self.assertTrue(request.is_valid())
+        self.assertIs(request.fields['field_1'].now, now)
+
+        request = self.request({'field_1': 'a', 'field_2': 'b'})
+        self.assertTrue(request.is_valid())
+        self.assertIsInstance(request.now, datetime)
+        for field in request.fields.values():
+            self.assertIs(field.now, request.now)
+
 
 class TestClientsInterestsRequest(unittest.TestCase):
     def setUp(self):
@@ -5,11 +5,12 @@ import datetime
 import hashlib
 import json
 import redis
+import threading
 import time
 import unittest
 
 import context_unit
-from context import scoring, store
+from context import interests, scoring, store
 from utils import cases, MockRedisConnection
 
 
@@ -112,6 +113,133 @@ class TestGetScore(unittest.TestCase):
         result = self.get_score_from_dict(data)
         self.assertTrue(_min < result < _max)
 
+    @cases([
+        ({"phone": "79115004020", "email": "mail@mail.com"}, scoring.SCORE_CACHE_TIME),
+        ({"gender": 1}, scoring.ZERO_SCORE_CACHE_TIME),
+        ({"first_name": "a"}, scoring.ZERO_SCORE_CACHE_TIME),
+    ])
+    def test_score_cache_time(self, data, cache_time):
+        self.get_score_from_dict(data)
+        key = self.gen_key_from_data(data)
+        self.assertEqual(self.store.db.expires[key], cache_time)
+        self.store.db.clean()
+
+    @cases([
+        {"gender": 1},
+        {"first_name": "a", "birthday": "01.01.2000"},
+    ])
+    def test_zero_score_is_taken_from_cache(self, data):
+        self.assertEqual(self.get_score_from_dict(data), 0)
+        self.assertEqual(self.get_score_from_dict(data), 0)
+        self.assertEqual(self.store.db.get_counter, 2)
+        self.assertEqual(self.store.db.set_counter, 1)
+        self.store.db.clean()
+
+    @cases([
+        (0, 0),
+        ("0", 0),
+        ("0.0", 0),
+        ("-1.5", -1.5),
+        ("2.5;0.001;%s" % (time.time() + 60), 2.5),
+    ])
+    def test_cached_values(self, value, score):
+        data = {"phone": "79115004020", "email": "mail@mail.com"}
+        self.store.cache_set(self.gen_key_from_data(data), value)
+        self.assertEqual(self.get_score_from_dict(data), score)
+        self.assertEqual(self.store.db.set_counter, 1)
+        self.store.db.clean()
+
+    def test_invalid_cached_value_is_recalculated(self):
+        data = {"phone": "79115004020", "email": "mail@mail.com"}
+        self.store.cache_set(self.gen_key_from_data(data), "invalid")
+        self.assertEqual(self.get_score_from_dict(data), 3.0)
+        self.assertEqual(self.store.db.set_counter, 2)
+
+    def test_early_refresh(self):
+        data = {"phone": "79115004020", "email": "mail@mail.com"}
+        key = self.gen_key_from_data(data)
+        # long calculation and expiration in a second
+        self.store.cache_set(key, scoring.encode_cached_score(10, 10**6, time.time() + 1))
+        self.assertEqual(self.get_score_from_dict(data), 3.0)
+        self.assertEqual(self.store.db.set_counter, 2)
+        score, delta, expires = scoring.decode_cached_score(self.store.db.db[key])
+        self.assertEqual(score, 3.0)
+        self.assertTrue(expires > time.time() + scoring.SCORE_CACHE_TIME - 60)
+
+    @cases([
+        (None, None, 0.99, False),
+        (0.1, 1000.0, 0.5, False),
+        (0.1, 1000.0, 0.0, False),
+        (10.0, 1000.0, 0.5, False),
+        (20.0, 1000.0, 0.5, True),
+        (0.1, 990.05, 0.5, True),
+        (0.1, 990.1, 0.5, False),
+        (0.1, 980.0, 0.99, True),
+        (0.1, 990.4, 0.99, True),
+    ])
+    def test_should_refresh(self, delta, expires, rnd, result):
+        self.assertEqual(scoring.should_refresh(delta, expires, now=990.0, beta=1.0, rnd=lambda: rnd), result)
+
+    @cases([
+        (0.001, 1000.5, 0.5, True),
+        (0.001, 1000.5, 0.1, False),
+        (0.001, 1002.0, 0.99, True),
+        (0.001, 1060.0, 0.99, False),
+        (0.00001, 1000.5, 0.99, False),
+    ])
+    def test_should_refresh_before_expiration(self, delta, expires, rnd, result):
+        # delta of a millisecond is a round trip to store
+        self.assertEqual(scoring.should_refresh(delta, expires, now=1000.0, rnd=lambda: rnd), result)
+
+    def test_delta_includes_reading_of_cache(self):
+        self.store = store.Storage(store.MemoryConnection, {'latency': 0.01})
+        data = {"phone": "79115004020", "email": "mail@mail.com"}
+        self.assertEqual(self.get_score_from_dict(data), 3.0)
+        score, delta, expires = scoring.decode_cached_score(self.store.cache_get(self.gen_key_from_data(data)))
+        self.assertTrue(delta >= 0.01)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_are_coalesced(self):
+        flight = scoring.SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def calculate(value):
+            calls.append(value)
+            started.set()
+            release.wait()
+            return value * 2
+
+        results = []
+        def worker():
+            results.append(flight.do("key", calculate, 21))
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, [21])
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(flight.calls, {})
+
+    def test_error_is_raised(self):
+        flight = scoring.SingleFlight()
+
+        def fail():
+            raise RuntimeError("fail")
+
+        with self.assertRaises(RuntimeError):
+            flight.do("key", fail)
+        self.assertEqual(flight.do("key", lambda: 1), 1)
+
 
 class TestGetInterests(unittest.TestCase):
     def setUp(self):
@@ -146,6 +274,31 @@ class TestGetInterests(unittest.TestCase):
         result = scoring.get_interests(self.store, client_id)
         self.assertEqual(result, interests)
 
+    @cases([
+        (0, ['travel', 'mountain', 'Patagonia']),
+        (1, [u'лето', 'sea']),
+        (2, []),
+    ])
+    def test_user_has_compact_interests_in_storage(self, client_id, interests_list):
+        writer = interests.InterestsDictionary(['golf'])
+        writer.add(interests_list)
+        writer.save(self.store)
+        self.store.set(self.gen_key_from_client_id(client_id), writer.encode(interests_list))
+
+        dictionary = interests.InterestsDictionary()
+        result = scoring.get_interests(self.store, client_id, dictionary)
+        self.assertEqual(result, interests_list)
+        # dictionary is loaded once
+        get_counter = self.store.db.get_counter
+        self.assertEqual(scoring.get_interests(self.store, client_id, dictionary), interests_list)
+        self.assertEqual(self.store.db.get_counter, get_counter + 1)
+
+    def test_unknown_interest_id(self):
+        self.store.set(self.gen_key_from_client_id(1), interests.pack_ids([0, 5]))
+        self.store.set(interests.DICTIONARY_KEY, json.dumps(['golf']))
+        with self.assertRaises(ValueError):
+            scoring.get_interests(self.store, 1, interests.InterestsDictionary())
+
 
 if __name__ == '__main__':
     unittest.main()
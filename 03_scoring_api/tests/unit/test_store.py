@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import redis
+import threading
+import time
+import unittest
+
+import context_unit
+from context import memory_redis, store
+from utils import cases, MockRedisConnection
+
+
+class TestMemoryStorage(unittest.TestCase):
+    def setUp(self):
+        config = {
+            'host': 'localhost',
+            'port': 6379,
+            'retry': 2,
+            'backoff_factor': 0.001,
+        }
+        self.store = store.Storage(store.MemoryConnection, config)
+
+    @cases([
+        ('key', 'value', b'value'),
+        ('111', 234, b'234'),
+        ('score', 3.5, b'3.5'),
+        (u'name', u'Алекс', u'Алекс'.encode('utf8')),
+    ])
+    def test_set_and_get(self, key, value, stored):
+        self.assertTrue(self.store.set(key, value))
+        self.assertEqual(self.store.get(key), stored)
+        self.assertEqual(self.store.cache_get(key), stored)
+
+    def test_get_many(self):
+        self.store.set('key1', 'value1')
+        self.store.cache_set('key3', 'value3')
+        self.assertEqual(self.store.get_many(['key1', 'key2', 'key3']), [b'value1', None, b'value3'])
+        self.assertEqual(self.store.cache_get_many([]), [])
+
+    def test_cache_set_with_expires(self):
+        self.store.cache_set('key', 'value', expires=0.05)
+        self.assertEqual(self.store.cache_get('key'), b'value')
+        time.sleep(0.06)
+        self.assertIsNone(self.store.cache_get('key'))
+
+    def test_shared_keyspace(self):
+        keyspace = memory_redis.Keyspace()
+        first = store.Storage(store.MemoryConnection, {'keyspace': keyspace})
+        second = store.Storage(store.MemoryConnection, {'keyspace': keyspace})
+        first.set('key', 'value')
+        self.assertEqual(second.get('key'), b'value')
+        self.assertEqual(len(keyspace), 1)
+
+    def test_cache_set_many(self):
+        self.assertTrue(self.store.cache_set_many([('key1', 'value1', None), ('key2', 2, 0.05)]))
+        self.assertEqual(self.store.get_many(['key1', 'key2']), [b'value1', b'2'])
+        time.sleep(0.06)
+        self.assertEqual(self.store.get_many(['key1', 'key2']), [b'value1', None])
+
+    def test_latency(self):
+        storage = store.Storage(store.MemoryConnection, {'latency': 0.02})
+        start = time.time()
+        storage.get('key')
+        self.assertGreaterEqual(time.time() - start, 0.02)
+
+    def test_failures(self):
+        storage = store.Storage(store.MemoryConnection, {'failure_rate': 1.0, 'retry': 1, 'backoff_factor': 0.001})
+        with self.assertRaises(redis.exceptions.ConnectionError):
+            storage.get('key')
+        with self.assertRaises(redis.exceptions.ConnectionError):
+            storage.set('key', 'value')
+        self.assertIsNone(storage.cache_get('key'))
+        self.assertEqual(storage.cache_get_many(['key1', 'key2']), [None, None])
+        self.assertIsNone(storage.cache_set('key', 'value'))
+        self.assertIsNone(storage.cache_set_many([('key', 'value', None)]))
+
+
+class BlockingStorage(store.Storage):
+    """ Storage which waits for event before saving cache values """
+    def __init__(self, *args, **kwargs):
+        store.Storage.__init__(self, *args, **kwargs)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def cache_set_many(self, items):
+        self.started.set()
+        self.release.wait()
+        return store.Storage.cache_set_many(self, items)
+
+
+class TestWriteBehindStorage(unittest.TestCase):
+    def setUp(self):
+        self.storage = store.Storage(MockRedisConnection, {})
+        self.store = store.WriteBehindStorage(self.storage, max_size=100, batch_size=10)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_cache_set_is_saved_in_background(self):
+        for i in range(25):
+            self.assertTrue(self.store.cache_set('key%s' % i, i, expires=60))
+        self.assertTrue(self.store.flush(timeout=5))
+        self.assertEqual(self.store.written, 25)
+        self.assertEqual(self.store.cache_get_many(['key0', 'key24']), [0, 24])
+        self.assertEqual(self.storage.db.expires['key0'], 60)
+        self.assertEqual(self.storage.db.set_counter, 0)
+        self.assertTrue(3 <= self.storage.db.set_many_counter <= 25)
+
+    def test_reads_and_writes_are_passed(self):
+        self.assertIsNone(self.store.set('key', 'value'))
+        self.assertEqual(self.store.get('key'), 'value')
+        self.assertEqual(self.store.get_many(['key', 'missing']), ['value', None])
+        self.assertEqual(self.store.cache_get('key'), 'value')
+
+    def test_incr_is_passed(self):
+        self.assertEqual(self.store.incr('counter', expires=60), 1)
+        self.assertEqual(self.store.incr('counter', expires=60, retry=False), 2)
+        self.assertEqual(self.storage.db.expires['counter'], 60)
+
+    def test_cache_set_many_is_saved_in_background(self):
+        items = [('key%s' % i, i, 60) for i in range(15)]
+        self.assertTrue(self.store.cache_set_many(items))
+        self.assertTrue(self.store.flush(timeout=5))
+        self.assertEqual(self.store.written, 15)
+        self.assertEqual(self.store.cache_get_many(['key0', 'key14']), [0, 14])
+
+    def test_oldest_writes_are_dropped(self):
+        self.store.close()
+        self.storage = BlockingStorage(MockRedisConnection, {})
+        self.store = store.WriteBehindStorage(self.storage, max_size=5, batch_size=2)
+        self.store.cache_set('first', 0)
+        self.storage.started.wait(5)
+        # the first write is sent, the queue is full after 5 writes
+        for i in range(8):
+            self.store.cache_set('key%s' % i, i)
+        self.assertEqual(self.store.dropped, 3)
+        self.storage.release.set()
+        self.assertTrue(self.store.flush(timeout=5))
+        self.assertEqual(self.store.written, 6)
+        self.assertEqual(sorted(self.storage.db.db), ['first', 'key3', 'key4', 'key5', 'key6', 'key7'])
+
+    def test_close_flushes_queue(self):
+        self.store.close()
+        self.storage = BlockingStorage(MockRedisConnection, {})
+        self.store = store.WriteBehindStorage(self.storage, max_size=100, batch_size=10)
+        for i in range(30):
+            self.store.cache_set('key%s' % i, i)
+        self.storage.release.set()
+        self.store.close(timeout=5)
+        self.assertFalse(self.store.thread.is_alive())
+        self.assertEqual(len(self.storage.db.db), 30)
+        # writes after close are saved inline
+        self.store.cache_set('late', 1)
+        self.assertEqual(self.storage.db.db['late'], 1)
+
+    def test_latency_of_cache_storage_is_hidden(self):
+        self.store.close()
+        self.storage = store.Storage(store.MemoryConnection, {'latency': 0.05})
+        self.store = store.WriteBehindStorage(self.storage)
+        start = time.time()
+        self.store.cache_set('key', 'value')
+        self.assertLess(time.time() - start, 0.05)
+        self.assertTrue(self.store.flush(timeout=5))
+        self.assertEqual(self.storage.cache_get('key'), b'value')
+
+    def test_failed_writes(self):
+        self.store.close()
+        config = {'failure_rate': 1.0, 'retry': 0}
+        self.store = store.WriteBehindStorage(store.Storage(store.MemoryConnection, config))
+        self.store.cache_set('key', 'value')
+        self.assertTrue(self.store.flush(timeout=5))
+        self.assertEqual((self.store.written, self.store.failed), (0, 1))
+
+
+class TestMemoryRedisServer(unittest.TestCase):
+    def tearDown(self):
+        self.server.stop()
+
+    def get_client(self):
+        return redis.Redis(host=self.server.host, port=self.server.port, socket_timeout=1)
+
+    def test_commands(self):
+        self.server = memory_redis.MemoryRedisServer().start()
+        client = self.get_client()
+        self.assertTrue(client.set('key', 'value', ex=10))
+        self.assertEqual(client.get('key'), b'value')
+        self.assertEqual(client.mget(['key', 'missing']), [b'value', None])
+        self.assertEqual(client.ttl('key'), 10)
+        self.assertEqual(client.delete('key'), 1)
+        self.assertEqual(client.dbsize(), 0)
+
+    def test_latency(self):
+        self.server = memory_redis.MemoryRedisServer(latency=0.02).start()
+        client = self.get_client()
+        start = time.time()
+        client.get('key')
+        self.assertGreaterEqual(time.time() - start, 0.02)
+
+    def test_failures(self):
+        self.server = memory_redis.MemoryRedisServer(failure_rate=1.0).start()
+        client = self.get_client()
+        with self.assertRaises(redis.exceptions.ConnectionError):
+            client.get('key')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -43,17 +43,37 @@ def gen_valid_token(login='', account=''):
 class MockRedisConnection(object):
     def __init__(self, *args, **kwargs):
         self.db = {}
+        self.expires = {}
         self.get_counter = 0
+        self.mget_counter = 0
         self.set_counter = 0
+        self.set_many_counter = 0
         self.delete_counter = 0
 
     def get(self, key):
         self.get_counter += 1
         return self.db.get(key)
 
+    def mget(self, keys):
+        self.mget_counter += 1
+        return [self.db.get(key) for key in keys]
+
     def set(self, key, value, expires=None):
         self.set_counter += 1
         self.db[key] = value
+        self.expires[key] = expires
+
+    def incr(self, key, expires=None, retry=True, amount=1):
+        value = int(self.db.get(key) or 0) + amount
+        self.set(key, str(value), expires)
+        return value
+
+    def set_many(self, items):
+        self.set_many_counter += 1
+        for key, value, expires in items:
+            self.db[key] = value
+            self.expires[key] = expires
+        return True
 
     def delete(self, key):
         self.delete_counter += 1
@@ -61,8 +81,11 @@ class MockRedisConnection(object):
 
     def clean(self):
         self.db = {}
+        self.expires = {}
         self.get_counter = 0
+        self.mget_counter = 0
         self.set_counter = 0
+        self.set_many_counter = 0
         self.delete_counter = 0
 
 
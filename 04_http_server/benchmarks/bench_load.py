@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    Load generator: starts httpd.py in given mode with given count of workers
+    (serving files of size mix in temporary directory) and requests files
+    by concurrent connections for given time. Results are printed in JSON:
+    requests per second, throughput, errors and latency percentiles in ms,
+    so serving modes and commits can be compared.
+
+    Connections are spread over client processes (threads in every process),
+    so the client isn't limited by one GIL. Requests of warm up aren't counted.
+
+    Usage:
+        python bench_load.py [--mode threaded|epoll] [-w WORKERS] [-c CONNECTIONS] [-d SECONDS]
+                             [--mix 1K:70,64K:25,1M:5] [--no-keep-alive] [--server-args "--no-sendfile"]
+                             [-o RESULTS.json]
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from optparse import OptionParser
+
+from context import httpd
+
+
+HTTPD = os.path.join(os.path.dirname(os.path.abspath(httpd.__file__)), 'httpd.py')
+REQUEST = "GET /{} HTTP/1.1\r\nHost: localhost\r\nConnection: {}\r\n\r\n"
+UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+PERCENTILES = (50, 90, 99, 99.9)
+START_TIMEOUT = 10
+
+
+def parse_size(value):
+    if value[-1].upper() in UNITS:
+        return int(value[:-1]) * UNITS[value[-1].upper()]
+    return int(value)
+
+
+def parse_mix(value):
+    """'1K:70,64K:30' -> [(1024, 70), (65536, 30)]"""
+    mix = []
+    for item in value.split(','):
+        size, _, weight = item.partition(':')
+        mix.append((parse_size(size), int(weight or 1)))
+    return mix
+
+
+def create_files(root_dir, sizes):
+    names = []
+    for size in sizes:
+        name = 'file_{}.jpg'.format(size)
+        with open(os.path.join(root_dir, name), 'wb') as f:
+            f.write(os.urandom(min(size, 1024 ** 2)) * (size // 1024 ** 2 or 1))
+            f.truncate(size)
+        names.append(name)
+    return names
+
+
+def get_free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_server(root_dir, port, mode, workers, server_args):
+    args = [sys.executable, HTTPD, '-r', root_dir, '--port', str(port), '-w', str(workers), '--mode', mode]
+    with open(os.devnull, 'wb') as devnull:
+        server = subprocess.Popen(args + server_args, stdout=devnull, stderr=devnull)
+    deadline = time.time() + START_TIMEOUT
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('Server exited with code {}'.format(server.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except socket.error:
+            time.sleep(0.1)
+    stop_server(server)
+    raise RuntimeError("Server isn't started in {} seconds".format(START_TIMEOUT))
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    server.wait()
+
+
+def read_response(sock, buf):
+    """Read response and return (status, length)"""
+    view = memoryview(buf)
+    received = 0
+    while True:
+        read = sock.recv_into(view[received:])
+        if not read:
+            raise socket.error('Connection is closed by server')
+        received += read
+        end = buf.find(httpd.HTTP_HEAD_TERMINATIOR, 0, received)
+        if end >= 0:
+            break
+    head = bytes(buf[:end]).lower()
+    status = int(head.split(None, 2)[1])
+    length = 0
+    for line in head.split(httpd.LINE_SEPARATOR)[1:]:
+        if line.startswith('content-length:'):
+            length = int(line.split(':', 1)[1])
+    total = end + len(httpd.HTTP_HEAD_TERMINATIOR) + length
+    while received < total:
+        read = sock.recv_into(view, min(len(buf), total - received))
+        if not read:
+            raise socket.error('Connection is closed by server')
+        received += read
+    return status, total
+
+
+def run_connection(address, names, weights, keep_alive, started, finished, stats, seed):
+    rand = random.Random(seed)
+    total_weight = float(sum(weights))
+    connection = 'keep-alive' if keep_alive else 'close'
+    buf = bytearray(1024 ** 2)
+    sock = None
+    while True:
+        now = time.time()
+        if now > finished:
+            break
+        point = rand.random() * total_weight
+        for name, weight in zip(names, weights):
+            point -= weight
+            if point < 0:
+                break
+        try:
+            if sock is None:
+                sock = socket.create_connection(address)
+            sock.sendall(REQUEST.format(name, connection))
+            status, length = read_response(sock, buf)
+            if not keep_alive:
+                sock.close()
+                sock = None
+        except socket.error:
+            if sock is not None:
+                sock.close()
+                sock = None
+            status, length = None, 0
+        if now < started:
+            continue
+        if status == httpd.OK:
+            stats['latencies'].append(time.time() - now)
+            stats['bytes'] += length
+        else:
+            stats['errors'] += 1
+    if sock is not None:
+        sock.close()
+
+
+def run_client(address, names, weights, keep_alive, connections, started, finished, seed, results):
+    """Client process: one thread per connection, stats of threads are merged and put to results"""
+    threads = []
+    for i in range(connections):
+        stats = {'latencies': [], 'bytes': 0, 'errors': 0}
+        thread = threading.Thread(target=run_connection, args=(address, names, weights, keep_alive,
+                                                               started, finished, stats, seed + i))
+        thread.daemon = True
+        thread.start()
+        threads.append((thread, stats))
+    total = {'latencies': [], 'bytes': 0, 'errors': 0}
+    for thread, stats in threads:
+        thread.join()
+        total['latencies'].extend(stats['latencies'])
+        total['bytes'] += stats['bytes']
+        total['errors'] += stats['errors']
+    results.put(total)
+
+
+def percentile(values, p):
+    """values have to be sorted"""
+    if not values:
+        return None
+    return values[min(int(round(p / 100.0 * (len(values) - 1))), len(values) - 1)]
+
+
+def get_commit():
+    try:
+        with open(os.devnull, 'wb') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=devnull,
+                                           cwd=os.path.dirname(HTTPD)).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(mode, workers, connections, duration, warmup, mix, keep_alive, processes, server_args, seed):
+    root_dir = tempfile.mkdtemp()
+    server = None
+    try:
+        sizes = [size for size, _ in mix]
+        names = create_files(root_dir, sizes)
+        weights = [weight for _, weight in mix]
+        port = get_free_port()
+        server = start_server(root_dir, port, mode, workers, server_args)
+
+        processes = max(min(processes, connections), 1)
+        started = time.time() + warmup
+        finished = started + duration
+        results = multiprocessing.Queue()
+        clients = []
+        for i in range(processes):
+            # connections are spread over processes evenly
+            count = connections // processes + (1 if i < connections % processes else 0)
+            client = multiprocessing.Process(target=run_client, args=(('127.0.0.1', port), names, weights,
+                                                                      keep_alive, count, started, finished,
+                                                                      seed + i * connections, results))
+            client.start()
+            clients.append(client)
+
+        latencies, received, errors = [], 0, 0
+        for _ in clients:
+            stats = results.get()
+            latencies.extend(stats['latencies'])
+            received += stats['bytes']
+            errors += stats['errors']
+        for client in clients:
+            client.join()
+    finally:
+        if server is not None:
+            stop_server(server)
+        shutil.rmtree(root_dir)
+
+    requests = len(latencies)
+    latencies = sorted(latency * 1000 for latency in latencies)
+    latency = {
+        'mean': sum(latencies) / requests if requests else None,
+        'max': latencies[-1] if requests else None,
+    }
+    for p in PERCENTILES:
+        latency['p{:g}'.format(p)] = percentile(latencies, p)
+    return {
+        'commit': get_commit(),
+        'mode': mode,
+        'workers': workers,
+        'connections': connections,
+        'keep_alive': keep_alive,
+        'mix': [[size, weight] for size, weight in mix],
+        'server_args': server_args,
+        'duration': duration,
+        'requests': requests,
+        'errors': errors,
+        'requests_per_second': requests / float(duration),
+        'throughput_mb_per_second': received / float(duration) / 1024 ** 2,
+        'latency_ms': latency,
+    }
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--mode", action="store", choices=sorted(httpd.SERVING_MODES), default='threaded')
+    op.add_option("-w", "--workers", action="store", type=int, default=2)
+    op.add_option("-c", "--connections", action="store", type=int, default=50)
+    op.add_option("-d", "--duration", action="store", type=float, default=10)
+    op.add_option("--warmup", action="store", type=float, default=1)
+    op.add_option("--mix", action="store", default="1K:70,64K:25,1M:5", help="Sizes of files and their weights")
+    op.add_option("--no-keep-alive", action="store_false", dest="keep_alive", default=True)
+    op.add_option("-p", "--processes", action="store", type=int, default=multiprocessing.cpu_count(),
+                  help="Count of client processes")
+    op.add_option("--server-args", action="store", default="", help="Extra arguments of httpd.py")
+    op.add_option("--seed", action="store", type=int, default=0)
+    op.add_option("-o", "--output", action="store", default=None, help="Save results in JSON file")
+    (opts, args) = op.parse_args()
+    results = main(opts.mode, opts.workers, opts.connections, opts.duration, opts.warmup, parse_mix(opts.mix),
+                   opts.keep_alive, opts.processes, shlex.split(opts.server_args), opts.seed)
+    print json.dumps(results, indent=2, sort_keys=True)
+    if opts.output:
+        with open(opts.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
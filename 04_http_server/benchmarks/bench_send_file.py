@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    Benchmark of throughput of file delivery of one keep-alive client:
+        sendfile - zero-copy sendfile (os.sendfile or pysendfile package)
+        buffered - writes of large memoryview chunks
+    for both serving modes (without file cache). Server is run in background thread,
+    files of given sizes are created in temporary directory.
+
+    Usage:
+        python bench_send_file.py [-n REQUESTS] [--sizes 1K,64K,1M,32M]
+"""
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from optparse import OptionParser
+
+from context import httpd
+
+
+REQUEST = "GET /{} HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n\r\n"
+UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(value):
+    if value[-1].upper() in UNITS:
+        return int(value[:-1]) * UNITS[value[-1].upper()]
+    return int(value)
+
+
+def create_files(root_dir, sizes):
+    names = []
+    for size in sizes:
+        name = 'file_{}.html'.format(size)
+        with open(os.path.join(root_dir, name), 'wb') as f:
+            f.write(os.urandom(min(size, 1024 ** 2)) * (size // 1024 ** 2 or 1))
+            f.truncate(size)
+        names.append(name)
+    return names
+
+
+def run_server(mode, root_dir, use_sendfile):
+    server_class, handler_class = httpd.SERVING_MODES[mode]
+
+    class Handler(handler_class):
+        pass
+
+    Handler.use_sendfile = use_sendfile
+    # files are always read from disk
+    server = server_class('127.0.0.1', 0, root_dir, Handler, file_cache_size=0)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server.sock.getsockname()
+
+
+def download(sock, buf, name, size):
+    """Read response and return its length"""
+    sock.sendall(REQUEST.format(name))
+    view = memoryview(buf)
+    received = sock.recv_into(view)
+    total = buf[:received].find(httpd.HTTP_HEAD_TERMINATIOR) + len(httpd.HTTP_HEAD_TERMINATIOR) + size
+    while received < total:
+        received += sock.recv_into(view, min(len(buf), total - received))
+    return received
+
+
+def bench(address, name, size, number):
+    """Return MB/s"""
+    sock = socket.create_connection(address)
+    buf = bytearray(1024 ** 2)
+    download(sock, buf, name, size)  # warm up
+    start = time.time()
+    for _ in range(number):
+        download(sock, buf, name, size)
+    elapsed = time.time() - start
+    sock.close()
+    return size * number / elapsed / 1024 ** 2
+
+
+def main(number, sizes):
+    root_dir = tempfile.mkdtemp()
+    try:
+        names = create_files(root_dir, sizes)
+        paths = [('buffered', False)]
+        if httpd.sendfile is not None:
+            paths.insert(0, ('sendfile', True))
+        else:
+            print "sendfile isn't available (install pysendfile for Python 2)"
+
+        print "{:<10} {:<10} {:>10} {:>12}".format("mode", "path", "size", "MB/s")
+        for mode in sorted(httpd.SERVING_MODES):
+            for path, use_sendfile in paths:
+                address = run_server(mode, root_dir, use_sendfile)
+                for name, size in zip(names, sizes):
+                    # large files are downloaded less times
+                    count = max(number * sizes[0] // size, 10)
+                    print "{:<10} {:<10} {:>10} {:>12.1f}".format(mode, path, size, bench(address, name, size, count))
+    finally:
+        shutil.rmtree(root_dir)
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("-n", "--number", action="store", type=int, default=2000)
+    op.add_option("--sizes", action="store", default="1K,64K,1M,32M")
+    (opts, args) = op.parse_args()
+    main(opts.number, sorted(parse_size(size) for size in opts.sizes.split(',')))
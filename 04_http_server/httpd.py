@@ -2,18 +2,34 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import email.utils
+import errno
 import io
 import json
 import logging
 import mimetypes
 import multiprocessing
 import os
+import Queue
+import select
+import signal
 import socket
 import threading
 import time
 import urllib
 import urlparse
-from multiprocessing.pool import ThreadPool
+import uuid
+import zlib
+from collections import Counter, OrderedDict, deque
+
+try:
+    from os import sendfile
+except ImportError:
+    # Python 2: pysendfile package
+    try:
+        from sendfile import sendfile
+    except ImportError:
+        sendfile = None
 
 
 ############### SETTINGS ###############
@@ -26,25 +42,95 @@ CONFIG = {
     'WORKERS': 2,
     'DOCUMENT_ROOT': './',
     'LOGGING_FILE': None,
+    'MODE': 'threaded',
+    'THREADS': 100,
+    'QUEUE_SIZE': 256,
+    'READ_TIMEOUT': 10,
+    'IDLE_TIMEOUT': 15,
+    'GRACEFUL_TIMEOUT': 30,
+    'SENDFILE': True,
+    'FILE_CACHE_SIZE': 64 * 1024 * 1024,
+    'FILE_CACHE_MAX_FILE_SIZE': 256 * 1024,
+    'PATH_CACHE_SIZE': 10000,
+    'GZIP': True,
+    'GZIP_MIN_SIZE': 1024,
+    'SERVER_STATUS': True,
+    # Cache-Control header by file extension, '*' - other files
+    'CACHE_CONTROL': {
+        '.html': 'no-cache',
+        '*': 'public, max-age=3600',
+    },
 }
 
 DEFAULT_CONFIG_PATH = './config.json'
 
-BUFFER_SIZE = 1024
+BUFFER_SIZE = 16384
 WORKER_QUEUE_SIZE = 256
 
+# threaded mode: accepted connections wait for a free thread in bounded queue
+POOL_SIZE = 100
+ACCEPT_QUEUE_SIZE = 256
+
+# seconds to receive whole request and to wait for the next request on keep-alive connection
+READ_TIMEOUT = 10
+IDLE_TIMEOUT = 15
+
+# seconds for stopped worker to finish its connections and interval of master's checks of workers
+GRACEFUL_TIMEOUT = 30
+SUPERVISE_INTERVAL = 1
+
+# size of writes of file if sendfile isn't used
+FILE_CHUNK_SIZE = 65536
+
+# epoll mode
+POLL_TIMEOUT = 1
+
+# in-memory cache of small files: budget of all bodies and max size of one file in bytes
+FILE_CACHE_SIZE = 64 * 1024 * 1024
+FILE_CACHE_MAX_FILE_SIZE = 256 * 1024
+
+# cache of resolved request targets: count of entries and seconds for which entry is valid
+PATH_CACHE_SIZE = 10000
+PATH_CACHE_TTL = 1
+
+# gzip: smaller files aren't compressed on the fly
+GZIP_CONTENT_TYPES = (
+    'text/css',
+    'text/html',
+    'application/javascript',
+    'text/plain',
+)
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+
+# stats of worker are shown at this url, count of paths with own counters
+STATUS_URL = '/server-status'
+STATUS_MAX_PATHS = 1000
+STATUS_OTHER_PATHS = '<other>'
+
+# log records of worker are written by thread in batches every LOG_FLUSH_INTERVAL seconds,
+# records are dropped if queue is full
+LOG_QUEUE_SIZE = 10000
+LOG_FLUSH_INTERVAL = 0.02
+
 OK = 200
+PARTIAL_CONTENT = 206
+NOT_MODIFIED = 304
 BAD_REQUEST = 400
 FORBIDDEN = 403
 NOT_FOUND = 404
 NOT_ALLOWED = 405
+RANGE_NOT_SATISFIABLE = 416
 
 RESPONSE_CODES = {
     OK: 'OK',
+    PARTIAL_CONTENT: 'Partial Content',
+    NOT_MODIFIED: 'Not Modified',
     BAD_REQUEST: 'Bad Request',
     NOT_FOUND: 'Not Found',
     FORBIDDEN: 'Forbidden',
     NOT_ALLOWED: 'Method Not Allowed',
+    RANGE_NOT_SATISFIABLE: 'Range Not Satisfiable',
 }
 
 ALLOWED_FILE_TYPES = ('.html', '.css', '.js', '.jpg',
@@ -71,8 +157,29 @@ LINE_SEPARATOR = '\r\n'
 
 HTTP_HEAD_TERMINATIOR = '\r\n\r\n'
 
+# limits of request line and headers, larger requests get 400
+MAX_REQUEST_LINE_SIZE = 8192
+MAX_HEADERS_SIZE = 65536
+MAX_HEADERS_COUNT = 100
+
 INDEX_FILE = 'index.html'
 
+# MIME type of files with unknown extension (it isn't allowed)
+DEFAULT_MIMETYPE = 'application/octet-stream'
+
+# invalid request gets 400
+EMPTY_REQUEST = {
+    'method': '',
+    'url': '',
+    'version': '',
+    'headers': {},
+}
+
+HTTP_DATE_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
+
+# Range header with more ranges is ignored
+MAX_RANGES = 16
+
 
 ############### SERVICE ###############
 
@@ -98,6 +205,90 @@ def parse_args():
         type=int,
         dest='port',
         help="Port is used of the server.")
+    # Serving mode
+    parser.add_argument(
+        '--mode',
+        action='store',
+        choices=('threaded', 'epoll'),
+        dest='mode',
+        help="Serving mode: thread per connection or event loop (epoll).")
+    # Threads
+    parser.add_argument(
+        '--threads',
+        action='store',
+        type=int,
+        dest='threads',
+        help="Count of threads of worker in threaded mode.")
+    parser.add_argument(
+        '--queue-size',
+        action='store',
+        type=int,
+        dest='queue_size',
+        help="Count of accepted connections waiting for a thread in threaded mode.")
+    # Timeouts
+    parser.add_argument(
+        '--read-timeout',
+        action='store',
+        type=float,
+        dest='read_timeout',
+        help="Seconds to receive whole request.")
+    parser.add_argument(
+        '--idle-timeout',
+        action='store',
+        type=float,
+        dest='idle_timeout',
+        help="Seconds to wait for the next request on keep-alive connection.")
+    parser.add_argument(
+        '--graceful-timeout',
+        action='store',
+        type=int,
+        dest='graceful_timeout',
+        help="Seconds for stopped worker to finish its connections.")
+    # Sending files
+    parser.add_argument(
+        '--no-sendfile',
+        action='store_false',
+        dest='sendfile',
+        default=None,
+        help="Send files with buffered writes instead of sendfile.")
+    # File cache
+    parser.add_argument(
+        '--file-cache-size',
+        action='store',
+        type=int,
+        dest='file_cache_size',
+        help="Bytes of small files kept in memory by every worker, 0 disables cache.")
+    parser.add_argument(
+        '--file-cache-max-file-size',
+        action='store',
+        type=int,
+        dest='file_cache_max_file_size',
+        help="Max size of cached file in bytes.")
+    parser.add_argument(
+        '--path-cache-size',
+        action='store',
+        type=int,
+        dest='path_cache_size',
+        help="Count of resolved request paths kept by every worker, 0 disables cache.")
+    # Compression
+    parser.add_argument(
+        '--no-server-status',
+        action='store_false',
+        dest='server_status',
+        default=None,
+        help="Don't show stats of worker at {}.".format(STATUS_URL))
+    parser.add_argument(
+        '--no-gzip',
+        action='store_false',
+        dest='gzip',
+        default=None,
+        help="Don't send gzip encoded files.")
+    parser.add_argument(
+        '--gzip-min-size',
+        action='store',
+        type=int,
+        dest='gzip_min_size',
+        help="Min size of file compressed on the fly in bytes.")
     # Logging
     parser.add_argument(
         '--logfile',
@@ -143,6 +334,34 @@ def update_config_with_parse_args(config, parse_args):
         else:
             raise RuntimeError("Uncorrected port.")
 
+    if args.mode:
+        config['MODE'] = args.mode
+
+    if args.sendfile is not None:
+        config['SENDFILE'] = args.sendfile
+
+    if args.gzip is not None:
+        config['GZIP'] = args.gzip
+
+    if args.server_status is not None:
+        config['SERVER_STATUS'] = args.server_status
+
+    for name in ('file_cache_size', 'file_cache_max_file_size', 'path_cache_size', 'gzip_min_size'):
+        value = getattr(args, name)
+        if value is not None:
+            if value >= 0:
+                config[name.upper()] = value
+            else:
+                raise RuntimeError("Value of '{}' can't be negative".format(name))
+
+    for name in ('threads', 'queue_size', 'read_timeout', 'idle_timeout', 'graceful_timeout'):
+        value = getattr(args, name)
+        if value is not None:
+            if value > 0:
+                config[name.upper()] = value
+            else:
+                raise RuntimeError("Value of '{}' must be greater than 0".format(name))
+
     return config
 
 
@@ -154,10 +373,125 @@ def setup_logger(logging_file=None, level=logging.INFO):
         level=level)
 
 
+class QueueHandler(logging.Handler):
+    """
+    QueueHandler appends records to queue (deque) without locks and blocking,
+    records are dropped if queue is full.
+    """
+    def __init__(self, queue, max_size=LOG_QUEUE_SIZE):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.max_size = max_size
+        self.dropped = 0
+
+    def handle(self, record):
+        if len(self.queue) < self.max_size:
+            self.queue.append(record)
+        else:
+            self.dropped += 1
+
+    def emit(self, record):
+        self.handle(record)
+
+
+class LogWriter(object):
+    """
+    LogWriter replaces handlers of logger with QueueHandler, so requests don't wait for writes of log.
+    Queued records are written by the original handlers in thread of writer every flush_interval seconds,
+    records of batch are written to stream at once with one flush.
+    """
+    def __init__(self, logger=None, queue_size=LOG_QUEUE_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        self.logger = logger or logging.getLogger()
+        self.handlers = list(self.logger.handlers)
+        self.queue = deque()
+        self.queue_handler = QueueHandler(self.queue, queue_size)
+        self.flush_interval = flush_interval
+        self.stopping = False
+        self.thread = None
+        self.written = 0
+        self.batches = 0
+
+    def start(self):
+        for handler in self.handlers:
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(self.queue_handler)
+        self.thread = threading.Thread(target=self.write_records)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Write queued records and restore handlers of logger"""
+        self.logger.removeHandler(self.queue_handler)
+        for handler in self.handlers:
+            self.logger.addHandler(handler)
+        self.stopping = True
+        self.thread.join()
+
+    def write_records(self):
+        while True:
+            stopping = self.stopping
+            records = []
+            while self.queue:
+                records.append(self.queue.popleft())
+            if records:
+                self.write(records)
+            if stopping:
+                return
+            time.sleep(self.flush_interval)
+
+    def write(self, records):
+        for handler in self.handlers:
+            handler_records = [record for record in records
+                               if record.levelno >= handler.level and handler.filter(record)]
+            if not handler_records:
+                continue
+            if not isinstance(handler, logging.StreamHandler) or handler.stream is None:
+                for record in handler_records:
+                    handler.handle(record)
+                continue
+
+            lines = []
+            for record in handler_records:
+                try:
+                    lines.append(handler.format(record) + '\n')
+                except Exception:
+                    handler.handleError(record)
+            handler.acquire()
+            try:
+                handler.stream.write(''.join(lines))
+                handler.flush()
+            except Exception:
+                handler.handleError(handler_records[0])
+            finally:
+                handler.release()
+        self.written += len(records)
+        self.batches += 1
+
+    def stats(self):
+        return {
+            'queued': len(self.queue),
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.queue_handler.dropped,
+        }
+
+
 ############### UTILITIES ###############
 
+def create_listen_socket(address, backlog=WORKER_QUEUE_SIZE):
+    """Listening socket is opened once by master and inherited by all workers"""
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(address)
+        sock.listen(backlog)
+    except socket.error as e:
+        raise RuntimeError(e)
+    return sock
+
+
 def get_cleaned_url_wo_query_string(url):
-    print(url)
     decode_url = urllib.unquote(url)
     path = urlparse.urlparse(decode_url).path
     return os.path.normpath(path)
@@ -176,58 +510,671 @@ def file_finder(root_dir, index_file, path):
 
 def get_file_mimetype(path):
     _, ext = os.path.splitext(path)
-    return mimetypes.types_map[ext.lower()]
+    return mimetypes.types_map.get(ext.lower(), DEFAULT_MIMETYPE)
+
+
+def format_http_date(timestamp):
+    return time.strftime(HTTP_DATE_FORMAT, time.gmtime(timestamp))
+
+
+def parse_http_date(value):
+    """Returns timestamp or None if date is invalid"""
+    parsed = email.utils.parsedate_tz(value)
+    if not parsed:
+        return None
+    try:
+        return email.utils.mktime_tz(parsed)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def make_etag(stat):
+    return '"{:x}-{:x}-{:x}"'.format(stat.st_ino, int(stat.st_mtime), stat.st_size)
+
+
+def is_not_modified(headers, etag, mtime):
+    """Check conditional headers of request, If-None-Match has priority over If-Modified-Since"""
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or 'W/' + etag in tags
+
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since:
+        since = parse_http_date(if_modified_since)
+        return since is not None and int(mtime) <= since
+    return False
+
+
+def parse_range(value, size):
+    """
+    Parse Range header for file of given size.
+    Returns list of satisfiable (start, end) ranges (end is inclusive), empty list if no range
+    is satisfiable and None if header is invalid (so it's ignored)
+    """
+    unit, _, specs = value.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    specs = specs.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        start, sep, end = spec.strip().partition('-')
+        if not sep or not (start or end):
+            return None
+        if (start and not start.isdigit()) or (end and not end.isdigit()):
+            return None
+        if not start:
+            # suffix range: last bytes of file
+            length = int(end)
+            if length and size:
+                ranges.append((max(size - length, 0), size - 1))
+            continue
+        start, end = int(start), int(end) if end else None
+        if end is not None and end < start:
+            return None
+        if start < size:
+            ranges.append((start, size - 1 if end is None else min(end, size - 1)))
+    return ranges
+
+
+def iter_body_parts(body, parts):
+    """Bytes of response parts, (offset, count) parts are taken from body of file"""
+    for part in parts:
+        if isinstance(part, tuple):
+            offset, count = part
+            yield body[offset:offset + count]
+        else:
+            yield part
+
+
+def accepts_gzip(value):
+    """Check Accept-Encoding header of request"""
+    if not value:
+        return False
+    for coding in value.split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() not in ('gzip', '*'):
+            continue
+        for param in params.split(';'):
+            key, _, quality = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    return float(quality) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def gzip_compress(data, level=GZIP_LEVEL):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def gzip_etag(etag):
+    """ETag of gzip encoded body is derived from ETag of file, so it doesn't depend on where body is taken from"""
+    return etag[:-1] + '-gzip"'
+
+
+def find_precompressed(file, mtime):
+    """Returns path and stat of sibling .gz file if it's not older than file"""
+    path = file + '.gz'
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None, None
+    if stat.st_mtime < mtime:
+        return None, None
+    return path, stat
+
+
+def set_tcp_cork(sock, enabled):
+    """Corked socket sends only full packets, so headers go together with the first bytes of file"""
+    if hasattr(socket, 'TCP_CORK'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, int(enabled))
+
+
+def wait_writable(sock, timeout):
+    poller = select.poll()
+    poller.register(sock.fileno(), select.POLLOUT)
+    if not poller.poll(None if timeout is None else timeout * 1000):
+        raise socket.timeout('Socket is not writable in {} seconds'.format(timeout))
+
+
+############### Request Parser ###############
+
+class BadRequest(Exception):
+    pass
+
+
+class RequestParser(object):
+    """
+    RequestParser is an incremental parser of requests of one connection.
+    Received data is fed as it comes, bytes after the end of request (pipelined requests)
+    are kept for the next request, bodies of requests are skipped.
+    """
+    def __init__(self, max_headers_size=MAX_HEADERS_SIZE):
+        self.max_headers_size = max_headers_size
+        self.buf = bytearray()
+        # position from which the end of headers is searched
+        self.scanned = 0
+        # count of bytes of body which aren't received yet
+        self.skip = 0
+
+    def feed(self, data):
+        if self.skip:
+            skipped = min(self.skip, len(data))
+            self.skip -= skipped
+            data = data[skipped:]
+        self.buf += data
+
+    def has_data(self):
+        return bool(self.buf)
+
+    def next_request(self):
+        """
+        Returns (raw_data, request) or None if request isn't received completely.
+        Raises BadRequest for malformed or too large requests.
+        """
+        # empty lines before request line are ignored
+        if self.buf[:1] in (b'\r', b'\n'):
+            del self.buf[:len(self.buf) - len(self.buf.lstrip(b'\r\n'))]
+            self.scanned = 0
+
+        terminator = HTTP_HEAD_TERMINATIOR
+        end = self.buf.find(terminator, max(self.scanned - len(terminator) + 1, 0))
+        if end < 0:
+            self.scanned = len(self.buf)
+            if self.scanned > self.max_headers_size:
+                raise BadRequest('Headers are too large')
+            return None
+
+        end += len(terminator)
+        if end > self.max_headers_size:
+            raise BadRequest('Headers are too large')
+        raw_data = str(self.buf[:end])
+        del self.buf[:end]
+        self.scanned = 0
+
+        request = self.parse_request(raw_data)
+        length = request['headers'].get('content-length')
+        if length:
+            if not length.isdigit():
+                raise BadRequest('Invalid Content-Length: {}'.format(length))
+            # body isn't used
+            self.skip = int(length)
+            skipped = min(self.skip, len(self.buf))
+            del self.buf[:skipped]
+            self.skip -= skipped
+        return raw_data, request
+
+    def parse_request(self, raw_data):
+        request_lines = raw_data[:-len(HTTP_HEAD_TERMINATIOR)].split(LINE_SEPARATOR)
+
+        if len(request_lines[0]) > MAX_REQUEST_LINE_SIZE:
+            raise BadRequest('Request line is too large')
+        first_line = request_lines[0].split()
+        if len(first_line) != 3 or not first_line[2].startswith('HTTP/'):
+            raise BadRequest('Invalid request line: {!r}'.format(request_lines[0]))
+        method, url, version = first_line
+
+        if len(request_lines) - 1 > MAX_HEADERS_COUNT:
+            raise BadRequest('Too many headers')
+        headers = {}
+        for line in request_lines[1:]:
+            k, sep, v = line.partition(':')
+            # folded lines aren't allowed too
+            if not sep or not k or k != k.strip():
+                raise BadRequest('Invalid header line: {!r}'.format(line))
+            headers[k.lower()] = v.strip()
+
+        return {
+            'method': method,
+            'url': url,
+            'version': version,
+            'headers': headers,
+        }
+
+
+############### File Cache ###############
+
+class CachedFile(object):
+    __slots__ = ('key', 'file', 'ino', 'mtime', 'size', 'mimetype', 'etag', 'last_modified', 'body',
+                 'gzip_body', 'memory')
+
+    def __init__(self, key, file, stat, mimetype, body):
+        self.key = key
+        self.file = file
+        self.ino = stat.st_ino
+        self.mtime = stat.st_mtime
+        self.size = stat.st_size
+        self.mimetype = mimetype
+        self.etag = make_etag(stat)
+        self.last_modified = format_http_date(stat.st_mtime)
+        self.body = body
+        # None - isn't compressed yet, empty - compressed body isn't smaller
+        self.gzip_body = None
+        # bytes of bodies
+        self.memory = len(body)
+
+
+class FileCache(object):
+    """
+    FileCache keeps bodies of small files by path of request (before index file lookup).
+    Every hit is validated by inode, mtime and size of file (one stat instead of lookup, open and read),
+    the least recently used files are evicted when size of bodies exceeds max_size.
+    Entries of text files also keep gzip encoded body: sibling .gz file or body compressed on the fly
+    (only files not smaller than gzip_min_size).
+    Files larger than max_file_size aren't read, they are counted as bypasses (not misses).
+    """
+    def __init__(self, max_size=FILE_CACHE_SIZE, max_file_size=FILE_CACHE_MAX_FILE_SIZE,
+                 gzip_min_size=GZIP_MIN_SIZE):
+        self.max_size = max_size
+        self.max_file_size = min(max_file_size, max_size)
+        self.gzip_min_size = gzip_min_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'bypasses': 0,
+            'invalidations': 0,
+            'evictions': 0,
+            'compressions': 0,
+        }
+
+    def get(self, key):
+        """Returns valid CachedFile or None, misses are counted by add"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+        try:
+            stat = os.stat(entry.file)
+            valid = (stat.st_mtime == entry.mtime and stat.st_size == entry.size and
+                     stat.st_ino == entry.ino)
+        except OSError:
+            valid = False
+
+        with self.lock:
+            if not valid:
+                self.counters['invalidations'] += 1
+                self.remove(key)
+                return None
+            self.counters['hits'] += 1
+            # move to the end of LRU order
+            if self.entries.pop(key, None) is not None:
+                self.entries[key] = entry
+        return entry
+
+    def add(self, key, file, mimetype, stat):
+        """Read file if it's small enough (stat of file is checked before open), returns CachedFile or None"""
+        with self.lock:
+            if stat.st_size > self.max_file_size:
+                self.counters['bypasses'] += 1
+                return None
+            self.counters['misses'] += 1
+        with io.open(file, 'rb') as fd:
+            stat = os.fstat(fd.fileno())
+            if stat.st_size > self.max_file_size:
+                return None
+            body = fd.read(stat.st_size + 1)
+        # file is being changed
+        if len(body) != stat.st_size:
+            return None
+
+        entry = CachedFile(key, file, stat, mimetype, body)
+        if mimetype in GZIP_CONTENT_TYPES:
+            gz_file, _ = find_precompressed(file, stat.st_mtime)
+            if gz_file:
+                with io.open(gz_file, 'rb') as fd:
+                    entry.gzip_body = fd.read()
+                entry.memory += len(entry.gzip_body)
+
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = entry
+            self.size += entry.memory
+            self.evict()
+        return entry
+
+    def get_gzip_body(self, entry):
+        """Returns gzip encoded body of entry or empty string if it shouldn't be compressed"""
+        if entry.gzip_body is None:
+            gzip_body = b''
+            if entry.size >= self.gzip_min_size:
+                gzip_body = gzip_compress(entry.body)
+                if len(gzip_body) >= entry.size:
+                    gzip_body = b''
+            with self.lock:
+                if entry.gzip_body is None:
+                    entry.gzip_body = gzip_body
+                    entry.memory += len(gzip_body)
+                    self.counters['compressions'] += 1
+                    if self.entries.get(entry.key) is entry:
+                        self.size += len(gzip_body)
+                        self.evict()
+        return entry.gzip_body
+
+    def evict(self):
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.memory
+            self.counters['evictions'] += 1
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.memory
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats.update({
+                'entries': len(self.entries),
+                'size': self.size,
+            })
+        requests = stats['hits'] + stats['misses']
+        stats['hit_rate'] = float(stats['hits']) / requests if requests else 0.0
+        return stats
+
+
+class PathCache(object):
+    """
+    PathCache keeps results of resolution of request targets: cleaned url, response code,
+    found file and its MIME type. Entries are valid for ttl seconds (new and removed files
+    are noticed after it), the least recently used entries are evicted
+    and all entries are dropped if document root is changed.
+    """
+    def __init__(self, max_entries=PATH_CACHE_SIZE, ttl=PATH_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.root_dir = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+        }
+
+    def get(self, root_dir, target, now=None):
+        """Returns (url, code, file, mimetype) or None"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if root_dir != self.root_dir:
+                self.entries.clear()
+                self.root_dir = root_dir
+            entry = self.entries.pop(target, None)
+            if entry is None or entry[0] < now:
+                self.counters['misses'] += 1
+                return None
+            self.entries[target] = entry
+            self.counters['hits'] += 1
+            return entry[1]
+
+    def add(self, root_dir, target, resolved, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            if root_dir != self.root_dir:
+                self.entries.clear()
+                self.root_dir = root_dir
+            self.entries.pop(target, None)
+            self.entries[target] = (now + self.ttl, resolved)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def remove(self, target):
+        with self.lock:
+            self.entries.pop(target, None)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self.entries)
+        return stats
+
+
+class ServerStatus(object):
+    """
+    ServerStatus counts responses of worker by status code and by path (the first max_paths paths,
+    the others are counted together). Counters with stats of server and log writer are shown at STATUS_URL.
+    """
+    def __init__(self, server_stats=None, log_writer=None, max_paths=STATUS_MAX_PATHS):
+        self.server_stats = server_stats
+        self.log_writer = log_writer
+        self.max_paths = max_paths
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.statuses = Counter()
+        self.paths = Counter()
+
+    def count(self, code, path=None):
+        with self.lock:
+            self.statuses[code] += 1
+            if path is not None:
+                if path not in self.paths and len(self.paths) >= self.max_paths:
+                    path = STATUS_OTHER_PATHS
+                self.paths[path] += 1
+
+    def report(self):
+        with self.lock:
+            report = {
+                'statuses': dict(self.statuses),
+                'paths': dict(self.paths),
+            }
+        report.update({
+            'pid': os.getpid(),
+            'uptime': time.time() - self.started,
+        })
+        if self.server_stats:
+            report['server'] = self.server_stats()
+        if self.log_writer:
+            report['log'] = self.log_writer.stats()
+        return report
 
 
 ############### Thread HTTP Server ###############
 
-class ThreadHTTPServer(object):
-    def __init__(self, host, port, root_dir,request_handler,
-                 sock_backlog=WORKER_QUEUE_SIZE, pool_size=100):
-        self.sock = None
+class BaseHTTPServer(object):
+    def __init__(self, host, port, root_dir, request_handler,
+                 sock_backlog=WORKER_QUEUE_SIZE, read_timeout=READ_TIMEOUT, idle_timeout=IDLE_TIMEOUT,
+                 file_cache_size=FILE_CACHE_SIZE, file_cache_max_file_size=FILE_CACHE_MAX_FILE_SIZE,
+                 path_cache_size=PATH_CACHE_SIZE, gzip_min_size=GZIP_MIN_SIZE, cache_control=None,
+                 graceful_timeout=GRACEFUL_TIMEOUT, server_status=True, log_writer=None, sock=None):
+        self.sock = sock
         self.sock_backlog = sock_backlog
-        self.pool_size = pool_size
+        self.stopping = False
+        self.graceful_timeout = graceful_timeout
 
         self.address = (host, port)
         self.root_dir = root_dir
         self.request_handler = request_handler
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.file_cache = None
+        if file_cache_size:
+            self.file_cache = FileCache(file_cache_size, file_cache_max_file_size, gzip_min_size)
+        self.path_cache = PathCache(path_cache_size) if path_cache_size else None
+        self.cache_control = cache_control
+        self.server_status = ServerStatus(self.stats, log_writer) if server_status else None
+
+        self.lock = threading.Lock()
+        self.counters = {
+            'accepted': 0,
+            'handled': 0,
+            'timeouts': 0,
+            'errors': 0,
+        }
 
-        self.create_socket()
+        if self.sock is None:
+            self.create_socket()
 
     def create_socket(self):
-        try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-            self.sock.bind(self.address)
-            self.sock.listen(self.sock_backlog)
-        except socket.error as e:
-            raise RuntimeError(e)
+        self.sock = create_listen_socket(self.address, self.sock_backlog)
 
     def serve_forever(self):
-        try:
-            pool = ThreadPool(self.pool_size)
+        raise NotImplementedError
+
+    def stop(self):
+        """Stop accepting and finish connections (it is called by signal handler)"""
+        self.stopping = True
+
+    def create_handler(self, conn, addr, run=False):
+        return self.request_handler(conn, addr, self.root_dir, run=run,
+                                    read_timeout=self.read_timeout, idle_timeout=self.idle_timeout,
+                                    file_cache=self.file_cache, path_cache=self.path_cache,
+                                    cache_control=self.cache_control, server_status=self.server_status)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        if self.file_cache:
+            stats['file_cache'] = self.file_cache.stats()
+        if self.path_cache:
+            stats['path_cache'] = self.path_cache.stats()
+        return stats
+
+
+class ThreadHTTPServer(BaseHTTPServer):
+    """
+    ThreadHTTPServer accepts connections and passes them to pool of threads through bounded queue.
+    Accept loop waits while the queue is full, so extra connections stay in listen backlog.
+    """
+    def __init__(self, host, port, root_dir, request_handler,
+                 sock_backlog=WORKER_QUEUE_SIZE, pool_size=POOL_SIZE, queue_size=ACCEPT_QUEUE_SIZE, **kwargs):
+        self.pool_size = pool_size
+        self.queue = Queue.Queue(queue_size)
+        self.busy_threads = 0
+        self.handlers = set()
+        super(ThreadHTTPServer, self).__init__(host, port, root_dir, request_handler, sock_backlog, **kwargs)
+        self.counters['queue_full'] = 0
 
-            while True:
-                conn, addr = self.sock.accept()
-                logging.debug('Connected | P: {} | PID: {}'.format(
-                    multiprocessing.current_process().name, os.getpid()))
-                pool.apply(self.request_handler, args=(conn, addr, self.root_dir, True))
+    def serve_forever(self):
+        try:
+            for i in range(self.pool_size):
+                thread = threading.Thread(target=self.process_connections)
+                thread.daemon = True
+                thread.start()
+
+            # listening socket is shared by workers, accept is woken up to check stop
+            self.sock.settimeout(POLL_TIMEOUT)
+            while not self.stopping:
+                try:
+                    conn, addr = self.sock.accept()
+                except socket.timeout:
+                    continue
+                except socket.error as e:
+                    if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR, errno.ECONNABORTED):
+                        continue
+                    raise
+                conn.settimeout(None)
+                if logging.root.isEnabledFor(logging.DEBUG):
+                    logging.debug('Connected | P: {} | PID: {}'.format(
+                        multiprocessing.current_process().name, os.getpid()))
+                self.count('accepted')
+                try:
+                    self.queue.put_nowait((conn, addr))
+                except Queue.Full:
+                    self.count('queue_full')
+                    self.wait_queue(conn, addr)
 
         except (KeyboardInterrupt, SystemExit) as e:
             pass
         finally:
             self.sock.close()
-            logging.debug('Stopped | P: {} | PID: {}'.format(
-                    multiprocessing.current_process().name, os.getpid()))
+            self.finish_connections()
+            logging.debug('Stopped | P: {} | PID: {} | {}'.format(
+                    multiprocessing.current_process().name, os.getpid(), self.stats()))
+
+    def wait_queue(self, conn, addr):
+        """Wait for free place in queue, stop of server isn't delayed by busy threads"""
+        while True:
+            try:
+                self.queue.put((conn, addr), timeout=POLL_TIMEOUT)
+                return
+            except Queue.Full:
+                if self.stopping:
+                    conn.close()
+                    self.count('handled')
+                    return
+
+    def finish_connections(self):
+        """Wait for queued and active connections, keep-alive connections are closed after response"""
+        self.stopping = True
+        deadline = time.time() + self.graceful_timeout
+        while time.time() < deadline:
+            with self.lock:
+                for handler in self.handlers:
+                    handler.stop()
+                if not self.busy_threads and self.queue.empty():
+                    return
+            time.sleep(0.1)
+        logging.warning('Connections are not finished in {} seconds'.format(self.graceful_timeout))
+
+    def process_connections(self):
+        while True:
+            conn, addr = self.queue.get()
+            handler = None
+            with self.lock:
+                self.busy_threads += 1
+            try:
+                handler = self.create_handler(conn, addr)
+                with self.lock:
+                    self.handlers.add(handler)
+                    handler.stopping = self.stopping
+                handler.run()
+            except socket.timeout:
+                self.count('timeouts')
+            except socket.error as e:
+                logging.debug('Connection {} failed: {}'.format(addr, e))
+                self.count('errors')
+            except Exception as e:
+                logging.exception('Connection {} failed: {}'.format(addr, e))
+                self.count('errors')
+            finally:
+                with self.lock:
+                    self.handlers.discard(handler)
+                    self.busy_threads -= 1
+                    self.counters['handled'] += 1
+
+    def stats(self):
+        stats = super(ThreadHTTPServer, self).stats()
+        stats.update({
+            'threads': self.pool_size,
+            'busy_threads': self.busy_threads,
+            'utilization': float(self.busy_threads) / self.pool_size,
+            'queued': self.queue.qsize(),
+        })
+        return stats
 
 
 class RequestHandler(object):
     """RequestHandler is a class for processing client requests"""
-    def __init__(self, connection, client_address, root_dir, run=False):
+    use_sendfile = sendfile is not None
+    use_gzip = True
+
+    def __init__(self, connection, client_address, root_dir, run=False,
+                 read_timeout=READ_TIMEOUT, idle_timeout=IDLE_TIMEOUT, file_cache=None, path_cache=None,
+                 cache_control=None, server_status=None):
         self.conn = connection
         self.client_address = client_address
         self.root_dir = root_dir
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.file_cache = file_cache
+        self.path_cache = path_cache
+        self.server_status = server_status
+        self.cache_control = CONFIG['CACHE_CONTROL'] if cache_control is None else cache_control
+        self.requests_count = 0
 
         self.index_file = INDEX_FILE
         self.buf_size = BUFFER_SIZE
@@ -235,21 +1182,28 @@ class RequestHandler(object):
         self.line_separator = LINE_SEPARATOR
 
         self.keep_alive = False
-
-        # service
-        self.process = multiprocessing.current_process().name
-        self.thread = threading.current_thread().name
-
-        self.debug_info = ' | P: {} | T: {} | PID: {}'.format(self.process, self.thread, os.getpid())
+        self.parser = RequestParser()
+        # worker is stopped: connection is closed after response or while it waits for request
+        self.stopping = False
+        self.idle = False
 
         if run:
             self.run()
 
+    @property
+    def debug_info(self):
+        return ' | P: {} | T: {} | PID: {}'.format(
+            multiprocessing.current_process().name, threading.current_thread().name, os.getpid())
+
     def run(self):
         try:
-            logging.debug('Request handler running' + self.debug_info)
+            if logging.root.isEnabledFor(logging.DEBUG):
+                logging.debug('Request handler running' + self.debug_info)
             self.handle_request()
             while self.keep_alive:
+                self.idle = not self.parser.has_data()
+                if self.stopping:
+                    break
                 self.handle_request()
         finally:
             self.shutdown()
@@ -257,64 +1211,91 @@ class RequestHandler(object):
     def shutdown(self):
         self.conn.close()
 
+    def stop(self):
+        self.stopping = True
+        if self.idle:
+            # wake up thread waiting for the next request
+            try:
+                self.conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
     def handle_request(self):
         self.keep_alive = False
 
-        raw_data = self.recv_data()
-        request = self.parse_request(raw_data)
+        try:
+            received = self.recv_request()
+        except BadRequest as e:
+            logging.debug('Bad request from {}: {}'.format(self.client_address, e))
+            received = '', EMPTY_REQUEST
+        # connection is closed by client
+        if received is None:
+            return
+
+        raw_data, request = received
+        self.requests_count += 1
         raw_response = self.process_request(request)
-
-        logging.debug('New request from {}{}\n{}'.format(self.client_address,
-                                                         self.debug_info,
-                                                         raw_data))
-        logging.debug('Raw response to {}{}\n{}'.format(
-            self.client_address,
-            self.debug_info,
-            '\n'.join('{}: {}'.format(k,v) for k,v in raw_response.items())
-        ))
-
-        logging.info('({addr}) "{method} {url} {version}" {code}'.format(
-            addr = self.client_address[0],
-            method = request['method'],
-            url = request['url'],
-            version = request['version'],
-            code = raw_response['code']
-        ))
-
-        if raw_response['code'] != OK:
-            return self.do_ERROR(raw_response)
+        self.log_request(raw_data, request, raw_response)
+        # every send of response has the same timeout
+        self.conn.settimeout(self.read_timeout)
 
         # Connection: Keep-Alive
         if raw_response['headers']['Connection'] == 'Keep-Alive':
             self.keep_alive = True
 
+        if raw_response['code'] not in (OK, PARTIAL_CONTENT):
+            return self.do_ERROR(raw_response)
+
         method = getattr(self, 'do_' + raw_response['method'])
         return method(raw_response)
 
-    def parse_request(self, raw_data):
-        request = {
-            'method': '',
-            'url': '',
-            'version': '',
-            'headers': {}
-        }
-        request_lines = raw_data.split(self.line_separator)
-
-        first_line = request_lines[0].split()
-        if len(first_line) == 3:
-            method, url, version = first_line
-            request['method'] = method
-            request['url'] = url
-            request['version'] = version
-
-        for line in request_lines[1:]:
-            # Check empty line
-            if not line.split():
-                break
-            k, v = line.split(':', 1)
-            request['headers'][k.lower()] = v.strip()
+    def log_request(self, raw_data, request, raw_response):
+        if self.server_status:
+            url = request['url']
+            self.server_status.count(raw_response['code'], url.split('?', 1)[0] if url else None)
+
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug('New request from {}{}\n{}'.format(self.client_address,
+                                                             self.debug_info,
+                                                             raw_data))
+            logging.debug('Raw response to {}{}\n{}'.format(
+                self.client_address,
+                self.debug_info,
+                '\n'.join('{}: {}'.format(k,v) for k,v in raw_response.items())
+            ))
+
+        # arguments are formatted by log writer only if record is written
+        logging.info('(%s) "%s %s %s" %s', self.client_address[0], request['method'], request['url'],
+                     request['version'], raw_response['code'])
+
+    def resolve_path(self, target):
+        """
+        Resolve request target to file.
+        :return: (cleaned url, response code, file, MIME type)
+        """
+        if self.path_cache:
+            resolved = self.path_cache.get(self.root_dir, target)
+            if resolved:
+                return resolved
+
+        url = get_cleaned_url_wo_query_string(target)
+        code, mimetype = OK, None
+        # Check file exists (if url is folder check index file in this folder)
+        file = file_finder(self.root_dir, self.index_file, url)
+        if not file:
+            code = NOT_FOUND
+        # Check file is readable
+        elif not os.access(file, os.R_OK):
+            code = FORBIDDEN
+        else:
+            mimetype = get_file_mimetype(file)
+            if mimetype not in ALLOWED_CONTENT_TYPES:
+                code = FORBIDDEN
 
-        return request
+        resolved = (url, code, file, mimetype)
+        if self.path_cache:
+            self.path_cache.add(self.root_dir, target, resolved)
+        return resolved
 
     def process_request(self, request):
         response = {
@@ -322,8 +1303,11 @@ class RequestHandler(object):
             'method': None,
             'url': None,
             'file': None,
+            'body': None,
+            # body of response: bytes or (offset, count) of file
+            'parts': [],
             'headers': {
-                'Date': time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime()),
+                'Date': format_http_date(time.time()),
                 'Server': SERVER_VERSION,
                 'Content-Type': 'text/html',
                 'Content-Length': '0',
@@ -337,43 +1321,158 @@ class RequestHandler(object):
             response['code'] = NOT_ALLOWED
             return response
 
-        url = get_cleaned_url_wo_query_string(request['url'])
+        if self.server_status and request['url'].split('?', 1)[0] == STATUS_URL:
+            return self.process_status_request(request, response)
 
-        # Check file exists (if url is folder check index file in this folder)
-        file = file_finder(self.root_dir, self.index_file, url)
-        if not file:
-            response['code'] = NOT_FOUND
+        url, code, file, mimetype = self.resolve_path(request['url'])
+        if code != OK:
+            response['code'] = code
             return response
 
-        # Check file is readable
-        if not os.access(file, os.R_OK):
-            response['code'] = FORBIDDEN
-            return response
+        # Cached file was found and checked already
+        cached = self.file_cache.get(url) if self.file_cache else None
+        if cached:
+            file_size = cached.size
+            etag, last_modified, mtime = cached.etag, cached.last_modified, cached.mtime
+        else:
+            try:
+                stat = os.stat(file)
+                if self.file_cache:
+                    cached = self.file_cache.add(url, file, mimetype, stat)
+            except (IOError, OSError):
+                # file was removed after its path was resolved
+                if self.path_cache:
+                    self.path_cache.remove(request['url'])
+                response['code'] = NOT_FOUND
+                return response
+            if cached:
+                file_size = cached.size
+                etag, last_modified, mtime = cached.etag, cached.last_modified, cached.mtime
+            else:
+                file_size = stat.st_size
+                etag, last_modified, mtime = make_etag(stat), format_http_date(stat.st_mtime), stat.st_mtime
+
+        self.set_connection(request, response)
+
+        cache_control = self.get_cache_control(file)
+        if cache_control:
+            response['headers']['Cache-Control'] = cache_control
+
+        body = cached.body if cached else None
+        if mimetype in GZIP_CONTENT_TYPES:
+            response['headers']['Vary'] = 'Accept-Encoding'
+            if self.use_gzip and accepts_gzip(request['headers'].get('accept-encoding')):
+                if cached:
+                    gzip_body = self.file_cache.get_gzip_body(cached)
+                    if gzip_body:
+                        body, file_size, etag = gzip_body, len(gzip_body), gzip_etag(etag)
+                        response['headers']['Content-Encoding'] = 'gzip'
+                else:
+                    gz_file, gz_stat = find_precompressed(file, mtime)
+                    if gz_file:
+                        file, file_size, etag = gz_file, gz_stat.st_size, gzip_etag(etag)
+                        response['headers']['Content-Encoding'] = 'gzip'
 
-        file_size = os.path.getsize(file)
+        response['headers'].update({
+            'ETag': etag,
+            'Last-Modified': last_modified,
+        })
 
-        mimetype = get_file_mimetype(file)
-        if mimetype not in ALLOWED_CONTENT_TYPES:
-            response['code'] = FORBIDDEN
+        if is_not_modified(request['headers'], etag, mtime):
+            response['code'] = NOT_MODIFIED
+            del response['headers']['Content-Type']
+            del response['headers']['Content-Length']
             return response
 
-        connection = request['headers'].get('connection')
-        if connection and connection.lower() == 'keep-alive':
-            response['headers']['Connection'] = 'Keep-Alive'
-
         response.update({
             'code': OK,
             'method': request['method'],
             'url': url,
             'file': file,
             'file_size': file_size,
+            'body': body,
+            'parts': [(0, file_size)],
         })
         response['headers'].update({
                 'Content-Type': mimetype,
                 'Content-Length': file_size,
+                'Accept-Ranges': 'bytes',
+        })
+        if request['method'] == 'GET' and 'range' in request['headers']:
+            self.set_ranges(request['headers'], response, etag, last_modified)
+        return response
+
+    def set_connection(self, request, response):
+        connection = request['headers'].get('connection')
+        if connection and connection.lower() == 'keep-alive' and not self.stopping:
+            response['headers']['Connection'] = 'Keep-Alive'
+
+    def process_status_request(self, request, response):
+        """Counters and stats of worker in JSON"""
+        self.set_connection(request, response)
+        body = json.dumps(self.server_status.report(), sort_keys=True)
+        response.update({
+            'code': OK,
+            'method': request['method'],
+            'url': STATUS_URL,
+            'body': body,
+            'parts': [(0, len(body))],
+        })
+        response['headers'].update({
+            'Content-Type': 'application/json',
+            'Content-Length': len(body),
+            'Cache-Control': 'no-cache',
         })
         return response
 
+    def set_ranges(self, request_headers, response, etag, last_modified):
+        """Make partial response for Range header (if file isn't changed since If-Range)"""
+        if_range = request_headers.get('if-range')
+        if if_range and if_range not in (etag, last_modified):
+            return
+        size = response['file_size']
+        ranges = parse_range(request_headers['range'], size)
+        if ranges is None:
+            return
+
+        headers = response['headers']
+        if not ranges:
+            response['code'] = RANGE_NOT_SATISFIABLE
+            response['parts'] = []
+            headers.update({
+                'Content-Range': 'bytes */{}'.format(size),
+                'Content-Type': 'text/html',
+                'Content-Length': 0,
+            })
+            return
+
+        response['code'] = PARTIAL_CONTENT
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            response['parts'] = [(start, end - start + 1)]
+            headers.update({
+                'Content-Range': 'bytes {}-{}/{}'.format(start, end, size),
+                'Content-Length': end - start + 1,
+            })
+            return
+
+        boundary = uuid.uuid4().hex
+        parts = []
+        for start, end in ranges:
+            parts.append('{}--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n'.format(
+                '\r\n' if parts else '', boundary, headers['Content-Type'], start, end, size))
+            parts.append((start, end - start + 1))
+        parts.append('\r\n--{}--\r\n'.format(boundary))
+        response['parts'] = parts
+        headers.update({
+            'Content-Type': 'multipart/byteranges; boundary={}'.format(boundary),
+            'Content-Length': sum(part[1] if isinstance(part, tuple) else len(part) for part in parts),
+        })
+
+    def get_cache_control(self, file):
+        _, ext = os.path.splitext(file)
+        return self.cache_control.get(ext.lower(), self.cache_control.get('*'))
+
     def do_ERROR(self, raw_response):
         self.send_data(self.create_response(raw_response))
 
@@ -381,11 +1480,12 @@ class RequestHandler(object):
         self.send_data(self.create_response(raw_response))
 
     def do_GET(self, raw_response):
-        self.send_data(
-            self.create_response(raw_response),
-            file=raw_response.get('file'),
-            file_size=raw_response.get('file_size'),
-        )
+        data = self.create_response(raw_response)
+        if raw_response['body'] is not None:
+            for part in iter_body_parts(raw_response['body'], raw_response['parts']):
+                data += part
+            return self.send_data(data)
+        self.send_data(data, file=raw_response['file'], parts=raw_response['parts'])
 
     def create_response(self, response):
         if not isinstance(self.line_separator, str):
@@ -401,82 +1501,526 @@ class RequestHandler(object):
             self.termination
         ))
 
-    def recv_data(self):
-        buf = bytearray(b'')
+    def recv_request(self):
+        """
+        Returns (raw_data, request) or None if connection is closed before the end of request.
+        Raises socket.timeout if request isn't received in read_timeout seconds.
+        """
+        deadline = time.time() + self.read_timeout if self.parser.has_data() else None
+        self.conn.settimeout(self.idle_timeout if self.requests_count else self.read_timeout)
         while True:
+            received = self.parser.next_request()
+            if received:
+                return received
+            if deadline is not None:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    raise socket.timeout('Request is not received in {} seconds'.format(self.read_timeout))
+                self.conn.settimeout(timeout)
+
             data = self.conn.recv(self.buf_size)
             if not data:
+                return None
+            if deadline is None:
+                deadline = time.time() + self.read_timeout
+            self.idle = False
+            self.parser.feed(data)
+
+    def send_data(self, data, file=None, parts=()):
+        """Send data and then parts of response (bytes or (offset, count) of file)"""
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("Response to {}{}\n{}<file: {}>".format(self.client_address,
+                                                        self.debug_info,
+                                                        data,
+                                                        file))
+        if not file:
+            self.conn.sendall(data)
+            return
+
+        unsent = 0
+        set_tcp_cork(self.conn, True)
+        try:
+            with io.open(file, 'rb', buffering=0) as fd:
+                for part in parts:
+                    if not isinstance(part, tuple):
+                        data += part
+                        continue
+                    offset, count = part
+                    if self.use_sendfile:
+                        unsent += self.send_file_zero_copy(data, fd, offset, count)
+                    else:
+                        unsent += self.send_file_buffered(data, fd, offset, count)
+                    data = b''
+            if data:
+                self.conn.sendall(data)
+        finally:
+            set_tcp_cork(self.conn, False)
+        # file was truncated, so Content-Length is wrong
+        if unsent:
+            self.keep_alive = False
+
+    def send_file_zero_copy(self, data, fd, offset, count):
+        """Returns count of bytes which aren't sent"""
+        if data:
+            self.conn.sendall(data)
+        while count > 0:
+            try:
+                sent = sendfile(self.conn.fileno(), fd.fileno(), offset, count)
+            except OSError as e:
+                # socket with timeout is non-blocking
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+                wait_writable(self.conn, self.conn.gettimeout())
+                continue
+            if not sent:
                 break
-            if self.termination in buf[len(self.termination)-1:] + data:
-                buf += data
+            offset += sent
+            count -= sent
+        return count
+
+    def send_file_buffered(self, data, fd, offset, count):
+        """Returns count of bytes which aren't sent"""
+        fd.seek(offset)
+        buf = bytearray(max(FILE_CHUNK_SIZE, len(data)))
+        view = memoryview(buf)
+        # headers are sent in one write with the first bytes of file
+        pos = len(data)
+        buf[:pos] = data
+        while True:
+            read = fd.readinto(view[pos:pos + count]) if count > 0 else 0
+            count -= read
+            if not pos + read:
                 break
-            buf += data
-        return str(buf)
+            self.conn.sendall(view[:pos + read])
+            pos = 0
+        return count
 
-    def send_data(self, data, file=None, file_size=None):
-        logging.debug("Response to {}{}\n{}<file: {}>".format(self.client_address,
-                                                    self.debug_info,
-                                                    data,
-                                                    file))
-        if not isinstance(data, bytearray):
-            data = bytearray(data)
-        buf = bytearray()
 
-        if file:
-            fd = io.open(file, 'rb')
+############### Epoll HTTP Server ###############
 
+class EpollHTTPServer(BaseHTTPServer):
+    """EpollHTTPServer serves all connections of worker in one thread with non-blocking sockets"""
+    def __init__(self, host, port, root_dir, request_handler,
+                 sock_backlog=WORKER_QUEUE_SIZE, **kwargs):
+        self.epoll = None
+        self.connections = {}
+        super(EpollHTTPServer, self).__init__(host, port, root_dir, request_handler, sock_backlog, **kwargs)
+
+    def serve_forever(self):
+        # epoll is created in worker process, it can't be shared after fork
+        self.sock.setblocking(0)
+        self.epoll = select.epoll()
+        self.epoll.register(self.sock.fileno(), select.EPOLLIN)
+        deadline = None
         try:
             while True:
-                if data:
-                    buf += data[:self.buf_size]
-                    data = data[self.buf_size:]
-                if file:
-                    buf += fd.read(self.buf_size-len(buf))
-                if not buf:
-                    break
+                if self.stopping:
+                    if deadline is None:
+                        deadline = time.time() + self.graceful_timeout
+                        self.epoll.unregister(self.sock.fileno())
+                    if not self.finish_connections() or time.time() > deadline:
+                        break
+                try:
+                    events = self.epoll.poll(POLL_TIMEOUT)
+                except IOError as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                for fd, event in events:
+                    if fd == self.sock.fileno():
+                        self.accept()
+                    else:
+                        self.handle_event(fd, event)
+                self.close_expired_connections()
 
-                chuck = self.conn.send(buf)
-                buf = buf[chuck:]
+        except (KeyboardInterrupt, SystemExit) as e:
+            pass
         finally:
-            if file: fd.close()
+            for fd in list(self.connections):
+                self.close_connection(fd)
+            self.epoll.close()
+            self.sock.close()
+            logging.debug('Stopped | P: {} | PID: {} | {}'.format(
+                    multiprocessing.current_process().name, os.getpid(), self.stats()))
 
+    def accept(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error as e:
+                if e.errno == errno.ECONNABORTED:
+                    continue
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    logging.error('Accept failed: {}'.format(e))
+                return
+            conn.setblocking(0)
+            handler = self.create_handler(conn, addr)
+            self.connections[conn.fileno()] = handler
+            self.counters['accepted'] += 1
+            self.epoll.register(conn.fileno(), handler.events)
+
+    def handle_event(self, fd, event):
+        handler = self.connections[fd]
+        events = handler.events
+        try:
+            if event & (select.EPOLLERR | select.EPOLLHUP):
+                events = None
+            else:
+                events = handler.handle_event()
+        except socket.error as e:
+            logging.debug('Connection {} failed: {}'.format(handler.client_address, e))
+            self.counters['errors'] += 1
+            events = None
+        except Exception as e:
+            logging.exception('Connection {} failed: {}'.format(handler.client_address, e))
+            self.counters['errors'] += 1
+            events = None
+
+        if events is None:
+            self.close_connection(fd)
+        elif events != handler.events:
+            handler.events = events
+            self.epoll.modify(fd, events)
+
+    def close_connection(self, fd):
+        handler = self.connections.pop(fd)
+        self.epoll.unregister(fd)
+        handler.shutdown()
+        self.counters['handled'] += 1
+
+    def finish_connections(self):
+        """Close idle connections, the others are closed after response. Returns count of left connections"""
+        for fd, handler in list(self.connections.items()):
+            handler.stopping = True
+            if handler.is_idle():
+                self.close_connection(fd)
+        return len(self.connections)
+
+    def close_expired_connections(self):
+        now = time.time()
+        for fd, handler in list(self.connections.items()):
+            if handler.is_expired(now):
+                self.close_connection(fd)
+                self.counters['timeouts'] += 1
+
+    def stats(self):
+        stats = super(EpollHTTPServer, self).stats()
+        stats['connections'] = len(self.connections)
+        return stats
+
+
+class EpollRequestHandler(RequestHandler):
+    """
+    EpollRequestHandler is a state machine of non-blocking connection:
+    read request -> write headers -> write file -> read next request (keep-alive) or close
+    """
+    def __init__(self, connection, client_address, root_dir, **kwargs):
+        super(EpollRequestHandler, self).__init__(connection, client_address, root_dir, **kwargs)
+        self.events = select.EPOLLIN
+        self.last_activity = time.time()
+        self.request_started = None
+
+        self.out_buf = b''
+        self.out_pos = 0
+        self.file = None
+        self.file_offset = 0
+        self.file_remaining = 0
+        self.parts = deque()
+
+    def shutdown(self):
+        self.close_file()
+        super(EpollRequestHandler, self).shutdown()
+
+    def close_file(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            self.file_remaining = 0
+            self.parts.clear()
+
+    def is_expired(self, now):
+        """Request is received too long (slow client) or connection is idle"""
+        if self.request_started is not None:
+            return now - self.request_started > self.read_timeout
+        if self.events == select.EPOLLIN:
+            timeout = self.idle_timeout if self.requests_count else self.read_timeout
+            return now - self.last_activity > timeout
+        return now - self.last_activity > self.read_timeout
+
+    def is_idle(self):
+        """Connection waits for the next request"""
+        return self.events == select.EPOLLIN and self.request_started is None and not self.parser.has_data()
+
+    def handle_event(self):
+        """Returns events to wait for or None if connection should be closed"""
+        self.last_activity = time.time()
+        if self.events == select.EPOLLIN:
+            return self.read()
+        return self.write()
+
+    def read(self):
+        try:
+            data = self.conn.recv(self.buf_size)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return select.EPOLLIN
+            raise
+        if not data:
+            return None
+        if self.request_started is None:
+            self.request_started = self.last_activity
+        self.parser.feed(data)
+        return self.process_buffer()
+
+    def process_buffer(self):
+        """Serves received (pipelined) requests until response would block, returns events to wait for"""
+        while True:
+            try:
+                received = self.parser.next_request()
+            except BadRequest as e:
+                logging.debug('Bad request from {}: {}'.format(self.client_address, e))
+                received = '', EMPTY_REQUEST
+            if received is None:
+                return select.EPOLLIN
+            self.start_response(*received)
+            if not self.send_response():
+                return select.EPOLLOUT
+            if not self.finish_response():
+                return None
+
+    def start_response(self, raw_data, request):
+        # the next request could be received already
+        self.request_started = time.time() if self.parser.has_data() else None
+        self.requests_count += 1
+
+        self.keep_alive = False
+        raw_response = self.process_request(request)
+        self.log_request(raw_data, request, raw_response)
+
+        self.out_buf = self.create_response(raw_response)
+        self.out_pos = 0
+        self.keep_alive = raw_response['headers']['Connection'] == 'Keep-Alive'
+        if raw_response['code'] in (OK, PARTIAL_CONTENT) and raw_response['method'] == 'GET':
+            if raw_response['body'] is not None:
+                for part in iter_body_parts(raw_response['body'], raw_response['parts']):
+                    self.out_buf += part
+            else:
+                self.open_file(raw_response['file'], raw_response['parts'])
+
+    def open_file(self, path, parts):
+        self.file = io.open(path, 'rb', buffering=0)
+        self.parts.extend(parts)
+        # headers and parts are sent in full packets
+        set_tcp_cork(self.conn, True)
+
+    def next_part(self):
+        part = self.parts.popleft()
+        if isinstance(part, tuple):
+            self.file_offset, self.file_remaining = part
+            if not self.use_sendfile:
+                self.file.seek(self.file_offset)
+        else:
+            self.out_buf = part
+            self.out_pos = 0
+
+    def read_file(self, size):
+        data = self.file.read(min(size, self.file_remaining))
+        self.file_remaining -= len(data)
+        return data
+
+    def write(self):
+        if not self.send_response():
+            return select.EPOLLOUT
+        if not self.finish_response():
+            return None
+        # the next request could be received already
+        return self.process_buffer()
+
+    def send_response(self):
+        """Returns False if the rest of response waits for free space in socket buffer"""
+        try:
+            while self.out_pos < len(self.out_buf) or self.file_remaining or self.parts:
+                if self.out_pos < len(self.out_buf):
+                    self.out_pos += self.conn.send(memoryview(self.out_buf)[self.out_pos:])
+                    continue
+                if not self.file_remaining:
+                    self.next_part()
+                    continue
+                if self.use_sendfile:
+                    sent = sendfile(self.conn.fileno(), self.file.fileno(), self.file_offset, self.file_remaining)
+                    self.file_offset += sent
+                    self.file_remaining -= sent
+                else:
+                    self.out_buf = self.read_file(FILE_CHUNK_SIZE)
+                    self.out_pos = 0
+                    sent = len(self.out_buf)
+                if not sent:
+                    # file was truncated, so Content-Length is wrong
+                    self.keep_alive = False
+                    break
+        except (socket.error, OSError) as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return False
+            raise
+        return True
+
+    def finish_response(self):
+        """Returns True if connection is kept for the next request"""
+        if self.file:
+            self.close_file()
+            set_tcp_cork(self.conn, False)
+        self.out_buf = b''
+        return self.keep_alive
+
+
+SERVING_MODES = {
+    'threaded': (ThreadHTTPServer, RequestHandler),
+    'epoll': (EpollHTTPServer, EpollRequestHandler),
+}
 
-############### MAIN ###############
 
-def main(host, port, root_dir, workers):
-    root_dir = os.path.abspath(root_dir)
-    multi_socket = True if workers > 1 else False
-    
-    logging.info('Starting server at {} port with {} workers:'.format(port, workers))
+############### MAIN ###############
 
-    processes = []
+def create_server(config, sock=None, log_writer=None):
+    """Server of worker with serving mode and options from config"""
+    server_class, handler_class = SERVING_MODES[config['MODE']]
+    handler_class.use_sendfile = config['SENDFILE'] and sendfile is not None
+    handler_class.use_gzip = config['GZIP']
+    server_options = {
+        'read_timeout': config['READ_TIMEOUT'],
+        'idle_timeout': config['IDLE_TIMEOUT'],
+        'graceful_timeout': config['GRACEFUL_TIMEOUT'],
+        'file_cache_size': config['FILE_CACHE_SIZE'],
+        'file_cache_max_file_size': config['FILE_CACHE_MAX_FILE_SIZE'],
+        'path_cache_size': config['PATH_CACHE_SIZE'],
+        'gzip_min_size': config['GZIP_MIN_SIZE'],
+        'cache_control': config['CACHE_CONTROL'],
+        'server_status': config['SERVER_STATUS'],
+        'log_writer': log_writer,
+    }
+    if config['MODE'] == 'threaded':
+        server_options.update({'pool_size': config['THREADS'], 'queue_size': config['QUEUE_SIZE']})
+    return server_class(config['BIND_HOST'], config['BIND_PORT'], os.path.abspath(config['DOCUMENT_ROOT']),
+                        handler_class, sock=sock, **server_options)
+
+
+def run_worker(config, sock):
+    # signals of terminal are handled by master
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    log_writer = LogWriter().start()
     try:
-        for i in range(workers):
-            server = ThreadHTTPServer(host, port, root_dir, RequestHandler)
-            p = multiprocessing.Process(target=server.serve_forever)
-            processes.append(p)
-            p.start()
-            logging.info('Worker {} started with PID: {}'.format(i+1, p.pid))
-        for p in processes:
-            p.join()
-    except (KeyboardInterrupt, SystemExit):
-        for process in processes:
-            if process:
-                pid = process.pid
-                logging.info('Trying to shutting down process {}'.format(pid))
-                process.terminate()
-                logging.info('Process {} terminated...'.format(pid))
+        server = create_server(config, sock, log_writer)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+        server.serve_forever()
     finally:
-        logging.info('Server stopped.')
+        log_writer.stop()
+
+
+class Master(object):
+    """
+    Master opens listening socket once and runs workers with it, exited workers are respawned.
+    SIGHUP - config is reloaded, new workers are started and the old ones finish their connections.
+    SIGTERM, SIGINT - workers finish their connections and server is stopped.
+    """
+    def __init__(self, config, reload_config=None):
+        self.config = config
+        self.reload_config = reload_config
+        self.sock = create_listen_socket((config['BIND_HOST'], config['BIND_PORT']))
+        # workers with current config and old ones which finish their connections
+        self.workers = []
+        self.retired = []
+        self.stopping = False
+        self.reloading = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        logging.info('Starting server at {} port with {} {} workers:'.format(
+            self.config['BIND_PORT'], self.config['WORKERS'], self.config['MODE']))
+        try:
+            self.workers = [self.start_worker() for _ in range(self.config['WORKERS'])]
+            while not self.stopping:
+                if self.reloading:
+                    self.reload()
+                self.check_workers()
+                time.sleep(SUPERVISE_INTERVAL)
+        finally:
+            self.stop_workers(self.workers + self.retired)
+            self.sock.close()
+            logging.info('Server stopped.')
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def handle_reload(self, signum, frame):
+        self.reloading = True
+
+    def start_worker(self):
+        process = multiprocessing.Process(target=run_worker, args=(self.config, self.sock))
+        process.start()
+        logging.info('Worker started with PID: {}'.format(process.pid))
+        return process
+
+    def check_workers(self):
+        for i, process in enumerate(self.workers):
+            if not process.is_alive():
+                logging.error('Worker {} exited with code {}, restarting'.format(process.pid, process.exitcode))
+                self.workers[i] = self.start_worker()
+        # is_alive also reaps exited processes
+        self.retired = [process for process in self.retired if process.is_alive()]
+
+    def reload(self):
+        self.reloading = False
+        logging.info('Reloading config')
+        try:
+            config = self.reload_config() if self.reload_config else self.config
+        except Exception as e:
+            logging.error('Config is not reloaded: {}'.format(e))
+            return
+        address = (config['BIND_HOST'], config['BIND_PORT'])
+        if address != (self.config['BIND_HOST'], self.config['BIND_PORT']):
+            logging.warning('Listening address is changed by restart only')
+            config['BIND_HOST'], config['BIND_PORT'] = self.config['BIND_HOST'], self.config['BIND_PORT']
+        self.config = config
+
+        # new workers accept connections before the old ones stop
+        old_workers = self.workers
+        self.workers = [self.start_worker() for _ in range(config['WORKERS'])]
+        for process in old_workers:
+            logging.info('Stopping worker {}'.format(process.pid))
+            process.terminate()
+        self.retired.extend(old_workers)
+
+    def stop_workers(self, workers):
+        for process in workers:
+            if process.is_alive():
+                logging.info('Stopping worker {}'.format(process.pid))
+                process.terminate()
+        deadline = time.time() + self.config['GRACEFUL_TIMEOUT'] + SUPERVISE_INTERVAL
+        for process in workers:
+            process.join(max(deadline - time.time(), 0))
+            if process.is_alive():
+                logging.warning('Worker {} is killed'.format(process.pid))
+                os.kill(process.pid, signal.SIGKILL)
+                process.join()
+
+
+def main(config, reload_config=None):
+    Master(config, reload_config).run()
 
 
 if __name__ == '__main__':
     args = parse_args()
-    config = load_config(CONFIG, args.config)
-    config = update_config_with_parse_args(config, args)
+
+    def read_config():
+        config = load_config(dict(CONFIG), args.config)
+        return update_config_with_parse_args(config, args)
+
+    config = read_config()
     setup_logger(args.logfile or config['LOGGING_FILE'], level=LOGGING_LEVEL)
     try:
-        main(config['BIND_HOST'], config['BIND_PORT'],
-             config['DOCUMENT_ROOT'], workers = config['WORKERS'])
+        main(config, reload_config=read_config)
     except Exception as e:
         logging.exception(e)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+from context import httpd
+from utils import get
+
+
+TEXT = b'<html>' + b'compressed text ' * 200 + b'</html>'
+ACCEPT_GZIP = 'Accept-Encoding: gzip\r\n'
+
+
+class TestAcceptsGzip(unittest.TestCase):
+    def test_accepts_gzip(self):
+        for value, expected in [
+            (None, False),
+            ('', False),
+            ('gzip', True),
+            ('GZIP', True),
+            ('deflate, gzip', True),
+            ('gzip;q=0.5', True),
+            ('gzip; q=0', False),
+            ('gzip;q=invalid', False),
+            ('*', True),
+            ('*;q=0', False),
+            ('deflate, br', False),
+            ('x-gzip', False),
+        ]:
+            self.assertEqual(httpd.accepts_gzip(value), expected, value)
+
+
+class TestGzipCompress(unittest.TestCase):
+    def test_compressed_data_is_gzip(self):
+        data = httpd.gzip_compress(TEXT)
+        self.assertEqual(data[:2], b'\x1f\x8b')
+        self.assertEqual(zlib.decompress(data, 16 + zlib.MAX_WBITS), TEXT)
+        self.assertLess(len(data), len(TEXT))
+
+    def test_gzip_etag(self):
+        self.assertEqual(httpd.gzip_etag('"1-2-3"'), '"1-2-3-gzip"')
+
+
+class TestGzipResponses(unittest.TestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.root_dir, 'page.html')
+        with open(self.file, 'wb') as f:
+            f.write(TEXT)
+        with open(self.file + '.gz', 'wb') as f:
+            f.write(httpd.gzip_compress(TEXT))
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def create_handler(self, file_cache=None):
+        return httpd.RequestHandler(None, ('127.0.0.1', 0), self.root_dir, file_cache=file_cache, cache_control={})
+
+    def test_etag_is_stable_with_and_without_file_cache(self):
+        cached = get(self.create_handler(httpd.FileCache()), '/page.html', ACCEPT_GZIP)
+        not_cached = get(self.create_handler(), '/page.html', ACCEPT_GZIP)
+        for response in (cached, not_cached):
+            self.assertEqual(response['code'], httpd.OK)
+            self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(cached['headers']['ETag'], not_cached['headers']['ETag'])
+        self.assertEqual(cached['headers']['ETag'], httpd.gzip_etag(httpd.make_etag(os.stat(self.file))))
+
+    def test_etag_of_evicted_entry_is_not_modified(self):
+        file_cache = httpd.FileCache()
+        etag = get(self.create_handler(file_cache), '/page.html', ACCEPT_GZIP)['headers']['ETag']
+        file_cache.remove('/page.html')
+        response = get(self.create_handler(), '/page.html',
+                       ACCEPT_GZIP + 'If-None-Match: {}\r\n'.format(etag))
+        self.assertEqual(response['code'], httpd.NOT_MODIFIED)
+
+    def test_older_gz_file_is_ignored(self):
+        stat = os.stat(self.file)
+        os.utime(self.file + '.gz', (stat.st_atime, stat.st_mtime - 10))
+        self.assertEqual(httpd.find_precompressed(self.file, stat.st_mtime), (None, None))
+        response = get(self.create_handler(), '/page.html', ACCEPT_GZIP)
+        self.assertNotIn('Content-Encoding', response['headers'])
+        self.assertEqual(response['file'], self.file)
+
+    def test_not_cached_file_without_gz_file_isnt_compressed(self):
+        os.remove(self.file + '.gz')
+        response = get(self.create_handler(), '/page.html', ACCEPT_GZIP)
+        self.assertNotIn('Content-Encoding', response['headers'])
+        self.assertEqual(response['headers']['Vary'], 'Accept-Encoding')
+
+    def test_cached_file_is_compressed_on_the_fly(self):
+        os.remove(self.file + '.gz')
+        response = get(self.create_handler(httpd.FileCache()), '/page.html', ACCEPT_GZIP)
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(zlib.decompress(response['body'], 16 + zlib.MAX_WBITS), TEXT)
+        self.assertEqual(response['headers']['Content-Length'], len(response['body']))
+
+    def test_gzip_is_disabled(self):
+        handler = self.create_handler()
+        handler.use_gzip = False
+        response = get(handler, '/page.html', ACCEPT_GZIP)
+        self.assertNotIn('Content-Encoding', response['headers'])
+
+    def test_identity_and_gzip_etags_differ(self):
+        handler = self.create_handler()
+        identity = get(handler, '/page.html')
+        gzipped = get(handler, '/page.html', ACCEPT_GZIP)
+        self.assertNotIn('Content-Encoding', identity['headers'])
+        self.assertNotEqual(identity['headers']['ETag'], gzipped['headers']['ETag'])
+
+
+if __name__ == '__main__':
+    unittest.main()
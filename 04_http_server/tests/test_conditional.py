@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from context import httpd
+from utils import get
+
+
+ETAG = '"1-2-3"'
+MTIME = 784111777.5
+
+
+class TestHttpDate(unittest.TestCase):
+    def test_format_and_parse(self):
+        self.assertEqual(httpd.format_http_date(784111777), 'Sun, 06 Nov 1994 08:49:37 GMT')
+        self.assertEqual(httpd.parse_http_date('Sun, 06 Nov 1994 08:49:37 GMT'), 784111777)
+
+    def test_invalid_date(self):
+        for value in ('', 'yesterday', 'Sun, 06 Nov'):
+            self.assertIsNone(httpd.parse_http_date(value), value)
+
+
+class TestIsNotModified(unittest.TestCase):
+    def assertNotModified(self, cases):
+        for headers, expected in cases:
+            self.assertEqual(httpd.is_not_modified(headers, ETAG, MTIME), expected, headers)
+
+    def test_if_none_match(self):
+        self.assertNotModified([
+            ({'if-none-match': ETAG}, True),
+            ({'if-none-match': '"0-0-0", ' + ETAG}, True),
+            ({'if-none-match': 'W/' + ETAG}, True),
+            ({'if-none-match': '*'}, True),
+            ({'if-none-match': '"0-0-0"'}, False),
+            ({'if-none-match': ETAG[1:-1]}, False),
+        ])
+
+    def test_if_modified_since(self):
+        self.assertNotModified([
+            ({'if-modified-since': 'Sun, 06 Nov 1994 08:49:37 GMT'}, True),
+            ({'if-modified-since': 'Mon, 07 Nov 1994 08:49:37 GMT'}, True),
+            ({'if-modified-since': 'Sun, 06 Nov 1994 08:49:36 GMT'}, False),
+            ({'if-modified-since': 'invalid'}, False),
+            ({}, False),
+        ])
+
+    def test_if_none_match_has_priority(self):
+        self.assertNotModified([
+            ({'if-none-match': '"0-0-0"', 'if-modified-since': 'Mon, 07 Nov 1994 08:49:37 GMT'}, False),
+        ])
+
+
+class TestConditionalResponses(unittest.TestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.root_dir, 'image.png')
+        with open(self.file, 'wb') as f:
+            f.write(b'x' * 10)
+        self.handler = httpd.RequestHandler(None, ('127.0.0.1', 0), self.root_dir, cache_control={})
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def test_validators(self):
+        stat = os.stat(self.file)
+        response = get(self.handler, '/image.png')
+        self.assertEqual(response['code'], httpd.OK)
+        self.assertEqual(response['headers']['ETag'], httpd.make_etag(stat))
+        self.assertEqual(response['headers']['Last-Modified'], httpd.format_http_date(stat.st_mtime))
+
+    def test_not_modified(self):
+        headers = get(self.handler, '/image.png')['headers']
+        for condition in ('If-None-Match: ' + headers['ETag'], 'If-Modified-Since: ' + headers['Last-Modified']):
+            response = get(self.handler, '/image.png', condition + '\r\n')
+            self.assertEqual(response['code'], httpd.NOT_MODIFIED)
+            self.assertEqual(response['headers']['ETag'], headers['ETag'])
+            self.assertNotIn('Content-Length', response['headers'])
+            self.assertNotIn('Content-Type', response['headers'])
+
+    def test_changed_file_is_sent(self):
+        etag = get(self.handler, '/image.png')['headers']['ETag']
+        with open(self.file, 'ab') as f:
+            f.write(b'y')
+        response = get(self.handler, '/image.png', 'If-None-Match: {}\r\n'.format(etag))
+        self.assertEqual(response['code'], httpd.OK)
+        self.assertEqual(response['headers']['Content-Length'], 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import select
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from context import httpd
+from utils import start_server, stop_server, wait_for
+
+
+class TestEpollRequestHandler(unittest.TestCase):
+    def setUp(self):
+        self.conn, self.client = socket.socketpair()
+        self.conn.setblocking(0)
+        self.handler = httpd.EpollRequestHandler(self.conn, ('127.0.0.1', 0), '/', read_timeout=1, idle_timeout=5)
+        self.handler.last_activity = 100
+
+    def tearDown(self):
+        self.handler.shutdown()
+        self.client.close()
+
+    def test_new_connection_waits_for_read_timeout(self):
+        self.assertTrue(self.handler.is_idle())
+        self.assertFalse(self.handler.is_expired(100.5))
+        self.assertTrue(self.handler.is_expired(101.5))
+
+    def test_keep_alive_connection_waits_for_idle_timeout(self):
+        self.handler.requests_count = 1
+        self.assertFalse(self.handler.is_expired(103))
+        self.assertTrue(self.handler.is_expired(106))
+
+    def test_slow_request_expires_after_read_timeout(self):
+        self.client.sendall(b'GET / HTTP/1.1\r\n')
+        self.assertEqual(self.handler.handle_event(), select.EPOLLIN)
+        self.assertFalse(self.handler.is_idle())
+        started = self.handler.request_started
+        # activity of client doesn't prolong reading of request
+        self.handler.last_activity = started + 1
+        self.assertTrue(self.handler.is_expired(started + 1.5))
+
+    def test_closed_connection(self):
+        self.client.close()
+        self.assertIsNone(self.handler.handle_event())
+
+
+class TestEpollHTTPServer(unittest.TestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.server, self.thread = start_server('epoll', self.root_dir, read_timeout=0.2)
+
+    def tearDown(self):
+        stop_server(self.server, self.thread)
+        shutil.rmtree(self.root_dir)
+
+    def test_silent_connection_is_closed(self):
+        sock = socket.create_connection(self.server.sock.getsockname(), timeout=5)
+        start = time.time()
+        self.assertEqual(sock.recv(1024), b'')
+        self.assertLess(time.time() - start, httpd.POLL_TIMEOUT + 1)
+        sock.close()
+        self.assertTrue(wait_for(lambda: self.server.stats()['timeouts']))
+        stats = self.server.stats()
+        self.assertEqual((stats['accepted'], stats['timeouts'], stats['connections']), (1, 1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
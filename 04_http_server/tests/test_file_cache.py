@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from context import httpd
+
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.cache = httpd.FileCache(max_size=1000, max_file_size=100, gzip_min_size=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def create_file(self, name, size):
+        path = os.path.join(self.root_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def add(self, name, size, mimetype='image/png'):
+        path = self.create_file(name, size)
+        return self.cache.add(name, path, mimetype, os.stat(path))
+
+    def test_small_file_is_cached(self):
+        self.assertIsNone(self.cache.get('small.png'))
+        entry = self.add('small.png', 100)
+        self.assertEqual(entry.body, b'x' * 100)
+        self.assertIs(self.cache.get('small.png'), entry)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['bypasses']), (1, 1, 0))
+        self.assertEqual(stats['size'], 100)
+
+    def test_large_file_is_bypassed_without_open(self):
+        stat = os.stat(self.create_file('large.png', 101))
+        # file isn't opened, its stat is checked only
+        self.assertIsNone(self.cache.add('large.png', os.path.join(self.root_dir, 'missing.png'), 'image/png', stat))
+        self.assertIsNone(self.cache.get('large.png'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['bypasses']), (0, 0, 1))
+        self.assertEqual(stats['hit_rate'], 0.0)
+        self.assertEqual(stats['entries'], 0)
+
+    def test_least_recently_used_files_are_evicted(self):
+        for i in range(10):
+            self.add('file{}.png'.format(i), 100)
+        self.assertEqual(self.cache.stats()['size'], 1000)
+        self.assertIsNotNone(self.cache.get('file0.png'))
+        self.add('file10.png', 100)
+        self.assertIsNone(self.cache.get('file1.png'))
+        self.assertIsNotNone(self.cache.get('file0.png'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['entries'], stats['size'], stats['evictions']), (10, 1000, 1))
+
+    def test_max_file_size_is_limited_by_cache_size(self):
+        cache = httpd.FileCache(max_size=50, max_file_size=100)
+        self.assertEqual(cache.max_file_size, 50)
+
+    def test_gzip_body_is_counted_in_size(self):
+        entry = self.add('page.html', 100, mimetype='text/html')
+        gzip_body = self.cache.get_gzip_body(entry)
+        self.assertTrue(0 < len(gzip_body) < 100)
+        self.assertEqual(self.cache.stats()['size'], 100 + len(gzip_body))
+        # body is compressed once
+        self.assertIs(self.cache.get_gzip_body(entry), gzip_body)
+        self.assertEqual(self.cache.stats()['compressions'], 1)
+
+    def test_small_file_isnt_compressed(self):
+        entry = self.add('small.html', 9, mimetype='text/html')
+        self.assertEqual(self.cache.get_gzip_body(entry), b'')
+        self.assertEqual(self.cache.stats()['size'], 9)
+
+    def test_sibling_gz_file_is_cached(self):
+        path = self.create_file('page.css', 50)
+        # .gz file isn't older than file
+        self.create_file('page.css.gz', 20)
+        entry = self.cache.add('page.css', path, 'text/css', os.stat(path))
+        self.assertEqual(entry.gzip_body, b'x' * 20)
+        self.assertEqual(entry.memory, 70)
+
+    def test_changed_file_is_invalidated(self):
+        self.add('small.png', 10)
+        self.create_file('small.png', 20)
+        self.assertIsNone(self.cache.get('small.png'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['invalidations'], stats['entries'], stats['size']), (1, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import unittest
+from collections import deque
+from StringIO import StringIO
+
+from context import httpd
+from utils import wait_for
+
+
+class TestQueueHandler(unittest.TestCase):
+    def test_records_are_dropped_if_queue_is_full(self):
+        queue = deque()
+        handler = httpd.QueueHandler(queue, max_size=2)
+        for i in range(3):
+            handler.handle(logging.makeLogRecord({'msg': str(i)}))
+        self.assertEqual([record.msg for record in queue], ['0', '1'])
+        self.assertEqual(handler.dropped, 1)
+
+
+class TestLogWriter(unittest.TestCase):
+    def setUp(self):
+        # logging is disabled by context of tests
+        logging.disable(logging.NOTSET)
+        self.logger = logging.getLogger('test_log_writer')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.stream = StringIO()
+        self.handler = logging.StreamHandler(self.stream)
+        self.handler.setFormatter(logging.Formatter('%(levelname).1s %(message)s'))
+        self.logger.addHandler(self.handler)
+        self.writer = httpd.LogWriter(self.logger, flush_interval=0.01)
+
+    def tearDown(self):
+        if self.writer.thread and self.writer.thread.is_alive():
+            self.writer.stop()
+        self.logger.removeHandler(self.handler)
+        logging.disable(logging.ERROR)
+
+    def test_records_are_written_by_writer(self):
+        self.writer.start()
+        self.assertEqual(self.logger.handlers, [self.writer.queue_handler])
+        for i in range(3):
+            self.logger.info('request %s', i)
+        self.assertTrue(wait_for(lambda: self.writer.written == 3))
+        self.assertEqual(self.stream.getvalue(), 'I request 0\nI request 1\nI request 2\n')
+        stats = self.writer.stats()
+        self.assertEqual((stats['queued'], stats['written'], stats['dropped']), (0, 3, 0))
+        self.assertGreaterEqual(stats['batches'], 1)
+
+    def test_stop_writes_queued_records_and_restores_handlers(self):
+        self.writer.start()
+        self.logger.info('queued')
+        self.writer.stop()
+        self.assertEqual(self.logger.handlers, [self.handler])
+        self.assertEqual(self.stream.getvalue(), 'I queued\n')
+
+    def test_level_of_handler(self):
+        self.handler.setLevel(logging.WARNING)
+        self.writer.write([logging.makeLogRecord({'msg': 'info', 'levelno': logging.INFO, 'levelname': 'INFO'}),
+                           logging.makeLogRecord({'msg': 'error', 'levelno': logging.ERROR, 'levelname': 'ERROR'})])
+        self.assertEqual(self.stream.getvalue(), 'E error\n')
+        self.assertEqual((self.writer.written, self.writer.batches), (2, 1))
+
+    def test_not_stream_handlers(self):
+        records = []
+
+        class ListHandler(logging.Handler):
+            def emit(self, record):
+                records.append(record.getMessage())
+
+        self.logger.addHandler(ListHandler())
+        self.writer = httpd.LogWriter(self.logger)
+        self.writer.write([logging.makeLogRecord({'msg': 'message', 'levelno': logging.INFO})])
+        self.assertEqual(records, ['message'])
+        self.logger.handlers = [self.handler]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from context import httpd
+from utils import request
+
+
+def create_root(body):
+    root_dir = tempfile.mkdtemp()
+    with open(os.path.join(root_dir, 'page.html'), 'wb') as f:
+        f.write(body)
+    return root_dir
+
+
+class TestMaster(unittest.TestCase):
+    """Workers of master are started and reloaded without its signal loop"""
+    def setUp(self):
+        self.roots = [create_root(b'first'), create_root(b'second')]
+        self.config = dict(httpd.CONFIG, BIND_HOST='127.0.0.1', BIND_PORT=0, WORKERS=2, MODE='threaded',
+                           DOCUMENT_ROOT=self.roots[0], GRACEFUL_TIMEOUT=1)
+        self.reloaded = dict(self.config, DOCUMENT_ROOT=self.roots[1], WORKERS=1, BIND_PORT=1)
+        self.master = httpd.Master(self.config, reload_config=lambda: dict(self.reloaded))
+        self.address = self.master.sock.getsockname()
+        self.master.workers = [self.master.start_worker() for _ in range(self.config['WORKERS'])]
+
+    def tearDown(self):
+        self.master.stop_workers(self.master.workers + self.master.retired)
+        self.master.sock.close()
+        for root_dir in self.roots:
+            shutil.rmtree(root_dir)
+
+    def get_body(self):
+        response = request(self.address, 'GET /page.html HTTP/1.1\r\n\r\n')
+        self.assertTrue(response.startswith('HTTP/1.1 200 '), response)
+        return response.split('\r\n\r\n', 1)[1]
+
+    def test_workers_share_socket(self):
+        self.assertEqual(len(self.master.workers), 2)
+        self.assertTrue(all(process.is_alive() for process in self.master.workers))
+        self.assertEqual(self.get_body(), 'first')
+
+    def test_reload(self):
+        old_workers = list(self.master.workers)
+        self.master.handle_reload(None, None)
+        self.assertTrue(self.master.reloading)
+        self.master.reload()
+        self.assertFalse(self.master.reloading)
+        self.assertEqual(len(self.master.workers), 1)
+        self.assertEqual(self.master.retired, old_workers)
+        # old workers finish their connections and exit
+        for process in old_workers:
+            process.join(5)
+            self.assertFalse(process.is_alive())
+        self.assertEqual(self.get_body(), 'second')
+        self.master.check_workers()
+        self.assertEqual(self.master.retired, [])
+        # listening address is changed by restart only
+        self.assertEqual(self.master.config['BIND_PORT'], 0)
+        self.assertEqual(self.master.config['DOCUMENT_ROOT'], self.roots[1])
+
+    def test_invalid_config_isnt_reloaded(self):
+        def reload_config():
+            raise ValueError('invalid config')
+        self.master.reload_config = reload_config
+        workers = list(self.master.workers)
+        self.master.reload()
+        self.assertEqual(self.master.workers, workers)
+        self.assertEqual(self.master.retired, [])
+        self.assertEqual(self.master.config['DOCUMENT_ROOT'], self.roots[0])
+
+    def test_exited_worker_is_restarted(self):
+        process = self.master.workers[0]
+        process.terminate()
+        process.join(5)
+        self.master.check_workers()
+        self.assertIsNot(self.master.workers[0], process)
+        self.assertTrue(self.master.workers[0].is_alive())
+        self.assertEqual(self.get_body(), 'first')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from context import httpd
+
+
+SIZE = 1000
+
+
+class TestParseRange(unittest.TestCase):
+    def assertRanges(self, cases):
+        for value, expected in cases:
+            self.assertEqual(httpd.parse_range(value, SIZE), expected, value)
+
+    def test_single_range(self):
+        self.assertRanges([
+            ('bytes=0-0', [(0, 0)]),
+            ('bytes=0-499', [(0, 499)]),
+            ('bytes=500-', [(500, 999)]),
+            ('bytes=900-5000', [(900, 999)]),
+            ('BYTES = 10-20', [(10, 20)]),
+            (' bytes=10-20', [(10, 20)]),
+        ])
+
+    def test_suffix_range(self):
+        self.assertRanges([
+            ('bytes=-100', [(900, 999)]),
+            ('bytes=-5000', [(0, 999)]),
+            ('bytes=-0', []),
+        ])
+        self.assertEqual(httpd.parse_range('bytes=-100', 0), [])
+
+    def test_multiple_ranges(self):
+        self.assertRanges([
+            ('bytes=0-9, 20-29,-10', [(0, 9), (20, 29), (990, 999)]),
+            ('bytes=0-9,2000-3000', [(0, 9)]),
+            ('bytes=0-9,x-5', None),
+        ])
+
+    def test_not_satisfiable(self):
+        self.assertRanges([
+            ('bytes=1000-', []),
+            ('bytes=1000-2000', []),
+            ('bytes=5000-6000,1000-', []),
+        ])
+
+    def test_malformed(self):
+        self.assertRanges([
+            ('bytes=abc-5', None),
+            ('bytes=1x-5', None),
+            ('bytes=5-1x', None),
+            ('bytes=-abc', None),
+            ('bytes=-', None),
+            ('bytes=5', None),
+            ('bytes=', None),
+            ('bytes=1-2-3', None),
+            ('bytes=+1-5', None),
+            ('items=0-5', None),
+            ('0-5', None),
+        ])
+
+    def test_reversed(self):
+        self.assertRanges([
+            ('bytes=10-5', None),
+            ('bytes=0-5,10-5', None),
+        ])
+
+    def test_too_many_ranges(self):
+        ranges = ','.join('{}-{}'.format(i * 10, i * 10 + 1) for i in range(httpd.MAX_RANGES))
+        self.assertEqual(len(httpd.parse_range('bytes=' + ranges, SIZE)), httpd.MAX_RANGES)
+        self.assertIsNone(httpd.parse_range('bytes=' + ranges + ',500-501', SIZE))
+
+
+if __name__ == "__main__":
+    unittest.main()
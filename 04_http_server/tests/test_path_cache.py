@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from context import httpd
+
+
+RESOLVED = ('/index.html', httpd.OK, '/root/index.html', 'text/html')
+
+
+class TestPathCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = httpd.PathCache(max_entries=3, ttl=1)
+
+    def test_entry_is_valid_for_ttl(self):
+        self.assertIsNone(self.cache.get('/root', '/', now=100))
+        self.cache.add('/root', '/', RESOLVED, now=100)
+        self.assertEqual(self.cache.get('/root', '/', now=101), RESOLVED)
+        self.assertIsNone(self.cache.get('/root', '/', now=101.5))
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 2, 'entries': 0})
+
+    def test_least_recently_used_entries_are_evicted(self):
+        for target in ('/a', '/b', '/c'):
+            self.cache.add('/root', target, RESOLVED, now=100)
+        self.assertEqual(self.cache.get('/root', '/a', now=100), RESOLVED)
+        self.cache.add('/root', '/d', RESOLVED, now=100)
+        self.assertIsNone(self.cache.get('/root', '/b', now=100))
+        self.assertEqual(list(self.cache.entries), ['/c', '/a', '/d'])
+
+    def test_entries_are_dropped_with_change_of_root(self):
+        self.cache.add('/root', '/', RESOLVED, now=100)
+        self.assertIsNone(self.cache.get('/other', '/', now=100))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_remove(self):
+        self.cache.add('/root', '/', RESOLVED, now=100)
+        self.cache.remove('/')
+        self.cache.remove('/missing')
+        self.assertIsNone(self.cache.get('/root', '/', now=100))
+
+
+class TestResolvePath(unittest.TestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root_dir, 'dir'))
+        for name in ('dir/index.html', 'data.unknown'):
+            with open(os.path.join(self.root_dir, name), 'wb') as f:
+                f.write(b'data')
+        self.handler = httpd.RequestHandler(None, ('127.0.0.1', 0), self.root_dir, cache_control={},
+                                            path_cache=httpd.PathCache())
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def test_resolved_targets(self):
+        url, code, file, mimetype = self.handler.resolve_path('/dir/?query=1')
+        self.assertEqual((url, code, mimetype), ('/dir', httpd.OK, 'text/html'))
+        self.assertEqual(file, os.path.join(self.root_dir, 'dir', 'index.html'))
+        self.assertEqual(self.handler.resolve_path('/missing.html')[1], httpd.NOT_FOUND)
+        # unknown MIME type isn't served
+        self.assertEqual(self.handler.resolve_path('/data.unknown')[1], httpd.FORBIDDEN)
+
+    def test_resolution_is_cached(self):
+        resolved = self.handler.resolve_path('/dir/')
+        os.remove(os.path.join(self.root_dir, 'dir', 'index.html'))
+        self.assertEqual(self.handler.resolve_path('/dir/'), resolved)
+        self.assertEqual(self.handler.path_cache.stats()['hits'], 1)
+
+    def test_removed_file_is_not_found(self):
+        self.handler.resolve_path('/dir/')
+        os.remove(os.path.join(self.root_dir, 'dir', 'index.html'))
+        response = self.handler.process_request({'method': 'GET', 'url': '/dir/', 'version': 'HTTP/1.1',
+                                                 'headers': {}})
+        self.assertEqual(response['code'], httpd.NOT_FOUND)
+        # resolution is dropped from cache
+        self.assertEqual(self.handler.path_cache.stats()['entries'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import select
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from context import httpd
+from utils import read_all, start_server, stop_server
+
+
+COUNT = 2000
+REQUEST = 'HEAD /index.html HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n\r\n'
+LAST_REQUEST = 'HEAD /index.html HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'
+
+
+class PipeliningMixin(object):
+    mode = None
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.root_dir, 'index.html'), 'wb') as f:
+            f.write(b'<html></html>')
+        self.server, self.thread = start_server(self.mode, self.root_dir)
+        self.address = self.server.sock.getsockname()
+
+    def tearDown(self):
+        stop_server(self.server, self.thread)
+        shutil.rmtree(self.root_dir)
+
+    def test_many_pipelined_requests(self):
+        sock = socket.create_connection(self.address, timeout=5)
+        # responses are read while requests are sent, so buffers of both sides aren't filled
+        sender = threading.Thread(target=sock.sendall, args=(REQUEST * (COUNT - 1) + LAST_REQUEST,))
+        sender.start()
+        try:
+            response = read_all(sock)
+        finally:
+            sender.join()
+            sock.close()
+        self.assertEqual(response.count('HTTP/1.1 200 OK\r\n'), COUNT)
+
+    def test_pipelined_requests_in_one_packet(self):
+        sock = socket.create_connection(self.address, timeout=5)
+        sock.sendall(REQUEST * 10 + LAST_REQUEST)
+        response = read_all(sock)
+        sock.close()
+        self.assertEqual(response.count('HTTP/1.1 200 OK\r\n'), 11)
+
+
+class TestThreadedPipelining(PipeliningMixin, unittest.TestCase):
+    mode = 'threaded'
+
+
+class TestEpollPipelining(PipeliningMixin, unittest.TestCase):
+    mode = 'epoll'
+
+    def test_requests_received_at_once(self):
+        # requests are served one by one from buffer of parser, stack doesn't grow with their count
+        conn, client = socket.socketpair()
+        conn.setblocking(0)
+        handler = httpd.EpollRequestHandler(conn, ('127.0.0.1', 0), self.root_dir)
+        handler.parser.feed(REQUEST * (COUNT - 1) + LAST_REQUEST)
+        responses = []
+        reader = threading.Thread(target=lambda: responses.append(read_all(client)))
+        reader.start()
+        try:
+            events = handler.process_buffer()
+            while events == select.EPOLLOUT:
+                select.select([], [conn], [], 5)
+                events = handler.write()
+            self.assertIsNone(events)
+        finally:
+            handler.shutdown()
+            reader.join()
+            client.close()
+        self.assertEqual(responses[0].count('HTTP/1.1 200 OK\r\n'), COUNT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from context import httpd
+from utils import request, start_server, stop_server
+
+
+REQUEST = 'GET /index.html HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n\r\n'
+
+
+class TestRequestParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = httpd.RequestParser()
+
+    def test_request(self):
+        self.parser.feed(REQUEST)
+        raw_data, request = self.parser.next_request()
+        self.assertEqual(raw_data, REQUEST)
+        self.assertEqual(request, {
+            'method': 'GET',
+            'url': '/index.html',
+            'version': 'HTTP/1.1',
+            'headers': {'host': 'localhost', 'connection': 'keep-alive'},
+        })
+        self.assertFalse(self.parser.has_data())
+        self.assertIsNone(self.parser.next_request())
+
+    def test_request_is_received_by_parts(self):
+        for char in REQUEST[:-1]:
+            self.parser.feed(char)
+            self.assertIsNone(self.parser.next_request())
+        self.parser.feed(REQUEST[-1])
+        self.assertEqual(self.parser.next_request()[0], REQUEST)
+
+    def test_pipelined_requests(self):
+        second = REQUEST.replace('/index.html', '/second.html')
+        self.parser.feed(REQUEST + second + second[:10])
+        self.assertEqual(self.parser.next_request()[1]['url'], '/index.html')
+        self.assertEqual(self.parser.next_request()[1]['url'], '/second.html')
+        self.assertIsNone(self.parser.next_request())
+        self.assertTrue(self.parser.has_data())
+        self.parser.feed(second[10:])
+        self.assertEqual(self.parser.next_request()[1]['url'], '/second.html')
+
+    def test_body_is_skipped(self):
+        post = 'POST / HTTP/1.1\r\nContent-Length: 10\r\n\r\n'
+        self.parser.feed(post + '12345')
+        self.assertEqual(self.parser.next_request()[1]['method'], 'POST')
+        self.assertFalse(self.parser.has_data())
+        self.parser.feed('67890' + REQUEST)
+        self.assertEqual(self.parser.next_request()[0], REQUEST)
+
+    def test_empty_lines_before_request_are_ignored(self):
+        self.parser.feed('\r\n\r\n' + REQUEST)
+        self.assertEqual(self.parser.next_request()[0], REQUEST)
+
+    def test_malformed_requests(self):
+        for data in [
+            'GET /\r\n\r\n',
+            'GET / FTP/1.0\r\n\r\n',
+            'GET / HTTP/1.1 extra\r\n\r\n',
+            'GET / HTTP/1.1\r\nNo colon\r\n\r\n',
+            'GET / HTTP/1.1\r\n: value\r\n\r\n',
+            'GET / HTTP/1.1\r\nHost : localhost\r\n\r\n',
+            'GET / HTTP/1.1\r\nHost: localhost\r\n folded\r\n\r\n',
+            'POST / HTTP/1.1\r\nContent-Length: -1\r\n\r\n',
+            'POST / HTTP/1.1\r\nContent-Length: 1x\r\n\r\n',
+        ]:
+            parser = httpd.RequestParser()
+            parser.feed(data)
+            self.assertRaises(httpd.BadRequest, parser.next_request)
+
+    def test_too_large_requests(self):
+        for data in [
+            'GET /{} HTTP/1.1\r\n\r\n'.format('a' * httpd.MAX_REQUEST_LINE_SIZE),
+            'GET / HTTP/1.1\r\n' + 'Header: value\r\n' * (httpd.MAX_HEADERS_COUNT + 1) + '\r\n',
+        ]:
+            parser = httpd.RequestParser()
+            parser.feed(data)
+            self.assertRaises(httpd.BadRequest, parser.next_request)
+
+    def test_too_large_headers_without_end(self):
+        parser = httpd.RequestParser(max_headers_size=100)
+        parser.feed('GET / HTTP/1.1\r\n' + 'a' * 50)
+        self.assertIsNone(parser.next_request())
+        parser.feed('a' * 50)
+        self.assertRaises(httpd.BadRequest, parser.next_request)
+
+
+class BadRequestMixin(object):
+    mode = None
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.root_dir, 'index.html'), 'wb') as f:
+            f.write(b'<html></html>')
+        self.server, self.thread = start_server(self.mode, self.root_dir)
+        self.address = self.server.sock.getsockname()
+
+    def tearDown(self):
+        stop_server(self.server, self.thread)
+        shutil.rmtree(self.root_dir)
+
+    def test_malformed_request(self):
+        response = request(self.address, 'GET / HTTP/1.1\r\nNo colon\r\n\r\n')
+        self.assertTrue(response.startswith('HTTP/1.1 400 '), response)
+
+    def test_malformed_pipelined_request(self):
+        # connection is closed after the first bad request
+        response = request(self.address, REQUEST + 'GARBAGE\r\n\r\n' + REQUEST)
+        self.assertEqual(response.count('HTTP/1.1 '), 2)
+        self.assertTrue(response.startswith('HTTP/1.1 200 '), response)
+        self.assertIn('HTTP/1.1 400 ', response)
+
+
+class TestThreadedBadRequest(BadRequestMixin, unittest.TestCase):
+    mode = 'threaded'
+
+
+class TestEpollBadRequest(BadRequestMixin, unittest.TestCase):
+    mode = 'epoll'
+
+
+if __name__ == '__main__':
+    unittest.main()
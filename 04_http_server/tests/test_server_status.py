@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from context import httpd
+from utils import request, start_server, stop_server
+
+
+class TestServerStatus(unittest.TestCase):
+    def test_responses_are_counted(self):
+        status = httpd.ServerStatus()
+        status.count(200, '/index.html')
+        status.count(200, '/index.html')
+        status.count(404, '/missing')
+        status.count(400)
+        report = status.report()
+        self.assertEqual(report['statuses'], {200: 2, 404: 1, 400: 1})
+        self.assertEqual(report['paths'], {'/index.html': 2, '/missing': 1})
+        self.assertEqual(report['pid'], os.getpid())
+        self.assertGreaterEqual(report['uptime'], 0)
+        self.assertNotIn('server', report)
+        self.assertNotIn('log', report)
+
+    def test_other_paths_are_counted_together(self):
+        status = httpd.ServerStatus(max_paths=2)
+        for path in ['/a', '/b', '/c', '/a', '/d']:
+            status.count(200, path)
+        self.assertEqual(status.report()['paths'], {'/a': 2, '/b': 1, httpd.STATUS_OTHER_PATHS: 2})
+
+    def test_stats_of_server_and_log_writer(self):
+        log_writer = httpd.LogWriter()
+        status = httpd.ServerStatus(lambda: {'connections': 1}, log_writer)
+        report = status.report()
+        self.assertEqual(report['server'], {'connections': 1})
+        self.assertEqual(report['log'], log_writer.stats())
+
+
+class TestServerStatusResponse(object):
+    mode = None
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.root_dir, 'index.html'), 'wb') as f:
+            f.write(b'<html></html>')
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def get_status(self, server):
+        response = request(server.sock.getsockname(), b'GET /server-status HTTP/1.1\r\n\r\n')
+        headers, body = response.split(b'\r\n\r\n', 1)
+        return headers + b'\r\n', json.loads(body)
+
+    def test_status_is_json(self):
+        server, thread = start_server(self.mode, self.root_dir)
+        try:
+            request(server.sock.getsockname(), b'GET /index.html HTTP/1.1\r\n\r\n')
+            request(server.sock.getsockname(), b'GET /missing.html HTTP/1.1\r\n\r\n')
+            headers, report = self.get_status(server)
+        finally:
+            stop_server(server, thread)
+        self.assertTrue(headers.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertIn(b'Content-Type: application/json\r\n', headers)
+        self.assertIn(b'Cache-Control: no-cache\r\n', headers)
+        # status request itself is counted after its report is made
+        self.assertEqual(report['statuses'], {'200': 1, '404': 1})
+        self.assertEqual(report['paths'], {'/index.html': 1, '/missing.html': 1})
+        self.assertIn('server', report)
+
+    def test_status_is_disabled(self):
+        server, thread = start_server(self.mode, self.root_dir, server_status=False)
+        try:
+            response = request(server.sock.getsockname(), b'GET /server-status HTTP/1.1\r\n\r\n')
+        finally:
+            stop_server(server, thread)
+        self.assertTrue(response.startswith(b'HTTP/1.1 404 '))
+
+
+class TestThreadedServerStatusResponse(TestServerStatusResponse, unittest.TestCase):
+    mode = 'threaded'
+
+
+class TestEpollServerStatusResponse(TestServerStatusResponse, unittest.TestCase):
+    mode = 'epoll'
+
+
+if __name__ == '__main__':
+    unittest.main()
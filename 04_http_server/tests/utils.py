@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import socket
+import threading
+import time
+
+from context import httpd
+
+
+def start_server(mode, root_dir, **kwargs):
+    """Server of serving mode on free port in thread of test process"""
+    server_class, handler_class = httpd.SERVING_MODES[mode]
+    kwargs.setdefault('graceful_timeout', 1)
+    server = server_class('127.0.0.1', 0, root_dir, handler_class, **kwargs)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, thread
+
+
+def stop_server(server, thread):
+    server.stop()
+    thread.join()
+
+
+def read_all(sock):
+    chunks = []
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            return b''.join(chunks)
+        chunks.append(data)
+
+
+def request(address, data):
+    """Send raw request and return raw response, connection is closed by server"""
+    sock = socket.create_connection(address, timeout=5)
+    try:
+        sock.sendall(data)
+        return read_all(sock)
+    finally:
+        sock.close()
+
+
+def parse_request(data):
+    parser = httpd.RequestParser()
+    parser.feed(data)
+    return parser.next_request()[1]
+
+
+def get(handler, url, headers=''):
+    """Response of handler for GET request of url (headers are raw lines)"""
+    return handler.process_request(parse_request('GET {} HTTP/1.1\r\n{}\r\n'.format(url, headers)))
+
+
+def wait_for(condition, timeout=5):
+    """Wait until condition() is true (changes of other threads or processes)"""
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True